@@ -0,0 +1,66 @@
+import contextlib
+import io
+import os
+from typing import Dict, List, NamedTuple
+
+from scripts.dataset import generate_fake_dataset
+
+
+class DatasetShape(NamedTuple):
+    """
+    The shape of a generated benchmark dataset.
+
+    Attributes:
+        num_files (int): Number of input files.
+        lines_per_file (int): Number of lines of each file.
+        line_length (int): Length of the words in characters.
+        vocabulary (int): Number of distinct words the lines are drawn from, 0 for random words
+            that are almost never repeated.
+    """
+    num_files: int
+    lines_per_file: int
+    line_length: int
+    vocabulary: int = 0
+
+
+SHAPES: Dict[str, DatasetShape] = {
+    "many-tiny-files": DatasetShape(num_files=2000, lines_per_file=50, line_length=12),
+    "few-huge-files": DatasetShape(num_files=4, lines_per_file=250_000, line_length=12),
+    "high-duplication": DatasetShape(num_files=50, lines_per_file=20_000, line_length=12,
+                                     vocabulary=1000),
+    "long-lines": DatasetShape(num_files=50, lines_per_file=2000, line_length=500),
+}
+
+
+def scale_shape(shape: DatasetShape, scale: float) -> DatasetShape:
+    """
+    Scales the size of a dataset, keeping the number of files of datasets of many files.
+
+    Args:
+        shape (DatasetShape): The shape at scale 1.
+        scale (float): Factor applied to the number of lines of each file.
+    """
+    return shape._replace(lines_per_file=max(1, int(shape.lines_per_file * scale)))
+
+
+def generate_dataset(shape: DatasetShape, output_dir: str, seed: int = 0) -> List[str]:
+    """
+    Generates the sorted input files of a dataset. The files are only written if the directory
+    does not hold the dataset yet, so repeated runs reuse it.
+
+    Args:
+        shape (DatasetShape): The shape of the dataset.
+        output_dir (str): Directory of the files.
+        seed (int, optional): Seed of the random words. Defaults to 0.
+
+    Returns:
+        List[str]: Paths of the input files.
+    """
+    files = [os.path.join(output_dir, f"file_{i}.dat") for i in range(shape.num_files)]
+    if all(os.path.exists(file) for file in files):
+        return files
+    with contextlib.redirect_stdout(io.StringIO()):
+        return generate_fake_dataset(shape.num_files, shape.lines_per_file, shape.lines_per_file,
+                                     output_dir, shape.line_length, shape.line_length,
+                                     vocabulary_size=shape.vocabulary,
+                                     num_processes=os.cpu_count() or 1, seed=seed)
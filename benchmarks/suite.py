@@ -0,0 +1,269 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from benchmarks.datasets import SHAPES, generate_dataset, scale_shape
+from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+from merge_files.planner import open_file_descriptors
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+MERGERS = {"basic": BasicFileMerger, "async": AsyncFileMerger, "parallel": ParallelFileMerger}
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(PACKAGE_DIR, "benchmarks", "baseline.json")
+# Metrics compared with the baseline, and whether a higher value is better
+METRICS = {"lines_per_s": True, "mb_per_s": True, "peak_rss": False}
+# Number of files merged by a chunk of the async and parallel mergers
+CHUNK_FILES = 64
+FD_SAMPLE_INTERVAL = 0.005
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    Measurements of a merger on a dataset.
+
+    Attributes:
+        shape (str): Name of the dataset shape, a key of `SHAPES`.
+        merger (str): Name of the merger, a key of `MERGERS`.
+        seconds (float): Wall time of the merge.
+        lines (int): Number of input lines.
+        bytes (int): Size of the input files in bytes.
+        lines_per_s (float): Input lines merged per second.
+        mb_per_s (float): Input megabytes merged per second.
+        peak_rss (int, optional): Peak resident memory of the merging process and its worker
+            processes in bytes, None where it cannot be measured.
+        peak_fds (int): Peak number of file descriptors open in the merging process.
+    """
+    shape: str
+    merger: str
+    seconds: float
+    lines: int
+    bytes: int
+    lines_per_s: float
+    mb_per_s: float
+    peak_rss: Optional[int]
+    peak_fds: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.shape}/{self.merger}"
+
+
+def _peak_rss() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run_case(merger: str, input_files: List[str], output_dir: str,
+              num_processes: int) -> Tuple[float, Optional[int], int]:
+    """
+    Runs a single merge and measures its wall time, peak memory and peak file descriptors. It
+    runs in a fresh interpreter, see `run_case`, so that the peak memory is that of this merge
+    only.
+    """
+    options = {}
+    chunk_files = CHUNK_FILES
+    if merger == "basic":
+        chunk_files = len(input_files)
+    elif merger == "parallel":
+        options["num_processes"] = num_processes
+    file_merger = MERGERS[merger](input_files, output_dir, "output.txt", chunk_files,
+                                  **options)
+
+    peak_fds = open_file_descriptors()
+    done = threading.Event()
+
+    def sample_fds() -> None:
+        nonlocal peak_fds
+        while not done.wait(FD_SAMPLE_INTERVAL):
+            peak_fds = max(peak_fds, open_file_descriptors())
+
+    sampler = threading.Thread(target=sample_fds, daemon=True)
+    sampler.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tic = time.perf_counter()
+        file_merger.merge_files()
+        seconds = time.perf_counter() - tic
+    done.set()
+    sampler.join()
+    return seconds, _peak_rss(), peak_fds
+
+
+def run_case(shape: str, merger: str, data_dir: str, scale: float = 1.0,
+             num_processes: Optional[int] = None) -> BenchmarkResult:
+    """
+    Benchmarks a merger on a dataset in a new Python process, generating the dataset if needed.
+
+    Args:
+        shape (str): Name of the dataset shape, a key of `SHAPES`.
+        merger (str): Name of the merger, a key of `MERGERS`.
+        data_dir (str): Directory where the datasets are kept between runs.
+        scale (float, optional): Factor applied to the number of lines of the files.
+            Defaults to 1.
+        num_processes (int, optional): Number of processes of the parallel merger. Defaults
+            to the number of CPUs.
+
+    Returns:
+        BenchmarkResult: The measurements.
+
+    Raises:
+        subprocess.CalledProcessError: If the merge fails.
+    """
+    dataset = scale_shape(SHAPES[shape], scale)
+    input_files = generate_dataset(dataset, os.path.join(data_dir, f"{shape}-{scale:g}"))
+    size = sum(os.path.getsize(file) for file in input_files)
+    lines = dataset.num_files * dataset.lines_per_file
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        case = json.dumps([merger, input_files, output_dir, num_processes or os.cpu_count() or 1])
+        process = subprocess.run([sys.executable, "-m", "benchmarks.suite"], input=case,
+                                 capture_output=True, text=True, cwd=PACKAGE_DIR, check=True)
+    seconds, peak_rss, peak_fds = json.loads(process.stdout)
+    return BenchmarkResult(shape, merger, seconds, lines, size, lines / seconds,
+                           size / seconds / 1e6, peak_rss, peak_fds)
+
+
+def run_benchmarks(shapes: Optional[Sequence[str]] = None,
+                   mergers: Optional[Sequence[str]] = None, scale: float = 1.0,
+                   data_dir: Optional[str] = None, repeat: int = 1,
+                   num_processes: Optional[int] = None) -> List[BenchmarkResult]:
+    """
+    Benchmarks every merger on every dataset shape.
+
+    Args:
+        shapes (Sequence[str], optional): Names of the dataset shapes. Defaults to all of them.
+        mergers (Sequence[str], optional): Names of the mergers. Defaults to all of them.
+        scale (float, optional): Factor applied to the number of lines of the files.
+            Defaults to 1.
+        data_dir (str, optional): Directory where the datasets are kept between runs. Defaults
+            to a directory in the system temporary directory.
+        repeat (int, optional): Number of runs of every case, the fastest one is kept.
+            Defaults to 1.
+        num_processes (int, optional): Number of processes of the parallel merger. Defaults
+            to the number of CPUs.
+
+    Returns:
+        List[BenchmarkResult]: The measurements of every case.
+
+    Raises:
+        ValueError: If a shape or a merger is unknown.
+    """
+    shapes = list(shapes or SHAPES)
+    mergers = list(mergers or MERGERS)
+    for shape in shapes:
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown dataset shape: {shape}. Choose from {list(SHAPES)}")
+    for merger in mergers:
+        if merger not in MERGERS:
+            raise ValueError(f"Unknown merger: {merger}. Choose from {list(MERGERS)}")
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "filemerger-benchmarks")
+
+    results = []
+    for shape in shapes:
+        for merger in mergers:
+            runs = [run_case(shape, merger, data_dir, scale, num_processes)
+                    for _ in range(repeat)]
+            results.append(min(runs, key=lambda result: result.seconds))
+    return results
+
+
+def load_baseline(path: str = BASELINE_FILE) -> Dict[str, dict]:
+    """
+    Loads stored benchmark results, keyed by "<shape>/<merger>".
+
+    Args:
+        path (str, optional): Path of the baseline file. Defaults to `BASELINE_FILE`.
+
+    Returns:
+        Dict[str, dict]: The metrics of every case, empty if there is no baseline yet.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results: List[BenchmarkResult], path: str = BASELINE_FILE) -> None:
+    """
+    Stores benchmark results as the baseline of later runs.
+
+    Args:
+        results (List[BenchmarkResult]): The measurements.
+        path (str, optional): Path of the baseline file. Defaults to `BASELINE_FILE`.
+    """
+    baseline = load_baseline(path)
+    baseline.update({result.key: result._asdict() for result in results})
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def find_regressions(results: List[BenchmarkResult], baseline: Dict[str, dict],
+                     tolerance: float = 0.2) -> List[str]:
+    """
+    Compares benchmark results with a baseline.
+
+    Args:
+        results (List[BenchmarkResult]): The measurements.
+        baseline (Dict[str, dict]): Stored measurements, see `load_baseline`.
+        tolerance (float, optional): Relative change of a metric that is not reported, since
+            timings vary between runs. Defaults to 0.2.
+
+    Returns:
+        List[str]: A description of every metric that is worse than the baseline by more
+        than the tolerance. Cases without a baseline are not compared.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.key)
+        if expected is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value, reference = getattr(result, metric), expected.get(metric)
+            if value is None or not reference:
+                continue
+            change = value / reference - 1
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{result.key}: {metric} {value:,.1f} vs. baseline "
+                                   f"{reference:,.1f} ({change:+.0%})")
+    return regressions
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    """
+    Formats benchmark results as a table.
+
+    Args:
+        results (List[BenchmarkResult]): The measurements.
+    """
+    header = (f"{'dataset':<18} {'merger':<9} {'seconds':>8} {'lines/s':>12} {'MB/s':>8} "
+              f"{'peak RSS MB':>12} {'peak fds':>9}")
+    rows = [header, "-" * len(header)]
+    for result in results:
+        rss = "n/a" if result.peak_rss is None else f"{result.peak_rss / 1e6:.1f}"
+        rows.append(f"{result.shape:<18} {result.merger:<9} {result.seconds:>8.3f} "
+                    f"{result.lines_per_s:>12,.0f} {result.mb_per_s:>8.2f} {rss:>12} "
+                    f"{result.peak_fds:>9}")
+    return "\n".join(rows)
+
+
+if __name__ == "__main__":
+    # Runs the case given on the standard input for `run_case`
+    print(json.dumps(_run_case(*json.loads(sys.stdin.read()))))
@@ -10,7 +10,19 @@ class GenerateFakeDataset(Command):
         ('num-files=', None, 'The number of files to generate.'),
         ('min-words-per-file=', None, 'The minimum number of words per file.'),
         ('max-words-per-file=', None, 'The maximum number of words per file.'),
-        ('output-dir=', None, 'The directory to write the generated files to.')
+        ('output-dir=', None, 'The directory to write the generated files to.'),
+        ('size=', None, 'Approximate total size such as 500M or 200G, instead of the number of '
+                        'words per file.'),
+        ('min-word-length=', None, 'The minimum length of a word. DEFAULT 4'),
+        ('max-word-length=', None, 'The maximum length of a word. DEFAULT 12'),
+        ('vocabulary-size=', None, 'Number of distinct words the files are drawn from. DEFAULT 0 '
+                                   'for random words'),
+        ('zipf=', None, 'Exponent of the Zipf distribution of the vocabulary words. DEFAULT 0 '
+                        'for a uniform distribution'),
+        ('duplicate-ratio=', None, 'Fraction of the words of a file that are duplicates, '
+                                   'without a vocabulary. DEFAULT 0'),
+        ('num-processes=', None, 'The number of processes writing the files. DEFAULT 1'),
+        ('seed=', None, 'The seed of the dataset. DEFAULT random'),
     ]
 
     def initialize_options(self):
@@ -18,25 +30,50 @@ class GenerateFakeDataset(Command):
         self.min_words_per_file = None
         self.max_words_per_file = None
         self.output_dir = None
+        self.size = None
+        self.min_word_length = 4
+        self.max_word_length = 12
+        self.vocabulary_size = 0
+        self.zipf = 0.0
+        self.duplicate_ratio = 0.0
+        self.num_processes = 1
+        self.seed = None
 
     def finalize_options(self):
         if self.num_files is None:
             raise ValueError("The 'num-files' option must be specified.")
-        if self.min_words_per_file is None:
-            raise ValueError("The 'min-words-per-file' option must be specified.")
-        if self.max_words_per_file is None:
-            raise ValueError("The 'max-words-per-file' option must be specified.")
+        if self.size is None:
+            if self.min_words_per_file is None:
+                raise ValueError("The 'min-words-per-file' option must be specified.")
+            if self.max_words_per_file is None:
+                raise ValueError("The 'max-words-per-file' option must be specified.")
         if self.output_dir is None:
             raise ValueError("The 'output-dir' option must be specified.")
         self.num_files = int(self.num_files)
-        self.min_words_per_file = int(self.min_words_per_file)
-        self.max_words_per_file = int(self.max_words_per_file)
+        self.min_words_per_file = int(self.min_words_per_file or 0)
+        self.max_words_per_file = int(self.max_words_per_file or 0)
+        self.min_word_length = int(self.min_word_length)
+        self.max_word_length = int(self.max_word_length)
+        self.vocabulary_size = int(self.vocabulary_size)
+        self.zipf = float(self.zipf)
+        self.duplicate_ratio = float(self.duplicate_ratio)
+        self.num_processes = int(self.num_processes)
+        if self.seed is not None:
+            self.seed = int(self.seed)
 
     def run(self):
-        from scripts.dataset import generate_fake_dataset
+        from scripts.dataset import generate_fake_dataset, parse_size
         generate_fake_dataset(
             num_files=self.num_files,
             min_words_per_file=self.min_words_per_file,
             max_words_per_file=self.max_words_per_file,
-            output_dir=self.output_dir
+            output_dir=self.output_dir,
+            min_word_length=self.min_word_length,
+            max_word_length=self.max_word_length,
+            vocabulary_size=self.vocabulary_size,
+            zipf=self.zipf,
+            duplicate_ratio=self.duplicate_ratio,
+            total_size=None if self.size is None else parse_size(self.size),
+            num_processes=self.num_processes,
+            seed=self.seed
         )
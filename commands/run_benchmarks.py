@@ -0,0 +1,59 @@
+import sys
+
+from setuptools import Command
+
+
+class RunBenchmarks(Command):
+    """
+    A custom command for setuptools that benchmarks all mergers on several dataset shapes and
+    compares the results with a stored baseline.
+    """
+    description = 'Benchmark the mergers'
+    user_options = [
+        ('shapes=', None, 'Comma separated dataset shapes. DEFAULT all shapes'),
+        ('mergers=', None, 'Comma separated mergers: basic, async, parallel. DEFAULT all'),
+        ('scale=', None, 'Factor applied to the number of lines of the datasets. DEFAULT 1'),
+        ('repeat=', None, 'Number of runs of every case, the fastest one is kept. DEFAULT 1'),
+        ('data-dir=', None, 'The directory where the datasets are kept between runs.'),
+        ('baseline=', None, 'The baseline file. DEFAULT benchmarks/baseline.json'),
+        ('tolerance=', None, 'Relative change of a metric that is not a regression. '
+                             'DEFAULT 0.2'),
+        ('save-baseline', None, 'Store the results as the new baseline.'),
+    ]
+    boolean_options = ['save-baseline']
+
+    def initialize_options(self):
+        self.shapes = None
+        self.mergers = None
+        self.scale = 1.0
+        self.repeat = 1
+        self.data_dir = None
+        self.baseline = None
+        self.tolerance = 0.2
+        self.save_baseline = False
+
+    def finalize_options(self):
+        if self.shapes is not None:
+            self.shapes = self.shapes.split(',')
+        if self.mergers is not None:
+            self.mergers = self.mergers.split(',')
+        self.scale = float(self.scale)
+        self.repeat = int(self.repeat)
+        self.tolerance = float(self.tolerance)
+
+    def run(self):
+        from benchmarks.suite import (BASELINE_FILE, find_regressions, format_results,
+                                      load_baseline, run_benchmarks, save_baseline)
+        baseline_file = self.baseline or BASELINE_FILE
+        results = run_benchmarks(self.shapes, self.mergers, self.scale, self.data_dir,
+                                 self.repeat)
+        print(format_results(results))
+        if self.save_baseline:
+            save_baseline(results, baseline_file)
+            print(f"Saved the baseline to {baseline_file}")
+            return
+        regressions = find_regressions(results, load_baseline(baseline_file), self.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+from merge_files.keys import SortKey
+from merge_files.utils import ArchiveMember
+
+
+MANIFEST_NAME = "manifest.json"
+# Suffix of the subdirectory of a work directory that holds the files of a merge
+WORK_SUBDIR_SUFFIX = ".work"
+# Manifests of another version are ignored, so their chunks are merged again
+MANIFEST_VERSION = 1
+# Suffixes of the manifest of an output file and of the previous output during a merge
+OUTPUT_MANIFEST_SUFFIX = ".manifest.json"
+PREVIOUS_OUTPUT_SUFFIX = ".previous"
+
+
+def merge_settings(dedup: str, key: Optional[SortKey], **options) -> dict:
+    """
+    Returns the options of a merge that the content of its files depends on, in a form that
+    compares equal after a JSON round trip.
+
+    Args:
+        dedup (str): The deduplication mode.
+        key (SortKey, optional): The sort key, None for whole lines.
+        **options: Further options that the files depend on.
+    """
+    if key is not None:
+        key = [key.column, key.delimiter, key.numeric, key.casefold, key.reverse]
+    return {"dedup": dedup, "key": key, **options}
+
+
+def fingerprint_input(file_path: Union[str, ArchiveMember]) -> list:
+    """
+    Returns what identifies the content of an input file without reading it: its absolute path,
+    its size and its modification time. A member of an archive is identified by the archive and
+    its name in it.
+
+    Args:
+        file_path (Union[str, ArchiveMember]): Path of the file, or a member of an archive.
+
+    Returns:
+        list: The fingerprint, as a list so that it compares equal after a JSON round trip.
+    """
+    if isinstance(file_path, ArchiveMember):
+        stat = os.stat(file_path.archive)
+        return [os.path.abspath(file_path.archive), file_path.name, file_path.size,
+                stat.st_mtime_ns]
+    stat = os.stat(file_path)
+    return [os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns]
+
+
+class WorkManifest:
+    """
+    Records in a persistent work directory which chunks of input files have been merged into
+    intermediate files, so that a merge that failed can be resumed without merging them again.
+
+    A chunk is identified by the fingerprints of its input files, see `fingerprint_input`, and
+    its intermediate file is named after a digest of them. A chunk is only reused if its input
+    files are unchanged and its intermediate file still exists. The manifest is rewritten
+    atomically after every chunk, so it never lists an intermediate file that was only written
+    in part.
+
+    Args:
+        work_dir (str): The work directory. It is created if it does not exist.
+        settings (dict): The options of the merge that the intermediate files depend on. A
+            manifest written with other settings is discarded.
+        resume (bool, optional): Whether to reuse the chunks of an existing manifest. Defaults to
+            False, which removes it with its intermediate files.
+    """
+
+    def __init__(self, work_dir: str, settings: dict, resume: bool = False) -> None:
+        os.makedirs(work_dir, exist_ok=True)
+        self.work_dir = work_dir
+        self.path = os.path.join(work_dir, MANIFEST_NAME)
+        self.settings = settings
+        self.chunks: Dict[str, str] = {}
+        self._load(resume)
+
+    def _load(self, resume: bool) -> None:
+        try:
+            with open(self.path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        chunks = manifest.get("chunks", {})
+        if resume and manifest.get("version") == MANIFEST_VERSION and \
+                manifest.get("settings") == self.settings:
+            self.chunks = {digest: file_name for digest, file_name in chunks.items()
+                           if os.path.exists(os.path.join(self.work_dir, file_name))}
+            return
+        if resume:
+            print(f"Ignoring the manifest of a merge with other settings in {self.work_dir}")
+        # The intermediate files of the previous merge are stale
+        self.chunks = chunks
+        self.remove()
+
+    def save(self) -> None:
+        """
+        Writes the manifest. It is written to a temporary file first and renamed, so a crash
+        leaves either the old or the new manifest.
+        """
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings,
+                       "chunks": self.chunks}, f)
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def chunk_digest(input_files: Sequence[Union[str, ArchiveMember]]) -> str:
+        """
+        Returns the digest of the fingerprints of the input files of a chunk.
+
+        Args:
+            input_files (Sequence[Union[str, ArchiveMember]]): The input files of the chunk.
+        """
+        fingerprints = json.dumps(list(map(fingerprint_input, input_files)))
+        return hashlib.sha1(fingerprints.encode()).hexdigest()
+
+    def completed(self, digest: str) -> bool:
+        """
+        Checks whether a previous merge completed the intermediate file of a chunk.
+
+        Args:
+            digest (str): The `chunk_digest` of the chunk.
+        """
+        return digest in self.chunks
+
+    def record(self, digest: str, file_path: str) -> None:
+        """
+        Records that the intermediate file of a chunk is complete.
+
+        Args:
+            digest (str): The `chunk_digest` of the chunk.
+            file_path (str): Path of the intermediate file in the work directory.
+        """
+        self.chunks[digest] = os.path.basename(file_path)
+        self.save()
+
+    def remove(self) -> List[str]:
+        """
+        Removes the manifest and the intermediate files it lists.
+
+        Returns:
+            List[str]: Paths of the removed intermediate files.
+        """
+        removed = []
+        for file_name in self.chunks.values():
+            file_path = os.path.join(self.work_dir, file_name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                removed.append(file_path)
+        self.chunks = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return removed
+
+
+class IncrementalPlan(NamedTuple):
+    """
+    What an incremental merge has to do, see `OutputManifest.plan`.
+
+    Attributes:
+        new_files (List[Union[str, ArchiveMember]]): The input files to merge, only the new ones
+            if the previous output is reused.
+        fingerprints (List[list]): The fingerprints of all input files, saved once the merge
+            succeeded.
+        full_merge_reason (str, optional): Why all input files are merged, None if the new files
+            are merged into the previous output.
+    """
+    new_files: List[Union[str, ArchiveMember]]
+    fingerprints: List[list]
+    full_merge_reason: Optional[str]
+
+
+class OutputManifest:
+    """
+    Records the fingerprints of the input files merged into an output file, in
+    "<output_file>.manifest.json", so that a later merge only merges new input files into the
+    previous output.
+
+    Input files cannot be taken out of an output file. If a merged input file changed or was
+    removed, or the merge settings differ, all input files are merged again.
+
+    Args:
+        output_file (str): Path of the output file.
+        settings (dict): The options of the merge that the output depends on, see
+            `merge_settings`.
+    """
+
+    def __init__(self, output_file: str, settings: dict) -> None:
+        self.output_file = output_file
+        self.path = output_file + OUTPUT_MANIFEST_SUFFIX
+        self.previous_output = output_file + PREVIOUS_OUTPUT_SUFFIX
+        self.settings = settings
+        self._own_files = {os.path.abspath(path)
+                           for path in (output_file, self.path, self.previous_output)}
+
+    def is_own_file(self, file_path: Union[str, ArchiveMember]) -> bool:
+        """
+        Checks whether an input file is the output file or one of the files kept next to it,
+        which are never merged.
+
+        Args:
+            file_path (Union[str, ArchiveMember]): The input file.
+        """
+        if isinstance(file_path, ArchiveMember):
+            return False
+        return os.path.abspath(file_path) in self._own_files
+
+    def _load(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def plan(self, input_files: List[Union[str, ArchiveMember]]) -> IncrementalPlan:
+        """
+        Compares the input files with those merged into the previous output. A previous output
+        that is still set aside, because the merge that read it was killed, is restored first.
+
+        Args:
+            input_files (List[Union[str, ArchiveMember]]): All input files.
+
+        Returns:
+            IncrementalPlan: The files to merge and whether the previous output is reused.
+        """
+        # The files are looked up in threads, which overlaps the latency of network file systems
+        with ThreadPoolExecutor() as pool:
+            fingerprints = list(pool.map(fingerprint_input, input_files))
+        self.restore_output()
+        manifest = self._load()
+        reason = None
+        if not os.path.exists(self.output_file) or manifest is None:
+            reason = "no previous output with a manifest"
+        elif manifest.get("version") != MANIFEST_VERSION or \
+                manifest.get("settings") != self.settings:
+            reason = "the merge settings changed"
+        if reason is not None:
+            return IncrementalPlan(input_files, fingerprints, reason)
+
+        # A fingerprint ends with the size and the modification time of the file
+        merged = {tuple(fingerprint[:-2]): fingerprint for fingerprint in manifest["inputs"]}
+        new_files, changed = [], 0
+        for file_path, fingerprint in zip(input_files, fingerprints):
+            previous = merged.pop(tuple(fingerprint[:-2]), None)
+            if previous is None:
+                new_files.append(file_path)
+            elif previous != fingerprint:
+                changed += 1
+        if changed:
+            reason = f"{changed} merged input files changed"
+        elif merged:
+            reason = f"{len(merged)} merged input files were removed"
+        if reason is not None:
+            return IncrementalPlan(input_files, fingerprints, reason)
+        return IncrementalPlan(new_files, fingerprints, None)
+
+    def set_aside_output(self) -> str:
+        """
+        Renames the previous output, so that it is read while the new output is written.
+
+        Returns:
+            str: The new path of the previous output.
+        """
+        os.replace(self.output_file, self.previous_output)
+        return self.previous_output
+
+    def restore_output(self) -> None:
+        """
+        Renames the previous output back after a merge failed.
+        """
+        if os.path.exists(self.previous_output):
+            os.replace(self.previous_output, self.output_file)
+
+    def commit(self, fingerprints: List[list]) -> None:
+        """
+        Records the input files of a merge that succeeded and removes the previous output. The
+        manifest is written atomically.
+
+        The previous output is removed first: a manifest that lists the new input files next to
+        a previous output would make the next merge restore the previous output over the new
+        one. If the merge is killed in between, the old manifest makes the next merge merge the
+        new input files again.
+
+        Args:
+            fingerprints (List[list]): The fingerprints of all input files, see `IncrementalPlan`.
+        """
+        if os.path.exists(self.previous_output):
+            os.remove(self.previous_output)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings,
+                       "inputs": fingerprints}, f)
+        os.replace(temp_path, self.path)
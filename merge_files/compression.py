@@ -0,0 +1,194 @@
+import bz2
+import gzip
+import io
+import lzma
+import zlib
+from typing import BinaryIO, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+CODECS = ("none", "gzip", "bz2", "xz", "zstd")
+# Leading bytes of a file compressed by each codec
+MAGIC_NUMBERS = {
+    "gzip": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+# Compression levels of temporary files, which are written once and read once
+FAST_LEVELS = {"gzip": 1, "bz2": 1, "xz": 0, "zstd": 1}
+
+
+def available_codecs() -> tuple:
+    """
+    Returns the codecs that can be used on this installation. "zstd" needs the `zstandard`
+    package.
+    """
+    return tuple(codec for codec in CODECS if codec != "zstd" or zstandard is not None)
+
+
+def check_codec(codec: str) -> str:
+    """
+    Checks that a codec is supported and available.
+
+    Args:
+        codec (str): One of `CODECS`.
+
+    Returns:
+        str: The codec.
+
+    Raises:
+        ValueError: If the codec is not supported or its package is not installed.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported compression: {codec}. Choose one of {CODECS}")
+    if codec not in available_codecs():
+        raise ValueError(f"Compression {codec} requires the zstandard package.")
+    return codec
+
+
+def codec_from_magic(head: bytes) -> str:
+    """
+    Detects the codec of a file from its first bytes.
+
+    Args:
+        head (bytes): At least the first 6 bytes of the file, fewer only if it is shorter.
+
+    Returns:
+        str: The codec, "none" if the bytes do not start with a known magic number.
+    """
+    for codec, magic in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return codec
+    return "none"
+
+
+def detect_codec(file_path: str) -> str:
+    """
+    Detects the codec of a file from its magic number, regardless of its extension.
+
+    Args:
+        file_path (str): Path of the file.
+
+    Returns:
+        str: The codec, "none" for a file that is not compressed.
+    """
+    with open(file_path, "rb") as f:
+        return codec_from_magic(f.read(6))
+
+
+class _ClosingReader(io.BufferedReader):
+    """
+    A buffered reader of a decompressed stream that also closes the compressed stream it reads.
+    """
+
+    def __init__(self, raw: BinaryIO, buffering: int, source: BinaryIO) -> None:
+        super().__init__(raw, buffering)
+        self._source = source
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._source.close()
+
+
+def open_compressed(file_path: Union[str, BinaryIO], mode: str, codec: str,
+                    level: Optional[int] = None,
+                    buffering: int = io.DEFAULT_BUFFER_SIZE,
+                    close_stream: bool = False) -> BinaryIO:
+    """
+    Opens a file for reading or writing bytes through a codec.
+
+    Args:
+        file_path (Union[str, BinaryIO]): Path of the file, or a binary stream opened in `mode`,
+            which is closed with the returned stream if the codec is "none" and left open
+            otherwise.
+        mode (str): "rb" or "wb".
+        codec (str): One of `CODECS`.
+        level (int, optional): Compression level when writing. Defaults to the codec default.
+        buffering (int): Size of the buffer of the uncompressed stream in bytes.
+        close_stream (bool, optional): Whether a stream given as `file_path` for reading is
+            closed with the returned stream whatever the codec. Defaults to False.
+
+    Returns:
+        BinaryIO: A buffered binary stream of the uncompressed content.
+
+    Raises:
+        ValueError: If the codec is not available.
+    """
+    check_codec(codec)
+    if codec == "none":
+        if isinstance(file_path, str):
+            return open(file_path, mode, buffering=buffering)
+        stream = file_path
+    elif codec == "zstd":
+        source = open(file_path, mode) if isinstance(file_path, str) else file_path
+        if mode == "rb":
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                source, closefd=isinstance(file_path, str))
+        else:
+            compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+            stream = compressor.stream_writer(source, closefd=isinstance(file_path, str))
+    elif codec == "gzip":
+        stream = gzip.open(file_path, mode, compresslevel=9 if level is None else level)
+    elif codec == "bz2":
+        stream = bz2.open(file_path, mode, compresslevel=9 if level is None else level)
+    else:
+        stream = lzma.open(file_path, mode, preset=None if mode == "rb" else level)
+    # The codec streams are called once per buffer instead of once per line
+    if mode == "rb":
+        if close_stream and not isinstance(file_path, str) and codec != "none":
+            return _ClosingReader(stream, buffering, file_path)
+        return io.BufferedReader(stream, buffering)
+    return io.BufferedWriter(stream, buffering)
+
+
+def compress_bytes(data: bytes, codec: str, level: Optional[int] = None) -> bytes:
+    """
+    Compresses a buffer in memory with a codec, as a single self-contained frame.
+
+    Args:
+        data (bytes): The uncompressed data.
+        codec (str): One of `CODECS`, "gzip" compresses with plain deflate.
+        level (int, optional): Compression level. Defaults to the fastest level of the codec.
+
+    Returns:
+        bytes: The compressed data.
+    """
+    level = FAST_LEVELS.get(codec) if level is None else level
+    if codec == "gzip":
+        return zlib.compress(data, level)
+    if codec == "bz2":
+        return bz2.compress(data, level)
+    if codec == "xz":
+        return lzma.compress(data, preset=level)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return data
+
+
+def decompress_bytes(data: bytes, codec: str) -> bytes:
+    """
+    Decompresses a buffer compressed by `compress_bytes`.
+
+    Args:
+        data (bytes): The compressed data.
+        codec (str): The codec the data was compressed with.
+
+    Returns:
+        bytes: The uncompressed data.
+    """
+    if codec == "gzip":
+        return zlib.decompress(data)
+    if codec == "bz2":
+        return bz2.decompress(data)
+    if codec == "xz":
+        return lzma.decompress(data)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
@@ -0,0 +1,123 @@
+import math
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterable, Iterator
+
+
+DEDUP_MODES = ("sorted", "exact", "bloom", "none")
+
+
+class BloomFilter:
+    """
+    A fixed size Bloom filter for approximate membership tests.
+
+    The filter never reports a false negative, but it may report an item as already seen with
+    a probability of about `error_rate` once `capacity` items have been added. Its memory usage
+    is fixed when it is created and does not grow with the number of items added.
+
+    Args:
+        capacity (int): Expected number of distinct items.
+        error_rate (float): Target false positive probability at `capacity` items.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        if capacity <= 0:
+            raise ValueError(f"Capacity must be a positive integer: {capacity}")
+        if not 0 < error_rate < 1:
+            raise ValueError(f"Error rate must be between 0 and 1: {error_rate}")
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item) -> Iterator[int]:
+        # Double hashing derives all positions from a single 64 bit hash of the item
+        value = hash(item) & 0xFFFFFFFFFFFFFFFF
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (first + i * second) % self.num_bits
+
+    def add(self, item) -> bool:
+        """
+        Adds an item to the filter.
+
+        Args:
+            item: A hashable item.
+
+        Returns:
+            bool: True if the item was possibly added before, False if it is certainly new.
+        """
+        seen = True
+        for position in self._positions(item):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                seen = False
+        return seen
+
+    def __contains__(self, item) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+def dedup_sorted(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Drops duplicates from a sorted stream by comparing each line with the previous one only.
+    Uses constant memory regardless of the number of distinct lines.
+    """
+    return map(itemgetter(0), groupby(lines))
+
+
+def dedup_exact(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Drops every duplicate from a stream in any order. Memory grows with the number of distinct
+    lines.
+    """
+    written_words = set()
+    for line in lines:
+        if line not in written_words:
+            written_words.add(line)
+            yield line
+
+
+def dedup_bloom(lines: Iterable[str], capacity: int = 1_000_000,
+                error_rate: float = 0.001) -> Iterator[str]:
+    """
+    Drops duplicates from a stream in any order using a Bloom filter of fixed size. A unique line
+    may be dropped with a probability of about `error_rate`.
+    """
+    bloom = BloomFilter(capacity, error_rate)
+    for line in lines:
+        if not bloom.add(line):
+            yield line
+
+
+def deduplicate(lines: Iterable[str], mode: str = "sorted", bloom_capacity: int = 1_000_000,
+                bloom_error_rate: float = 0.001) -> Iterable[str]:
+    """
+    Removes duplicate lines from a stream with the given strategy.
+
+    Args:
+        lines (Iterable[str]): Lines to deduplicate.
+        mode (str): One of "sorted", "exact", "bloom" or "none".
+            - sorted: constant memory, only correct if the stream is sorted.
+            - exact: keeps a set of all distinct lines, correct for any order.
+            - bloom: bounded memory for any order, may drop a few unique lines.
+            - none: keeps duplicates.
+        bloom_capacity (int): Expected number of distinct lines for the "bloom" mode.
+        bloom_error_rate (float): False positive probability for the "bloom" mode.
+
+    Returns:
+        Iterable[str]: The lines without duplicates.
+
+    Raises:
+        ValueError: If the mode is not supported.
+    """
+    if mode == "sorted":
+        return dedup_sorted(lines)
+    if mode == "exact":
+        return dedup_exact(lines)
+    if mode == "bloom":
+        return dedup_bloom(lines, bloom_capacity, bloom_error_rate)
+    if mode == "none":
+        return lines
+    raise ValueError(f"Unsupported deduplication mode: {mode}. Choose one of {DEDUP_MODES}")
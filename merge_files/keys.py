@@ -0,0 +1,91 @@
+import itertools
+import operator
+from typing import Any, AnyStr, Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+class SortKey:
+    """
+    Describes how lines are compared while merging.
+
+    The key is compiled once into a chain of built-in callables, such as `operator.itemgetter`
+    and `str.casefold`, that are mapped over whole batches of lines. No Python level function is
+    called per line, so a key costs little more than plain lexicographic comparison.
+
+    Args:
+        column (int, optional): Index of the field to compare, counting from 0. Lines with fewer
+            fields are compared by an empty field. Defaults to comparing the whole line.
+        delimiter (str, optional): Separator of the fields. Defaults to a tab.
+        numeric (bool, optional): Compare the field as a number. Defaults to False.
+        casefold (bool, optional): Compare case insensitively. Defaults to False.
+        reverse (bool, optional): The inputs are sorted in descending order and so is the output.
+            Defaults to False.
+    """
+
+    def __init__(self, column: Optional[int] = None, delimiter: str = "\t",
+                 numeric: bool = False, casefold: bool = False, reverse: bool = False) -> None:
+        if column is not None and column < 0:
+            raise ValueError(f"Column index cannot be negative: {column}")
+        if not delimiter:
+            raise ValueError("Delimiter cannot be empty.")
+        self.column = column
+        self.delimiter = delimiter
+        self.numeric = numeric
+        self.casefold = casefold
+        self.reverse = reverse
+        self._compiled = {}
+
+    @property
+    def is_identity(self) -> bool:
+        """
+        Whether lines are compared as they are, so no key needs to be extracted.
+        """
+        return self.column is None and not self.numeric and not self.casefold
+
+    def _compile(self, binary: bool) -> List[Tuple[Callable, Any]]:
+        # Each step is a callable and an optional second argument passed with every line
+        steps = []
+        if self.column is not None:
+            delimiter = self.delimiter.encode() if binary else self.delimiter
+            # Padding guarantees that every line has the column
+            steps.append((operator.add, delimiter * self.column))
+            steps.append((operator.methodcaller("split", delimiter, self.column + 1), None))
+            steps.append((operator.itemgetter(self.column), None))
+            steps.append((bytes.strip if binary else str.strip, None))
+        if self.casefold:
+            steps.append((bytes.lower if binary else str.casefold, None))
+        if self.numeric:
+            # float parses both str and bytes
+            steps.append((float, None))
+        return steps
+
+    def extract(self, words: Iterable[AnyStr], binary: bool = False) -> Iterator:
+        """
+        Extracts the keys of a batch of words.
+
+        Args:
+            words (Iterable[AnyStr]): Normalized lines, bytes in binary mode.
+            binary (bool, optional): Whether the words are bytes. Defaults to False.
+
+        Returns:
+            Iterator: The key of every word, in the same order.
+
+        Raises:
+            ValueError: If a numeric key is not a number.
+        """
+        if binary not in self._compiled:
+            self._compiled[binary] = self._compile(binary)
+        keys = iter(words)
+        for function, argument in self._compiled[binary]:
+            if argument is None:
+                keys = map(function, keys)
+            else:
+                keys = map(function, keys, itertools.repeat(argument))
+        return keys
+
+    def __getstate__(self):
+        # The compiled chain is rebuilt on first use after unpickling
+        return {**self.__dict__, "_compiled": {}}
+
+    def __repr__(self) -> str:
+        return (f"SortKey(column={self.column!r}, delimiter={self.delimiter!r}, "
+                f"numeric={self.numeric!r}, casefold={self.casefold!r}, reverse={self.reverse!r})")
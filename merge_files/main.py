@@ -1,54 +1,262 @@
 """File Merger CLI Tool"""
 import argparse
+import contextlib
 import os
+import sys
 import time
+from typing import Callable, List, Optional
 from .mergers.async_ import AsyncFileMerger
 from .mergers.parallel import ParallelFileMerger
 from .mergers.basic import BasicFileMerger
-from .utils import (check_valid_path,
-                    list_files)
+from .mergers.base import READERS, STDOUT
+from .checkpoint import OutputManifest, merge_settings
+from .compression import CODECS
+from .dedup import DEDUP_MODES
+from .keys import SortKey
+from .metrics import JsonLinesWriter, MergeMetrics, ProgressBar
+from .planner import auto_tune
+from .profiling import Profiler
+from .runs import RUN_FORMATS
+from .utils import (SYMLINK_POLICIES,
+                    ArchiveMember,
+                    check_valid_path,
+                    is_archive,
+                    is_sequential_archive,
+                    list_files,
+                    read_file_list)
+
+
+NEWLINES = {"native": None, "lf": "\n", "crlf": "\r\n"}
+# Input directory that makes the tool read the list of input files from the standard input
+STDIN = "-"
 
 
 def merge(input_dir: str, output_dir: str, filename: str, chunk_file: int, chunk_line: int,
-          use_parallel: bool, n_of_process: int,) -> None:
+          use_parallel: bool, n_of_process: int, read_buffer: int = 64 * 1024,
+          dedup: str = "sorted", bloom_capacity: int = 1_000_000,
+          fan_in: Optional[int] = None, binary: bool = False,
+          newline: Optional[str] = None, key_column: Optional[int] = None,
+          delimiter: str = "\t", numeric: bool = False, casefold: bool = False,
+          reverse: bool = False, reader: str = "buffered",
+          archive_order: bool = False, output_compression: str = "none",
+          compression_level: Optional[int] = None, temp_compression: str = "none",
+          run_format: str = "block", temp_dirs: Optional[List[str]] = None,
+          auto: bool = False, recursive: bool = False, include: Optional[List[str]] = None,
+          exclude: Optional[List[str]] = None, symlinks: str = "files", progress: bool = False,
+          metrics_file: Optional[str] = None,
+          metrics_callback: Optional[Callable[[dict], None]] = None,
+          profile: bool = False, work_dir: Optional[str] = None, resume: bool = False,
+          incremental: bool = False) -> None:
     """
-    Merges text files from a given directory and saves the merged file to an output directory.
+    Merges text files from a given directory or archive and saves the merged file to an output
+    directory. Archives are read directly without extracting them.
 
     Args:
-        input_dir (str): Path to the directory containing input files to be merged.
-        output_dir (str): Path to the directory where the output file will be saved.
+        input_dir (str): Path to the directory or the .zip/.tar archive containing input files to
+            be merged, or "-" to read the paths of the input files from the standard input, one
+            per line.
+        output_dir (str): Path to the directory where the output file will be saved, or "-" to
+            write the output to the standard output. Messages are then printed to the standard
+            error.
         filename (str): Name of the output file.
         chunk_file (int): Maximum number of files to merge at once.
         chunk_line (int): Maximum number of lines to read at once from each file.
         use_parallel (bool): Whether to use parallel processing for the merging.
         n_of_process (int): Number of processes to use if parallel processing is enabled.
+        read_buffer (int): Number of bytes read ahead from each file during the final merge.
+        dedup (str): Deduplication strategy: "sorted" compares each word with the previous one
+            only, "exact" keeps a set of written words, "bloom" uses a fixed size Bloom filter
+            and "none" keeps duplicates.
+        bloom_capacity (int): Expected number of distinct words for the "bloom" strategy.
+        fan_in (int, optional): Maximum number of files opened by a single merge. If None, it is
+            derived from the file descriptor limit and the available memory.
+        binary (bool): Whether to merge bytes instead of decoded text.
+        newline (str, optional): Line terminator of the output file. If None, os.linesep is used.
+        key_column (int, optional): Index of the field lines are sorted by, counting from 0. If
+            None, the whole line is compared.
+        delimiter (str): Separator of the fields.
+        numeric (bool): Whether to compare the key as a number.
+        casefold (bool): Whether to compare the key case insensitively.
+        reverse (bool): Whether the input files are sorted in descending order.
+        reader (str): "buffered" to read files through file objects, "mmap" to memory map them
+            where possible.
+        archive_order (bool): Whether to read an input archive in a single sequential pass.
+            Compressed tar archives are always read this way.
+        output_compression (str): Codec of the output file: "none", "gzip", "bz2", "xz" or
+            "zstd". Compressed input files are always detected and decompressed.
+        compression_level (int, optional): Compression level of the output file. If None, the
+            codec default is used.
+        temp_compression (str): Codec of the intermediate files, written at a fast level.
+        run_format (str): Format of the intermediate files, "block" for words in compressed
+            blocks with a block index or "text" for one word per line.
+        temp_dirs (List[str], optional): Directories for intermediate files, used round-robin.
+            If None, the system temporary directory is used.
+        auto (bool): Whether to choose the merger, `chunk_file`, `chunk_line`, `n_of_process`,
+            `read_buffer` and `fan_in` from the input and the host with `auto_tune`, instead of
+            the given values.
+        recursive (bool): Whether to merge the files in the subdirectories of the input
+            directory as well.
+        include (List[str], optional): Only merge the files that match one of these globs. A
+            glob with a "/" is matched against the path relative to the input directory, other
+            globs against the file name.
+        exclude (List[str], optional): Skip the files and directories that match one of these
+            globs.
+        symlinks (str): "skip" ignores symbolic links, "files" merges linked files but does not
+            descend into linked directories and "follow" does both.
+        progress (bool): Whether to draw a progress bar with the estimated time left on the
+            standard error.
+        metrics_file (str, optional): Path of a file the phase timings, counters, progress and
+            worker throughput are written to as JSON lines, or "-" for the standard error. See
+            `MergeMetrics` for the events.
+        metrics_callback (Callable[[dict], None], optional): A function that receives every
+            metrics event as well.
+        profile (bool): Whether to profile the main process and every worker process per phase
+            with cProfile and a stack sampler. A report of every phase, its cProfile statistics
+            and a collapsed-stack file for flame graphs are written next to the output file, see
+            `Profiler.write`.
+        work_dir (str, optional): A persistent directory for the intermediate files instead of
+            `temp_dirs`. The completed chunks are recorded in a manifest there, and kept if the
+            merge fails.
+        resume (bool): Whether to skip the chunks that a previous merge into `work_dir`
+            completed, if their input files are unchanged.
+        incremental (bool): Whether to merge only the input files that are new since the
+            previous merge into the same output file, together with the previous output. The
+            merged input files are recorded in a manifest next to the output file, see
+            `OutputManifest`. All input files are merged if there is no previous output with a
+            manifest, a merged input file changed or was removed, or the sort key or
+            deduplication changed.
 
     Returns:
         None: The function does not return anything, but prints information about the operation
         to the console.
     """
-    input_dir = check_valid_path(input_dir)
-    input_files = list_files(input_dir)
-    if chunk_file < len(input_files):
-        if use_parallel:
-            file_merger = ParallelFileMerger(input_files, output_dir, filename, chunk_file,
-                                             chunk_line, n_of_process)
+    callbacks = [callback for callback in (metrics_callback,) if callback is not None]
+    if progress:
+        callbacks.append(ProgressBar())
+    metrics_stream = None
+    if metrics_file is not None:
+        metrics_stream = sys.stderr if metrics_file == "-" else open(metrics_file, "w")
+        callbacks.append(JsonLinesWriter(metrics_stream))
+    profiler = None
+    if profile:
+        profiler = Profiler()
+        callbacks.append(profiler)
+        profiler.start()
+    metrics = MergeMetrics(callbacks)
+    # The output is written to the descriptor of the standard output, so messages go to the
+    # standard error instead
+    with contextlib.redirect_stdout(sys.stderr if output_dir == STDOUT else sys.stdout):
+        with metrics.phase("discovery"):
+            if input_dir == STDIN:
+                archive_order = False
+                input_files = read_file_list(sys.stdin)
+            else:
+                input_dir = check_valid_path(input_dir)
+                archive_order = is_archive(input_dir) and (archive_order
+                                                           or is_sequential_archive(input_dir))
+                input_files = [input_dir] if archive_order else list_files(
+                    input_dir, recursive=recursive, include=include, exclude=exclude,
+                    symlinks=symlinks)
+        key = None
+        if key_column is not None or numeric or casefold or reverse:
+            key = SortKey(key_column, delimiter, numeric, casefold, reverse)
+        output_manifest = incremental_plan = None
+        if incremental:
+            if output_dir == STDOUT:
+                raise ValueError("An incremental merge needs an output file, not the standard "
+                                 "output.")
+            output_manifest = OutputManifest(os.path.join(output_dir, filename),
+                                             merge_settings(dedup, key))
+            # The output and its manifest may be in the input directory
+            input_files = [file for file in input_files if not output_manifest.is_own_file(file)]
+            incremental_plan = output_manifest.plan(input_files)
+            if incremental_plan.full_merge_reason is not None:
+                print(f"Merging all {len(input_files)} input files: "
+                      f"{incremental_plan.full_merge_reason}.")
+            elif incremental_plan.new_files:
+                print(f"Merging {len(incremental_plan.new_files)} new of {len(input_files)} input "
+                      "files into the previous output.")
+                archive_order = False
+                input_files = incremental_plan.new_files
+        up_to_date = incremental_plan is not None and incremental_plan.full_merge_reason is None \
+            and not incremental_plan.new_files
+        strategy = None
+        if auto and not up_to_date:
+            total_size = sum(file.size if isinstance(file, ArchiveMember) else os.path.getsize(file)
+                             for file in input_files)
+            plan = auto_tune(len(input_files), total_size)
+            print(f"Auto-tuned plan for {len(input_files)} files of {total_size} bytes:",
+                  ", ".join(f"{field}={value}" for field, value in plan._asdict().items()))
+            strategy = plan.strategy
+            chunk_file, chunk_line = plan.chunk_file, plan.chunk_line
+            n_of_process = plan.num_processes
+            read_buffer, fan_in = plan.read_buffer, plan.fan_in
+            use_parallel = strategy == "parallel"
+        options = dict(read_buffer_size=read_buffer, dedup=dedup, bloom_capacity=bloom_capacity,
+                       fan_in=fan_in, binary=binary, newline=newline, key=key, reader=reader,
+                       archive_order=archive_order, output_compression=output_compression,
+                       compression_level=compression_level, temp_compression=temp_compression,
+                       run_format=run_format, temp_dirs=temp_dirs, metrics=metrics,
+                       profiler=profiler, work_dir=work_dir, resume=resume)
+        reuse_output = incremental_plan is not None and incremental_plan.full_merge_reason is None \
+            and not up_to_date
+        if reuse_output:
+            # The previous output is read while the new output is written to its path. It is only
+            # set aside once the merger is built, so a merger that cannot be built leaves it alone
+            options["previous_output"] = output_manifest.previous_output
+        if up_to_date:
+            file_merger = None
+        elif archive_order or strategy == "basic":
+            file_merger = BasicFileMerger(input_files, output_dir, filename, chunk_file,
+                                          chunk_line, **options)
+        elif chunk_file < len(input_files):
+            if use_parallel:
+                file_merger = ParallelFileMerger(input_files, output_dir, filename, chunk_file,
+                                                 chunk_line, n_of_process, **options)
+            else:
+                file_merger = AsyncFileMerger(input_files, output_dir, filename, chunk_file,
+                                              chunk_line, **options)
         else:
-            file_merger = AsyncFileMerger(input_files, output_dir, filename, chunk_file,
-                                          chunk_line)
-    else:
-        file_merger = BasicFileMerger(input_files, output_dir, filename, chunk_file,
-                                      chunk_line)
-    try:
-        tic = time.monotonic()
-        file_merger.merge_files()
-        tac = time.monotonic()
-        print("Elapsed time:", (tac-tic), "s")
-    except Exception as e:
-        raise Exception(f"Something went wrong: {e}")
-    else:
-        print("Operation is successful. The output file has been saved here:",
-              os.path.join(output_dir, filename))
+            file_merger = BasicFileMerger(input_files, output_dir, filename, chunk_file,
+                                          chunk_line, **options)
+        try:
+            tic = time.monotonic()
+            if file_merger is None:
+                print("The output is up to date, no input file is new.")
+            else:
+                if reuse_output:
+                    output_manifest.set_aside_output()
+                file_merger.merge_files()
+            tac = time.monotonic()
+            print("Elapsed time:", (tac-tic), "s")
+            print("Phase timings:", ", ".join(f"{phase} {seconds:.3f}s"
+                                              for phase, seconds in metrics.phases.items()))
+            metrics.finish()
+            if output_manifest is not None:
+                output_manifest.commit(incremental_plan.fingerprints)
+            if profiler is not None:
+                profiler.stop()
+                # The profile of a merge to the standard output is written to the current
+                # directory
+                base_path = os.path.join(os.getcwd() if output_dir == STDOUT else output_dir,
+                                         filename)
+                print("Profile written to:", ", ".join(profiler.write(base_path)))
+        except Exception as e:
+            if output_manifest is not None:
+                output_manifest.restore_output()
+            raise Exception(f"Something went wrong: {e}")
+        else:
+            if output_dir == STDOUT:
+                print("Operation is successful. The output has been written to the standard "
+                      "output.")
+            else:
+                print("Operation is successful. The output file has been saved here:",
+                      os.path.join(output_dir, filename))
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            if metrics_stream not in (None, sys.stderr):
+                metrics_stream.close()
 
 
 def cli_main() -> None:
@@ -60,12 +268,13 @@ def cli_main() -> None:
     )
     parser.add_argument(
         "-i", "--input-dir", type=str,
-        help=("A directory of files to be merged.")
+        help=("A directory or a .zip/.tar archive of files to be merged, or '-' to read the "
+              "paths of the files from the standard input, one per line.")
     )
     parser.add_argument(
         "-o", "--output-dir", type=str, default=f"{os.getcwd()}",
-        help=("A directory where the merged file will be saved. "
-              "DEFAULT <current-directory>")
+        help=("A directory where the merged file will be saved, or '-' to write the merged "
+              "output to the standard output. DEFAULT <current-directory>")
     )
     parser.add_argument(
         "-f", "--filename", type=str, default="output.txt",
@@ -86,6 +295,126 @@ def cli_main() -> None:
     parser.add_argument(
         "-cl", "--chunk-line", type=int, default=1024,
         help="Number of lines to process at once. DEFAULT 1024")
+    parser.add_argument(
+        "-rb", "--read-buffer", type=int, default=64 * 1024,
+        help="Number of bytes to read ahead from each file while merging. DEFAULT 65536")
+    parser.add_argument(
+        "-d", "--dedup", type=str, default="sorted", choices=DEDUP_MODES,
+        help=("How duplicate words are removed. 'sorted' compares each word with the previous "
+              "one and uses constant memory, 'exact' remembers every written word, 'bloom' "
+              "uses a fixed size Bloom filter and may drop a few unique words, 'none' keeps "
+              "duplicates. DEFAULT sorted"))
+    parser.add_argument(
+        "--bloom-capacity", type=int, default=1_000_000,
+        help="Expected number of distinct words for the 'bloom' strategy. DEFAULT 1000000")
+    parser.add_argument(
+        "--fan-in", type=int, default=None,
+        help=("Maximum number of files opened by a single merge. More files are merged in "
+              "several passes. DEFAULT derived from the open file limit and free memory"))
+    parser.add_argument(
+        "-b", "--binary", action="store_true",
+        help=("Merge raw bytes without decoding and encoding lines. Only ASCII whitespace is "
+              "stripped and lines only end at \\n, otherwise the output is identical for UTF-8 "
+              "files. DEFAULT False"))
+    parser.add_argument(
+        "--newline", type=str, default="native", choices=NEWLINES,
+        help="Line terminator of the output file. DEFAULT native")
+    parser.add_argument(
+        "-k", "--key-column", type=int, default=None,
+        help="Index of the field to sort by, counting from 0. DEFAULT the whole line")
+    parser.add_argument(
+        "-t", "--delimiter", type=str, default="\t",
+        help="Separator of the fields. DEFAULT tab")
+    parser.add_argument(
+        "-n", "--numeric", action="store_true",
+        help="Compare the sort key as a number. DEFAULT False")
+    parser.add_argument(
+        "--casefold", action="store_true",
+        help="Compare the sort key case insensitively. DEFAULT False")
+    parser.add_argument(
+        "-r", "--reverse", action="store_true",
+        help="The input files are sorted in descending order. DEFAULT False")
+    parser.add_argument(
+        "--reader", type=str, default="buffered", choices=READERS,
+        help=("How input files are read. 'mmap' memory maps regular files and falls back to "
+              "'buffered' for pipes, compressed and very large files. DEFAULT buffered"))
+    parser.add_argument(
+        "--archive-order", action="store_true",
+        help=("Read an input archive in a single sequential pass in archive order. Always used "
+              "for compressed tar archives. DEFAULT False"))
+    parser.add_argument(
+        "--output-compression", type=str, default="none", choices=CODECS,
+        help=("Compress the output file. Compressed input files are detected by their content "
+              "and decompressed. 'zstd' requires the zstandard package. DEFAULT none"))
+    parser.add_argument(
+        "--compression-level", type=int, default=None,
+        help="Compression level of the output file. DEFAULT the codec default")
+    parser.add_argument(
+        "--temp-compression", type=str, default="none", choices=CODECS,
+        help=("Compress intermediate files at the fastest level, trading CPU time for less "
+              "disk I/O. DEFAULT none"))
+    parser.add_argument(
+        "--run-format", type=str, default="block", choices=RUN_FORMATS,
+        help=("Format of the intermediate files. 'block' stores words in compressed blocks with "
+              "a block index, 'text' one word per line for debugging. DEFAULT block"))
+    parser.add_argument(
+        "--temp-dir", type=str, action="append", dest="temp_dirs", default=None,
+        help=("A directory for intermediate files. Repeat it to spread intermediate files "
+              "round-robin over several disks. DEFAULT the system temporary directory"))
+    parser.add_argument(
+        "--auto", action="store_true",
+        help=("Choose the merge strategy, chunk sizes, number of processes, read buffer and "
+              "fan-in from the number and size of the input files, the CPUs, the free memory "
+              "and the open file limit, and print the plan. Overrides -p, -np, -cf, -cl, -rb "
+              "and --fan-in. DEFAULT False"))
+    parser.add_argument(
+        "-R", "--recursive", action="store_true",
+        help=("Merge the files in the subdirectories of the input directory as well. "
+              "Subdirectories are scanned in parallel. DEFAULT False"))
+    parser.add_argument(
+        "--include", type=str, action="append", default=None, metavar="GLOB",
+        help=("Only merge files that match this glob, e.g. '*.txt' or '2023-*/part-*'. A glob "
+              "with a '/' is matched against the path relative to the input directory. Repeat "
+              "it to give several globs. DEFAULT all files"))
+    parser.add_argument(
+        "--exclude", type=str, action="append", default=None, metavar="GLOB",
+        help=("Skip files and directories that match this glob. Repeat it to give several "
+              "globs. DEFAULT none"))
+    parser.add_argument(
+        "--symlinks", type=str, default="files", choices=SYMLINK_POLICIES,
+        help=("How symbolic links are handled. 'skip' ignores them, 'files' merges linked files "
+              "but does not descend into linked directories, 'follow' does both. "
+              "DEFAULT files"))
+    parser.add_argument(
+        "--progress", action="store_true",
+        help=("Draw a progress bar with the throughput and estimated time left of every phase "
+              "on the standard error. DEFAULT False"))
+    parser.add_argument(
+        "--metrics", type=str, default=None, metavar="FILE",
+        help=("Write the timings of the phases, the lines and bytes read and written, the "
+              "dropped duplicates, the heap size and the throughput of every worker process to "
+              "FILE as JSON lines, or to the standard error with '-'. DEFAULT none"))
+    parser.add_argument(
+        "--profile", action="store_true",
+        help=("Profile the main process and every worker process with cProfile and a stack "
+              "sampler. Writes a report of the slowest functions of every phase, the cProfile "
+              "statistics of every phase and a collapsed-stack file for flame graphs next to "
+              "the output file. DEFAULT False"))
+    parser.add_argument(
+        "--work-dir", type=str, default=None, metavar="DIR",
+        help=("A persistent directory for intermediate files, used instead of --temp-dir. The "
+              "chunks merged into intermediate files are recorded in a manifest, and kept if "
+              "the merge fails. DEFAULT none"))
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=("Resume a merge that failed: skip the chunks that the manifest in --work-dir "
+              "records as completed, if their input files are unchanged. DEFAULT False"))
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help=("Merge only the input files that are new since the previous merge into the same "
+              "output file, together with the previous output. The merged files are recorded "
+              "in '<output>.manifest.json'. All files are merged again if one of them changed "
+              "or was removed, or the sort key or deduplication changed. DEFAULT False"))
     args = parser.parse_args()
     merge(
         input_dir=args.input_dir,
@@ -95,4 +424,33 @@ def cli_main() -> None:
         n_of_process=args.n_of_process,
         chunk_file=args.chunk_file,
         chunk_line=args.chunk_line,
+        read_buffer=args.read_buffer,
+        dedup=args.dedup,
+        bloom_capacity=args.bloom_capacity,
+        fan_in=args.fan_in,
+        binary=args.binary,
+        newline=NEWLINES[args.newline],
+        key_column=args.key_column,
+        delimiter=args.delimiter,
+        numeric=args.numeric,
+        casefold=args.casefold,
+        reverse=args.reverse,
+        reader=args.reader,
+        archive_order=args.archive_order,
+        output_compression=args.output_compression,
+        compression_level=args.compression_level,
+        temp_compression=args.temp_compression,
+        run_format=args.run_format,
+        temp_dirs=args.temp_dirs,
+        auto=args.auto,
+        recursive=args.recursive,
+        include=args.include,
+        exclude=args.exclude,
+        symlinks=args.symlinks,
+        progress=args.progress,
+        metrics_file=args.metrics,
+        profile=args.profile,
+        work_dir=args.work_dir,
+        resume=args.resume,
+        incremental=args.incremental,
     )
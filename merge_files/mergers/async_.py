@@ -1,25 +1,82 @@
 import asyncio
-import shutil
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 from merge_files.mergers.base import FileMerger
 
 
 class AsyncFileMerger(FileMerger):
-    async def _split_into_files(self) -> int:
+    """
+    Merges chunks of input files concurrently with asyncio. The blocking reads and writes of each
+    chunk run in a pool of threads, so the I/O of several chunks overlaps.
+
+    Args:
+        num_workers (int, optional): Maximum number of chunks processed at the same time.
+            It is lowered if the files of that many chunks would exceed the fan-in. Defaults to
+            the thread pool default of `concurrent.futures.ThreadPoolExecutor`.
+        **kwargs: Options of `FileMerger`.
+    """
+
+    def __init__(self, input_files: List[str], output_dir: str, filename: str = "output.txt",
+                 file_chunk_size: int = 1024, line_chunk_size: int = 1024,
+                 num_workers: Optional[int] = None, **kwargs) -> None:
+        super().__init__(input_files, output_dir, filename, file_chunk_size, line_chunk_size,
+                         **kwargs)
+        self.num_workers = num_workers
+
+    async def _create_intermediate(self, input_files: List[str], output_file: str) -> None:
+        """
+        Merges a subset of input files into a sorted intermediate file in a worker thread.
+
+        Args:
+            input_files (list): List of input file paths.
+            output_file (str): Path and filename of intermediate output file.
+        """
+        loop = asyncio.get_running_loop()
+        if self.profiler is None:
+            await loop.run_in_executor(None, self._write_intermediate, input_files, output_file)
+        else:
+            await loop.run_in_executor(None, self.profiler.profile_thread,
+                                       self._write_intermediate, input_files, output_file)
+
+    async def _split_into_files(self,
+                                chunks: Optional[List[List[str]]] = None) -> List[str]:
         """
         Creates intermediate files using asyncio.
 
+        Args:
+            chunks (List[List[str]], optional): The chunks of input files, see
+                `_divide_files_into_chunks`. Defaults to dividing the input files.
+
         Returns:
-        - list of chunks
+            List[str]: Paths of the intermediate files of the chunks.
         """
+        if chunks is None:
+            chunks = self._divide_files_into_chunks()
+        # The default executor bounds the number of chunks that are read at the same time, so
+        # the files they open together stay within the fan-in
+        num_workers = self.num_workers or min(32, (os.cpu_count() or 1) + 4)
+        max_workers = max(1, min(num_workers, self.fan_in // max(map(len, chunks), default=1)))
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers))
+
+        async def create_chunk(chunk: List[str], output_file: str, digest: Optional[str]) -> None:
+            await self._create_intermediate(chunk, output_file)
+            self._complete_chunk(digest, output_file)
+
         tasks = []
         output_chunks = []
-        for i in range(0, len(self.input_files), self.chunk_size_file):
-            chunk = self.input_files[i:i+self.chunk_size_file]
-            output_file_chunk = f"{self.temp_file}.{i//self.chunk_size_file}"
+        for i, chunk in enumerate(chunks):
+            output_file_chunk, digest = self._chunk_path(chunk, i)
             output_chunks.append(output_file_chunk)
-            task = asyncio.create_task(self._create_intermediate(chunk, output_file_chunk))
+            if self._chunk_completed(digest):
+                continue
+            task = asyncio.create_task(create_chunk(chunk, output_file_chunk, digest))
             tasks.append(task)
+        if len(tasks) < len(chunks):
+            print(f"Resuming: {len(chunks) - len(tasks)} of {len(chunks)} chunks were completed "
+                  "by a previous merge.")
+        # The executor runs the chunks in order as threads become idle, largest first
         await asyncio.gather(*tasks)
 
         return output_chunks
@@ -28,8 +85,18 @@ class AsyncFileMerger(FileMerger):
         """
         Merges all input files into a single sorted output file using asyncio.
         """
+        if self.archive_order:
+            self._merge_archives()
+            return
         try:
-            chunks = asyncio.run(self._split_into_files())
-            self._merge_intermediate_files(chunks, delete=True)
+            # The input files are looked up once for the chunks, the disk space and the progress
+            sizes = self._input_sizes()
+            chunks = self._divide_files_into_chunks(sizes)
+            self._check_disk_space(len(chunks), input_size=sum(sizes))
+            self._measure_input(sum(sizes))
+            with self.metrics.phase("intermediate"):
+                chunks = asyncio.run(self._split_into_files(chunks))
+            # Checkpointed chunks are kept until the merge succeeds
+            self._merge_intermediate_files(chunks, delete=self.manifest is None)
         finally:
-            shutil.rmtree(self.temp_dir)
+            self._remove_temp_dirs()
@@ -1,9 +1,49 @@
 import os
+import sys
 import heapq
+import io
 import itertools
+import locale
+import mmap
+import operator
+import stat
+import shutil
 import tempfile
-import concurrent.futures
-from typing import List
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import (IO, AnyStr, BinaryIO, Iterable, Iterator, List, Optional, Sequence,
+                    Tuple, Union)
+
+from merge_files.checkpoint import (MANIFEST_NAME, WORK_SUBDIR_SUFFIX, WorkManifest,
+                                    merge_settings)
+from merge_files.compression import (FAST_LEVELS, check_codec, codec_from_magic,
+                                     open_compressed)
+from merge_files.dedup import DEDUP_MODES, deduplicate
+from merge_files.keys import SortKey
+from merge_files.metrics import MergeMetrics
+from merge_files.planner import (balance_chunks, check_disk_space, estimate_spill_size,
+                                 max_fan_in, plan_merge_tree)
+from merge_files.profiling import Profiler
+from merge_files.runs import RUN_FORMATS, RunReader, is_run_header, open_run, write_run
+from merge_files.utils import ArchiveMember, iter_archive_members, open_archive_member
+
+
+# Buffer size of output files, lines are handed to them in large batches
+WRITE_BUFFER_SIZE = 1024 * 1024
+# Address space that memory maps of input files may use at once
+MMAP_ADDRESS_BUDGET = 2 ** 30 if sys.maxsize <= 2 ** 32 else 2 ** 46
+# Files with these extensions are never memory mapped, their bytes are not lines
+COMPRESSED_EXTENSIONS = (".gz", ".tgz", ".bz2", ".xz", ".zst", ".zip")
+READERS = ("buffered", "mmap")
+# Bytes of small archive members that are held in memory and merged into one run
+ARCHIVE_GROUP_BUDGET = 64 * 1024 * 1024
+# Number of input files from which their sizes are looked up in a pool of threads
+PARALLEL_STAT_THRESHOLD = 1024
+# Output directory that makes the merger write the output to the standard output
+STDOUT = "-"
+STDOUT_FILENO = 1
+# Number of words written to the standard output before it is first flushed
+FIRST_FLUSH_WORDS = 1024
 
 
 class FileMerger:
@@ -11,35 +51,301 @@ class FileMerger:
     Class for merging multiple text files into a single, sorted output file.
 
     Args:
-        input_files (List[str]): List of paths to input files.
-        output_dir (str): Path of output file.
+        input_files (List[Union[str, ArchiveMember]]): List of paths to input files or members
+            of archives. If `archive_order` is set, a list of paths to archives.
+        output_dir (str): Path of output file. If it is `STDOUT`, the output is written to the
+            standard output instead.
         filename (str, optional): Name of output file. Defaults to output.txt
         file_chunk_size (int, optional): Number of files to process at once. Defaults to 1024.
         line_chunk_size (int, optional): Number of lines to process at once. Defaults to 1024.
+            If None, as many lines as fit in the read buffer.
+        read_buffer_size (int, optional): Number of bytes read ahead from each file during the
+            final merge. Defaults to 65536.
+        dedup (str, optional): Deduplication strategy, one of "sorted", "exact", "bloom" or
+            "none". Defaults to "sorted".
+        bloom_capacity (int, optional): Expected number of distinct words for the "bloom"
+            strategy. Defaults to 1000000.
+        fan_in (int, optional): Maximum number of files a merge opens at once. Larger inputs are
+            merged in several passes. Defaults to a limit derived from the available file
+            descriptors and memory.
+        binary (bool, optional): Read and write bytes instead of decoded text, without the cost
+            of decoding and encoding every line. Lines only end at "\n" and only ASCII whitespace
+            is stripped, so the output differs from text mode for UTF-8 words that end in other
+            Unicode whitespace, such as U+00A0, or that contain a lone "\r". Defaults to False.
+        newline (str, optional): Line terminator of the written files. Defaults to os.linesep.
+        key (SortKey, optional): How lines are compared. Defaults to lexicographic order of the
+            whole line.
+        reader (str, optional): How input files are read. "buffered" reads through file objects,
+            "mmap" memory maps regular files and splits them into lines in large slices, and
+            falls back to "buffered" for other files. Defaults to "buffered".
+        archive_order (bool, optional): Read every archive in `input_files` in a single
+            sequential pass, which is the only efficient way to read a compressed tar archive.
+            Defaults to False.
+        output_compression (str, optional): Codec of the output file, one of "none", "gzip",
+            "bz2", "xz" or "zstd". Defaults to "none". Compressed input files are detected by
+            their magic number and decompressed transparently.
+        compression_level (int, optional): Compression level of the output file. Defaults to
+            the codec default.
+        temp_compression (str, optional): Codec of the intermediate files, which are written
+            at the fastest level of the codec. Defaults to "none", which compresses the blocks of
+            "block" runs with deflate and leaves "text" runs uncompressed.
+        run_format (str, optional): Format of the intermediate files. "block" writes words in
+            compressed blocks with a block index, "text" writes one word per line for debugging.
+            Defaults to "block".
+        temp_dirs (List[str], optional): Directories for intermediate files. Intermediate files
+            are spread round-robin over them, so several disks are written in parallel. Defaults
+            to the system temporary directory.
+        metrics (MergeMetrics, optional): Collects the phase timings and counters of the merge
+            and reports them to its callbacks. Defaults to metrics without callbacks.
+        profiler (Profiler, optional): Profiles the tasks of worker threads and processes, in
+            addition to the phases it follows as a callback of `metrics`. Defaults to no
+            profiling.
+        work_dir (str, optional): A persistent directory for intermediate files, instead of
+            `temp_dirs`. They are written to a "<filename>.work" subdirectory that the merger
+            owns, other files in `work_dir` are never touched. The chunks merged into
+            intermediate files are recorded in a manifest, see `WorkManifest`, and their files
+            are kept if the merge fails. Defaults to temporary directories that are always
+            removed.
+        resume (bool, optional): Skip the chunks that the manifest in `work_dir` records as
+            completed by a previous merge with unchanged input files. Defaults to False.
+        previous_output (str, optional): A sorted file, such as the output of a previous merge,
+            that is merged with the input files as one more run in the final merge and is never
+            deleted. Defaults to none.
         use_parallel (bool, optional): Use multiprocessing for merging operations. Defaults to False.
         num_processes (int, optional): Number of processes to use. Defaults to 4.
     """
 
-    def __init__(self, input_files: List[str], output_dir: str, filename: str = "output.txt",
-                 file_chunk_size: int = 1024, line_chunk_size: int = 1024) -> None:
+    def __init__(self, input_files: List[Union[str, ArchiveMember]], output_dir: str,
+                 filename: str = "output.txt", file_chunk_size: int = 1024,
+                 line_chunk_size: Optional[int] = 1024, read_buffer_size: int = 64 * 1024,
+                 dedup: str = "sorted", bloom_capacity: int = 1_000_000,
+                 fan_in: Optional[int] = None, binary: bool = False,
+                 newline: Optional[str] = None, key: Optional[SortKey] = None,
+                 reader: str = "buffered", archive_order: bool = False,
+                 output_compression: str = "none", compression_level: Optional[int] = None,
+                 temp_compression: str = "none", run_format: str = "block",
+                 temp_dirs: Optional[List[str]] = None,
+                 metrics: Optional[MergeMetrics] = None,
+                 profiler: Optional[Profiler] = None, work_dir: Optional[str] = None,
+                 resume: bool = False, previous_output: Optional[str] = None) -> None:
+        if fan_in is not None and fan_in < 2:
+            raise ValueError(f"Fan-in must be at least 2: {fan_in}")
+        if reader not in READERS:
+            raise ValueError(f"Unsupported reader: {reader}. Choose one of {READERS}")
+        if dedup not in DEDUP_MODES:
+            raise ValueError(
+                f"Unsupported deduplication mode: {dedup}. Choose one of {DEDUP_MODES}")
+        if run_format not in RUN_FORMATS:
+            raise ValueError(f"Unsupported run format: {run_format}. Choose one of {RUN_FORMATS}")
+        if resume and work_dir is None:
+            raise ValueError("A merge can only be resumed from a work directory.")
+        if work_dir is not None and temp_dirs:
+            raise ValueError("Intermediate files are kept in the work directory, temporary "
+                             "directories cannot be given as well.")
+        check_codec(output_compression)
+        check_codec(temp_compression)
         self.input_files = input_files
         self.output_dir = output_dir
         self.filename = filename
-        self.temp_dir = tempfile.mkdtemp()
+        # A private directory is created in every temporary directory, the first one also
+        # holds files that are not striped
+        if work_dir is not None:
+            work_dir = os.path.join(work_dir, filename + WORK_SUBDIR_SUFFIX)
+            self.temp_dirs = [work_dir]
+        else:
+            self.temp_dirs = [tempfile.mkdtemp(dir=temp_dir) for temp_dir in temp_dirs or [None]]
+        self.temp_dir = self.temp_dirs[0]
         self.temp_file = os.path.join(self.temp_dir, self.filename)
-        self.output_file = os.path.join(self.output_dir, self.filename)
+        self.output_file = STDOUT if output_dir == STDOUT else os.path.join(output_dir, filename)
         self.chunk_size_file = file_chunk_size
         self.chunk_size_line = line_chunk_size
+        self.read_buffer_size = read_buffer_size
+        self.dedup = dedup
+        self.bloom_capacity = bloom_capacity
+        self.fan_in = fan_in or max_fan_in(read_buffer_size)
+        self.binary = binary
+        self.newline = os.linesep if newline is None else newline
+        self.key = key
+        self.reverse = key is not None and key.reverse
+        # Words are decorated with their keys only if those differ from the words
+        self.keyed = key is not None and not key.is_identity
+        self.reader = reader
+        self.archive_order = archive_order
+        self.output_compression = output_compression
+        self.compression_level = compression_level
+        self.temp_compression = temp_compression
+        self.run_format = run_format
+        self.encoding = locale.getpreferredencoding(False)
+        self.metrics = metrics or MergeMetrics()
+        self.profiler = profiler
+        self.previous_output = previous_output
+        self.work_dir = work_dir
+        self.manifest = None
+        if work_dir is not None:
+            self.manifest = WorkManifest(work_dir, self._checkpoint_settings(), resume)
+
+    def _temp_path(self, suffix: str, stripe: int) -> str:
+        """
+        Returns the path of an intermediate file, spreading files round-robin over the
+        temporary directories.
+
+        Args:
+            suffix (str): Suffix appended to the output file name.
+            stripe (int): Sequence number of the file, which selects its directory.
+        """
+        temp_dir = self.temp_dirs[stripe % len(self.temp_dirs)]
+        return os.path.join(temp_dir, self.filename + suffix)
+
+    def _checkpoint_settings(self) -> dict:
+        """
+        Returns the options that the content of the intermediate files depends on. A merge is
+        only resumed from a manifest written with the same settings.
+        """
+        return merge_settings(self.dedup, self.key, filename=self.filename, binary=self.binary,
+                              run_format=self.run_format, temp_compression=self.temp_compression)
+
+    def _chunk_path(self, input_files: Sequence[Union[str, ArchiveMember]],
+                    i: int) -> Tuple[str, Optional[str]]:
+        """
+        Returns the path of the intermediate file of a chunk. In a work directory, it is named
+        after the digest of the input files of the chunk, so a resumed merge finds it again even
+        if the chunks are numbered differently.
+
+        Args:
+            input_files (Sequence[Union[str, ArchiveMember]]): The input files of the chunk.
+            i (int): The number of the chunk.
+
+        Returns:
+            Tuple[str, Optional[str]]: The path, and the digest of the chunk if its completion
+            is recorded in the manifest.
+        """
+        if self.manifest is None:
+            return self._temp_path(f".{i}", i), None
+        digest = self.manifest.chunk_digest(input_files)
+        return self._temp_path(f".{digest[:16]}", 0), digest
+
+    def _chunk_completed(self, digest: Optional[str]) -> bool:
+        """
+        Checks whether a previous merge completed a chunk.
+
+        Args:
+            digest (str, optional): The digest of the chunk, see `_chunk_path`.
+        """
+        return digest is not None and self.manifest.completed(digest)
+
+    def _complete_chunk(self, digest: Optional[str], output_file: str) -> None:
+        """
+        Records in the manifest that the intermediate file of a chunk is complete.
+
+        Args:
+            digest (str, optional): The digest of the chunk, see `_chunk_path`.
+            output_file (str): Path of the intermediate file.
+        """
+        if digest is not None:
+            self.manifest.record(digest, output_file)
+
+    def _remove_temp_dirs(self) -> None:
+        """
+        Removes the temporary directories with all remaining intermediate files. In a work
+        directory, the intermediate files of the chunks that the manifest lists are kept, so a
+        failed merge can be resumed.
+        """
+        with self.metrics.phase("cleanup"):
+            if self.manifest is None or not self.manifest.chunks:
+                for temp_dir in self.temp_dirs:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+                return
+            # The subdirectory only holds files of the merger. Files of unfinished chunks,
+            # merge passes and key ranges are not resumed
+            kept = {MANIFEST_NAME, *self.manifest.chunks.values()}
+            for name in os.listdir(self.work_dir):
+                if name not in kept:
+                    os.remove(os.path.join(self.work_dir, name))
+            print(f"Kept {len(self.manifest.chunks)} completed chunks in {self.work_dir}, "
+                  "the merge can be resumed.")
+
+    def _measure_input(self, input_size: Optional[int] = None) -> None:
+        """
+        Sets the size of the input files as the total that the progress of the merge is
+        measured against, if the metrics are reported.
+
+        Args:
+            input_size (int, optional): The total size of the input files, if it is known.
+                Defaults to looking it up.
+        """
+        if self.metrics.enabled and self.metrics.total_bytes is None:
+            if input_size is None:
+                input_size = sum(map(self._file_size, self.input_files))
+            self.metrics.total_bytes = input_size
+            if self.previous_output is not None:
+                self.metrics.total_bytes += self._file_size(self.previous_output)
+
+    def _check_disk_space(self, num_runs: int, intermediate: bool = True,
+                          input_size: Optional[int] = None) -> None:
+        """
+        Checks before merging that the temporary directories have room for the intermediate
+        files, estimated from the sizes of the input files.
+
+        Args:
+            num_runs (int): Number of sorted runs that the final merges start from.
+            intermediate (bool): Whether the input files are first merged into intermediate
+                files.
+            input_size (int, optional): The total size of the input files, if it is known.
+                Defaults to looking it up.
+
+        Raises:
+            OSError: If a temporary directory does not have enough free space.
+        """
+        if input_size is None:
+            input_size = sum(map(self._file_size, self.input_files))
+        spill_size = estimate_spill_size(input_size, num_runs, self.fan_in, intermediate)
+        if spill_size:
+            check_disk_space(self.temp_dirs, spill_size)
+
+    def _input_sizes(self) -> List[int]:
+        """
+        Returns the sizes of the input files in bytes, see `_file_size`.
+        """
+        if len(self.input_files) < PARALLEL_STAT_THRESHOLD:
+            return [self._file_size(file) for file in self.input_files]
+        # The sizes of many files are looked up in threads, which overlaps the latency of
+        # network file systems
+        with ThreadPoolExecutor() as pool:
+            return list(pool.map(self._file_size, self.input_files))
+
+    def _divide_indices_into_chunks(self,
+                                    sizes: Optional[List[int]] = None) -> List[Sequence[int]]:
+        """
+        Divides the indices of the input files into chunks for processing. A chunk never holds
+        more files than the fan-in, since all of its files are opened at once. The chunks are
+        balanced by the size of their files, so that a chunk of large files does not finish
+        long after the others, and the largest chunks come first.
+
+        Args:
+            sizes (List[int], optional): The `_input_sizes`, if they are known. Defaults to
+                looking them up.
+
+        Returns:
+            List[Sequence[int]]: The indices in `input_files` of the files of each chunk.
+        """
+        chunk_size = min(self.chunk_size_file, self.fan_in)
+        if sizes is None:
+            sizes = self._input_sizes()
+        return balance_chunks(sizes, chunk_size)
 
-    def _divide_files_into_chunks(self) -> List[List[str]]:
+    def _divide_files_into_chunks(self, sizes: Optional[List[int]] = None) -> List[List[str]]:
         """
         Divides input files into chunks for processing.
 
+        Args:
+            sizes (List[int], optional): The `_input_sizes`, if they are known. Defaults to
+                looking them up.
+
         Returns:
             list: List of lists, where each inner list contains a subset of input files.
         """
-        return [self.input_files[i:i+self.chunk_size_file]
-                for i in range(0, len(self.input_files), self.chunk_size_file)]
+        return [[self.input_files[i] for i in chunk]
+                for chunk in self._divide_indices_into_chunks(sizes)]
 
     async def _create_intermediate(self, input_files: List[str], output_file: str) -> None:
         """
@@ -49,70 +355,535 @@ class FileMerger:
             input_files (list): List of input file paths.
             output_file (str): Path and filename of intermediate output file.
         """
-        # Open all input files and create iterators for their contents
-        input_handles = [open(file) for file in input_files]
-        input_iters = [iter(handle) for handle in input_handles]
+        self._write_intermediate(input_files, output_file)
 
-        with open(output_file, "w") as output_handle:
+    def _write_intermediate(self, input_files: List[str], output_file: str) -> None:
+        """
+        Merges a subset of input files into a sorted intermediate file. This is the blocking
+        part of `_create_intermediate`.
 
-            # Merge sorted lists of words from input files in chunks
-            while True:
-                # Get next chunk of words from input files
-                chunks = [list(itertools.islice(iter, self.chunk_size_line))
-                          for iter in input_iters]
+        The files are streamed through a single k-way merge, so the intermediate file is one
+        globally sorted run. At most `chunk_size_line` lines of each file are buffered at once.
 
-                # Check if all chunks are empty
-                if all(not chunk for chunk in chunks):
-                    break
+        Args:
+            input_files (list): List of input file paths.
+            output_file (str): Path and filename of intermediate output file.
+        """
+        # Create lazy iterators for the contents of all input files
+        input_iters = [self._read_lines(file, max_lines=self.chunk_size_line)
+                       for file in input_files]
+        self._merge_streams(input_iters, output_file)
 
-                # Merge sorted chunks of words
-                sorted_chunk = heapq.merge(*chunks)
+        print(f"Created intermediate file in {output_file}")
 
-                written_words = set()
-                for word in sorted_chunk:
-                    word = word.strip()
-                    if word not in written_words:
-                        output_handle.write(word + "\n")
-                        written_words.add(word)
+    def _deduplicate(self, words: Iterable[str]) -> Iterable[str]:
+        """
+        Removes duplicate words from a stream with the configured deduplication strategy.
 
-        print(f"Created intermediate file in {output_file}")
-        for handle in input_handles:
-            handle.close()
+        Args:
+            words (Iterable[str]): Stripped words in merge order.
+        """
+        return deduplicate(words, self.dedup, bloom_capacity=self.bloom_capacity)
+
+    def _open_input(self, file_path: Union[str, ArchiveMember]) -> IO:
+        """
+        Opens a file or an archive member for reading with a buffer of `read_buffer_size`
+        bytes, in binary mode if `binary` is set. Compressed files are detected by their magic
+        number and decompressed while they are read. Runs in the block format are detected the
+        same way and returned as a `RunReader`.
+
+        Args:
+            file_path (Union[str, ArchiveMember]): Path of the file or the member to open.
+        """
+        if isinstance(file_path, ArchiveMember):
+            return self._wrap_input(self._decompress_member(
+                open_archive_member(file_path, self.read_buffer_size)))
+        stream = open(file_path, "rb", buffering=self.read_buffer_size)
+        # The magic number is peeked from the read buffer, plain files are not opened twice
+        head = stream.peek(8)[:8]
+        if is_run_header(head):
+            return RunReader(stream)
+        codec = codec_from_magic(head)
+        if codec != "none":
+            stream.close()
+            stream = open_compressed(file_path, "rb", codec, buffering=self.read_buffer_size)
+        return self._wrap_input(stream)
+
+    def _decompress_member(self, stream: IO[bytes]) -> IO[bytes]:
+        """
+        Decompresses an archive member, such as a .gz file inside a .tar archive, if its magic
+        number shows that it is compressed.
+
+        Args:
+            stream (IO[bytes]): A binary stream of the member. It is closed with the returned
+                stream.
+        """
+        if not hasattr(stream, "peek"):
+            stream = io.BufferedReader(stream, self.read_buffer_size)
+        codec = codec_from_magic(stream.peek(8)[:8])
+        if codec == "none":
+            return stream
+        return open_compressed(stream, "rb", codec, buffering=self.read_buffer_size,
+                               close_stream=True)
+
+    def _wrap_input(self, stream: IO[bytes]) -> IO:
+        """
+        Decodes a binary stream unless `binary` is set.
+
+        Args:
+            stream (IO[bytes]): A binary stream, such as an archive member.
+        """
+        return stream if self.binary else io.TextIOWrapper(stream, encoding=self.encoding)
 
-    def file_handle_generator(self, file_paths):
-        for file_path in file_paths:
-            yield file_path
+    def _file_size(self, file_path: Union[str, ArchiveMember]) -> int:
+        """
+        Returns the size of a file or the uncompressed size of an archive member in bytes.
+
+        Args:
+            file_path (Union[str, ArchiveMember]): Path of the file or the member.
+        """
+        if isinstance(file_path, ArchiveMember):
+            return file_path.size
+        return os.path.getsize(file_path)
+
+    def _open_output(self, file_path: str, final: bool = False) -> IO:
+        """
+        Opens a file for writing with a large buffer, in binary mode if `binary` is set. Line
+        terminators are written as they are given. The output file is compressed with
+        `output_compression`, and intermediate files with `temp_compression` at its fastest
+        level.
+
+        Args:
+            file_path (str): Path of the file to open.
+            final (bool, optional): Whether the file is (a part of) the output file. Defaults to
+                False.
+        """
+        if final:
+            codec, level = self.output_compression, self.compression_level
+        else:
+            codec, level = self.temp_compression, FAST_LEVELS.get(self.temp_compression)
+        if file_path == STDOUT:
+            stream = open_compressed(self._open_stdout(), "wb", codec, level, WRITE_BUFFER_SIZE)
+        elif codec == "none":
+            if self.binary:
+                return open(file_path, "wb", buffering=WRITE_BUFFER_SIZE)
+            return open(file_path, "w", buffering=WRITE_BUFFER_SIZE, newline="")
+        else:
+            stream = open_compressed(file_path, "wb", codec, level, WRITE_BUFFER_SIZE)
+        return stream if self.binary else io.TextIOWrapper(stream, self.encoding, newline="")
 
-    def _merge_file(self, file_path):
-        with open(file_path, "r") as f:
-            return f.readlines()
+    @staticmethod
+    def _open_stdout() -> BinaryIO:
+        """
+        Opens the standard output for writing bytes without a buffer. The descriptor is written
+        directly, so the output is not mixed with messages printed through `sys.stdout`, and it
+        is left open when the returned stream is closed.
+        """
+        return open(STDOUT_FILENO, "wb", buffering=0, closefd=False)
+
+    def _write_lines(self, handle: IO, words: Iterable[AnyStr]) -> None:
+        """
+        Writes words to a file opened with `_open_output`, each one followed by `newline`.
+
+        Args:
+            handle (IO): The output file.
+            words (Iterable[AnyStr]): Stripped words, bytes in binary mode.
+        """
+        newline = self.newline.encode() if self.binary else self.newline
+        # Concatenation and writing run in C, without a Python level loop per line
+        handle.writelines(map(type(newline).__add__, words, itertools.repeat(newline)))
+
+    def _normalize(self, lines: Iterable[AnyStr]) -> Iterator[AnyStr]:
+        """
+        Turns raw lines into the words that are compared and written, by stripping surrounding
+        whitespace and the line terminator. Text lines are stripped of Unicode whitespace, lines
+        in binary mode only of ASCII whitespace.
+
+        Args:
+            lines (Iterable[AnyStr]): Raw lines, bytes in binary mode.
+        """
+        return map(bytes.strip if self.binary else str.strip, lines)
+
+    def _decorate(self, words: Iterable[AnyStr]) -> Iterable:
+        """
+        Pairs a batch of words with their sort keys, if a key other than the word itself is
+        configured. The keys are extracted once, so the heap compares ready made keys.
+
+        Args:
+            words (Iterable[AnyStr]): A batch of normalized words.
+        """
+        if not self.keyed:
+            return words
+        words = list(words)
+        return zip(self.key.extract(words, self.binary), words)
+
+    def _undecorate(self, items: Iterable) -> Iterable[AnyStr]:
+        """
+        Drops the sort keys added by `_decorate`.
+
+        Args:
+            items (Iterable): Words or pairs of keys and words.
+        """
+        return map(operator.itemgetter(1), items) if self.keyed else items
+
+    def file_handle_generator(self, file_paths: Iterable[Union[str, ArchiveMember]]
+                              ) -> Iterator[Iterator[AnyStr]]:
+        """
+        Lazily yields a stream of the normalized lines of every file, see `_read_lines`.
+
+        Deprecated: the mergers read their files with `_read_lines` and no longer call it.
+
+        Args:
+            file_paths (Iterable[Union[str, ArchiveMember]]): Paths of the files or the members.
+        """
+        warnings.warn("FileMerger.file_handle_generator is deprecated, the files are read "
+                      "lazily by the mergers.", DeprecationWarning, stacklevel=2)
+        return map(self._read_lines, file_paths)
+
+    def _read_lines(self, file_path: Union[str, ArchiveMember], offset: int = 0,
+                    max_lines: Optional[int] = None) -> Iterator[AnyStr]:
+        """
+        Lazily yields the normalized lines of a file, keeping at most about `read_buffer_size`
+        bytes of it in memory at any given time. Every line is normalized exactly once here, so
+        the merges compare the words directly. If a sort key is configured, the lines are
+        yielded as pairs of keys and words.
+
+        Args:
+            file_path (Union[str, ArchiveMember]): Path of the file or the member to read.
+            offset (int, optional): Byte offset of the line to start reading from. Defaults to 0.
+            max_lines (int, optional): Maximum number of lines read at once. Defaults to as many
+                lines as fit in `read_buffer_size`. Memory mapped files are always read in
+                slices of `read_buffer_size` bytes.
+        """
+        if self.reader == "mmap" and self._can_mmap(file_path):
+            yield from self._read_lines_mmap(file_path, offset)
+            return
+
+        with self._open_input(file_path) as f:
+            if isinstance(f, RunReader):
+                yield from self._read_run(f)
+                return
+            if offset:
+                f.seek(offset)
+            yield from self._read_handle(f, max_lines)
+
+    def _read_handle(self, handle: IO, max_lines: Optional[int] = None) -> Iterator[AnyStr]:
+        """
+        Lazily yields the normalized lines of an open file, see `_read_lines`.
+
+        Args:
+            handle (IO): A file opened with `_open_input` or wrapped with `_wrap_input`.
+            max_lines (int, optional): Maximum number of lines read at once. Defaults to as many
+                lines as fit in `read_buffer_size`.
+        """
+        while True:
+            if max_lines is None:
+                lines = handle.readlines(self.read_buffer_size)
+            else:
+                lines = list(itertools.islice(handle, max_lines))
+            if not lines:
+                break
+            self.metrics.add(lines_read=len(lines), bytes_read=sum(map(len, lines)))
+            yield from self._decorate(self._normalize(lines))
+
+    def _read_run(self, reader: RunReader, low: Optional[bytes] = None) -> Iterator[AnyStr]:
+        """
+        Lazily yields the words of a run in the block format, one block at a time. The words
+        are stored normalized, so they are only decoded.
+
+        Args:
+            reader (RunReader): The open run.
+            low (bytes, optional): Skip the words less than this key. Defaults to reading all
+                words.
+        """
+        for words in reader.blocks(low):
+            # Words are stored without their line terminators
+            self.metrics.add(lines_read=len(words), bytes_read=sum(map(len, words)) + len(words))
+            if not self.binary:
+                words = map(bytes.decode, words, itertools.repeat(self.encoding))
+            yield from self._decorate(words)
+
+    def _read_run_file(self, file_path: str, low: Optional[bytes] = None) -> Iterator[AnyStr]:
+        """
+        Lazily yields the words of a run file in the block format, see `_read_run`.
+
+        Args:
+            file_path (str): Path of the run file.
+            low (bytes, optional): Skip the words less than this key. Defaults to reading all
+                words.
+        """
+        with open_run(file_path, self.read_buffer_size) as reader:
+            yield from self._read_run(reader, low)
+
+    def _can_mmap(self, file_path: Union[str, ArchiveMember]) -> bool:
+        """
+        Checks whether a file can be memory mapped: it must be a non-empty regular file that is
+        not compressed, not a run in the block format and fits into its share of the address
+        space budget. Archive members are never memory mapped.
+
+        Args:
+            file_path (Union[str, ArchiveMember]): Path of the file or the member.
+        """
+        if isinstance(file_path, ArchiveMember):
+            return False
+        if file_path.lower().endswith(COMPRESSED_EXTENSIONS):
+            return False
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return False
+        if not (stat.S_ISREG(file_stat.st_mode)
+                and 0 < file_stat.st_size <= MMAP_ADDRESS_BUDGET // self.fan_in):
+            return False
+        # Only regular files are probed for a magic number, reading a pipe would consume it
+        with open(file_path, "rb") as f:
+            head = f.read(8)
+        return codec_from_magic(head) == "none" and not is_run_header(head)
+
+    def _read_lines_mmap(self, file_path: str, offset: int = 0) -> Iterator[AnyStr]:
+        """
+        Lazily yields the normalized lines of a memory mapped file. The file is cut into slices
+        of about `read_buffer_size` bytes at line boundaries, and each slice is split into lines
+        at once, without a file object call per line.
+
+        Args:
+            file_path (str): Path of a file accepted by `_can_mmap`.
+            offset (int, optional): Byte offset of the line to start reading from. Defaults to 0.
+        """
+        # The map holds a duplicate of the descriptor, so the file is closed at once to keep a
+        # single descriptor per input file
+        with open(file_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with mapped:
+            size = len(mapped)
+            position = offset
+            while position < size:
+                end = mapped.find(b"\n", min(position + self.read_buffer_size, size) - 1)
+                end = size if end == -1 else end + 1
+                lines = mapped[position:end].split(b"\n")
+                if lines[-1] == b"":
+                    lines.pop()
+                self.metrics.add(lines_read=len(lines), bytes_read=end - position)
+                position = end
+                if not self.binary:
+                    lines = map(bytes.decode, lines, itertools.repeat(self.encoding))
+                yield from self._decorate(self._normalize(lines))
+
+    def _merge_runs(self, file_paths: List[str], output_file: str, final: bool = False) -> None:
+        """
+        Streams sorted files through a k-way merge into a single sorted file.
+
+        Args:
+            file_paths (List[str]): A list of file paths to merge.
+            output_file (str): Path of the merged file.
+            final (bool, optional): Whether the merged file is the output file. Defaults to False.
+        """
+        self._merge_streams([self._read_lines(file_path) for file_path in file_paths],
+                            output_file, final)
+
+    def _merge_streams(self, file_contents: List[Iterable[AnyStr]], output_file: str,
+                       final: bool = False) -> None:
+        """
+        Merges sorted streams of words, removes duplicates and writes the result to a file.
+        Intermediate files are written in the block format of `write_run`, unless `run_format`
+        is "text". The words written and the duplicates dropped are counted in `metrics`.
+
+        Args:
+            file_contents (List[Iterable[AnyStr]]): Sorted streams of normalized words, or of
+                pairs of keys and words if a sort key is configured.
+            output_file (str): Path of the merged file.
+            final (bool, optional): Whether the merged file is (a part of) the output file.
+                Defaults to False.
+        """
+        self.metrics.observe_heap(len(file_contents))
+        sorted_words = self._undecorate(heapq.merge(*file_contents, reverse=self.reverse))
+        merged = None
+        if self.dedup != "none":
+            sorted_words, merged = _count_items(sorted_words)
+        words, written = _count_items(self._deduplicate(sorted_words))
+        final = final or output_file == self.output_file
+        if not final and self.run_format == "block":
+            if not self.binary:
+                words = map(str.encode, words, itertools.repeat(self.encoding))
+            codec = "gzip" if self.temp_compression == "none" else self.temp_compression
+            write_run(output_file, words, codec, block_size=self.read_buffer_size)
+        else:
+            with self._open_output(output_file, final) as output_handle:
+                if output_file == STDOUT:
+                    # The first words are flushed at once, so the next command of a pipeline
+                    # starts while the rest is written in large buffers
+                    words = iter(words)
+                    self._write_lines(output_handle, itertools.islice(words, FIRST_FLUSH_WORDS))
+                    output_handle.flush()
+                self._write_lines(output_handle, words)
+        lines_written = next(written)
+        duplicates = 0 if merged is None else next(merged) - lines_written
+        self.metrics.add(lines_written=lines_written, duplicates_dropped=duplicates)
+        # The number of bytes written to the standard output is not known
+        if output_file != STDOUT:
+            self.metrics.add(bytes_written=os.path.getsize(output_file))
+
+    def _run_merge_pass(self, merges: List[Tuple[List[str], str]]) -> None:
+        """
+        Executes the independent merges of one level of the merge tree.
+
+        Args:
+            merges (List[Tuple[List[str], str]]): Pairs of files to merge and their output file.
+        """
+        for file_paths, output_file in merges:
+            self._merge_runs(file_paths, output_file)
+
+    def _reduce_runs(self, file_paths: List[str], delete: bool = False) -> List[str]:
+        """
+        Merges the files level by level along the tree of `plan_merge_tree` until at most
+        `fan_in` of them are left. Files created by a level are deleted once they have been
+        merged by the next one.
+
+        Args:
+            file_paths (List[str]): A list of file paths to merge.
+            delete (bool): Whether delete files in file_paths once they have been merged
+
+        Returns:
+            List[str]: The files left for the final merge.
+        """
+        runs = list(file_paths)
+        removable = set(file_paths) - {self.previous_output} if delete else set()
+        merged = set()
+        tree = plan_merge_tree([self._file_size(run) for run in runs], self.fan_in)
+        for level, groups in enumerate(tree):
+            print(f"Merging {sum(map(len, groups))} files in pass {level + 1} of {len(tree)}..")
+            merges = []
+            for group in groups:
+                output_file = self._temp_path(f".pass{level}.{len(runs)}", len(runs))
+                merges.append(([runs[run] for run in group], output_file))
+                removable.add(output_file)
+                runs.append(output_file)
+                merged.update(group)
+            self._run_merge_pass(merges)
+            for group_files, _ in merges:
+                for file_path in group_files:
+                    if file_path in removable:
+                        os.remove(file_path)
+        return [run for i, run in enumerate(runs) if i not in merged]
+
+    def _merge_final(self, file_paths: List[str]) -> None:
+        """
+        Merges the files left after the merge passes into the output file.
+
+        Args:
+            file_paths (List[str]): At most `fan_in` sorted files.
+        """
+        self._merge_runs(file_paths, self.output_file, final=True)
 
     def _merge_intermediate_files(self, file_paths: List[str], delete: bool = False) -> None:
         """
         Merges the intermediate files into the final output file.
 
+        The files are streamed into the k-way merge, so the peak memory usage depends on the
+        number of files and `read_buffer_size` rather than on the total size of the files. If
+        there are more files than the fan-in, they are first merged in several passes. The
+        previous output, if any, is merged as one more file.
+
         Args:
             file_paths (List[str]): A list of file paths to merge.
             delete (bool): Whether delete files in file_paths or not
         """
-        written_words = set()
-
-        with open(self.output_file, "w") as output_handle:
-            print("Started to merge intermediate files..")
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                file_contents = list(executor.map(
-                    self._merge_file, self.file_handle_generator(file_paths)))
-            sorted_lines = heapq.merge(*file_contents, key=lambda x: x.strip())
-            for word in sorted_lines:
-                word = word.strip()
-                if word not in written_words:
-                    output_handle.write(word + "\n")
-                    written_words.add(word)
+        print("Started to merge intermediate files..")
+        if self.previous_output is not None:
+            # The runs are reduced smallest first, so a large previous output is only read once,
+            # by the final merge
+            file_paths = [*file_paths, self.previous_output]
+        with self.metrics.phase("merge_passes"):
+            remaining = self._reduce_runs(file_paths, delete)
+        with self.metrics.phase("final_merge"):
+            self._merge_final(remaining)
 
+        with self.metrics.phase("cleanup"):
             if delete:
-                for file_path in file_paths:
+                for file_path in set(remaining) - {self.previous_output}:
                     os.remove(file_path)
+            else:
+                # Only the files created by the merge passes are temporary
+                for file_path in set(remaining) - set(file_paths):
+                    os.remove(file_path)
+            if self.manifest is not None:
+                # The merge succeeded, the checkpointed chunks are no longer needed
+                self.manifest.remove()
         print("Intermediate files have been merged.")
 
+    def _split_archive(self, archive: str, suffix: str) -> List[str]:
+        """
+        Reads the members of an archive in a single sequential pass and merges them into sorted
+        runs, so a compressed archive is decompressed exactly once.
+
+        Consecutive small members are held in memory until `chunk_size_file` of them or
+        `ARCHIVE_GROUP_BUDGET` bytes are collected, and are then merged into one run. A larger
+        member is streamed straight into a run of its own.
+
+        Args:
+            archive (str): Path of the archive.
+            suffix (str): Suffix of the names of the runs, see `_temp_path`.
+
+        Returns:
+            List[str]: Paths of the sorted runs.
+        """
+        runs = []
+        group, group_size = [], 0
+
+        def flush() -> None:
+            nonlocal group, group_size
+            if group:
+                runs.append(self._temp_path(f"{suffix}.{len(runs)}", len(runs)))
+                self._merge_streams(group, runs[-1])
+                print(f"Created intermediate file in {runs[-1]}")
+            group, group_size = [], 0
+
+        for member, stream in iter_archive_members(archive):
+            stream = self._wrap_input(self._decompress_member(stream))
+            if member.size > ARCHIVE_GROUP_BUDGET:
+                flush()
+                group = [self._read_handle(stream, self.chunk_size_line)]
+                flush()
+                continue
+            if len(group) >= min(self.chunk_size_file, self.fan_in) or \
+                    group_size + member.size > ARCHIVE_GROUP_BUDGET:
+                flush()
+            group.append(list(self._read_handle(stream)))
+            group_size += member.size
+        flush()
+        return runs
+
+    def _merge_archives(self) -> None:
+        """
+        Merges the archives in `input_files` into the output file, reading each one in archive
+        order.
+        """
+        try:
+            self._check_disk_space(num_runs=1)
+            self._measure_input()
+            runs = []
+            with self.metrics.phase("extraction"):
+                for i, archive in enumerate(self.input_files):
+                    runs.extend(self._split_archive(archive, f".{i}"))
+            self._merge_intermediate_files(runs, delete=True)
+        finally:
+            self._remove_temp_dirs()
+
     def merge_files(self) -> None:
         raise NotImplementedError("Subclasses should implement this method.")
+
+
+def _count_items(items: Iterable) -> Tuple[Iterator, Iterator[int]]:
+    """
+    Counts the items of a stream as they pass, without Python code per item.
+
+    Args:
+        items (Iterable): The stream.
+
+    Returns:
+        Tuple[Iterator, Iterator[int]]: The stream, and a counter whose next value is the number
+        of items that have passed.
+    """
+    counter = itertools.count()
+    # zip takes an item before it advances the counter, so the counter stops at the item count
+    return map(operator.itemgetter(0), zip(items, counter)), counter
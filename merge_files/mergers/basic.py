@@ -6,4 +6,13 @@ class BasicFileMerger(FileMerger):
         """
         Merges all input files into a single sorted output file without splitting into chunks.
         """
-        self._merge_intermediate_files(self.input_files)
+        if self.archive_order:
+            self._merge_archives()
+            return
+        try:
+            self._measure_input()
+            if len(self.input_files) > self.fan_in:
+                self._check_disk_space(len(self.input_files), intermediate=False)
+            self._merge_intermediate_files(self.input_files)
+        finally:
+            self._remove_temp_dirs()
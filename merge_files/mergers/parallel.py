@@ -1,53 +1,294 @@
-import asyncio
+import contextlib
+import io
+import itertools
 import multiprocessing
+import multiprocessing.pool
+import os
 import shutil
-from typing import List
+import time
+from typing import AnyStr, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from merge_files.mergers.base import FileMerger
+from merge_files.compression import detect_codec
+from merge_files.mergers.base import STDOUT, WRITE_BUFFER_SIZE, FileMerger
+from merge_files.metrics import MergeMetrics
+from merge_files.partition import choose_split_keys, find_line_offset, sample_keys
+from merge_files.profiling import ProfileData
+from merge_files.runs import is_run_file, sample_run_keys
+
+
+# The merger of a worker process, sent once by the pool initializer instead of with every task
+_worker_merger: Optional["ParallelFileMerger"] = None
+# The seconds, the process id, the counters and the profile, if any, of a task run in a worker
+# process
+TaskResult = Tuple[float, int, Dict[str, int], Optional[ProfileData]]
+
+
+def _init_worker(merger: "ParallelFileMerger") -> None:
+    """
+    Initializes a worker process of the pool with the state shared by all of its tasks.
+
+    Args:
+        merger (ParallelFileMerger): The merger, including the full list of input files.
+    """
+    global _worker_merger
+    _worker_merger = merger
+
+
+def _run_task(method: str, *args) -> TaskResult:
+    """
+    Runs a method of the worker merger and measures it, and profiles it if the merger has a
+    profiler.
+
+    Args:
+        method (str): The name of the method.
+        *args: The arguments of the method.
+
+    Returns:
+        TaskResult: The time the task took in seconds, the id of the worker process, the
+            counters of the task, see `MergeMetrics.snapshot`, and its profile, see
+            `Profiler.profile_task`.
+    """
+    # Every task is counted on its own, and a forked worker does not inherit the callbacks
+    _worker_merger.metrics = MergeMetrics()
+    profiler = _worker_merger.profiler
+    profile = None
+    tic = time.perf_counter()
+    if profiler is None:
+        getattr(_worker_merger, method)(*args)
+    else:
+        _, profile = profiler.profile_task(getattr(_worker_merger, method), *args)
+    return time.perf_counter() - tic, os.getpid(), _worker_merger.metrics.snapshot(), profile
+
+
+def _write_chunk(task: Tuple[int, Sequence[int], str]) -> Tuple[int, TaskResult]:
+    """
+    Merges a chunk of input files into an intermediate file in a worker process.
+
+    Args:
+        task (Tuple[int, Sequence[int], str]): The number of the chunk, the indices of its files
+            in the input files of the worker merger and the path of the intermediate file.
+
+    Returns:
+        Tuple[int, TaskResult]: The number of the chunk and the measurements of the task, see
+            `_run_task`.
+    """
+    i, indices, output_file = task
+    input_files = _worker_merger.input_files
+    return i, _run_task("_write_intermediate", [input_files[index] for index in indices],
+                        output_file)
+
+
+def _merge_runs(file_paths: List[str], output_file: str) -> TaskResult:
+    return _run_task("_merge_runs", file_paths, output_file)
+
+
+def _merge_range(file_paths: List[str], low: Optional[bytes], high: Optional[bytes],
+                 output_file: str) -> TaskResult:
+    return _run_task("_merge_range", file_paths, low, high, output_file)
 
 
 class ParallelFileMerger(FileMerger):
 
+    """
+    Merges chunks of input files in a pool of processes.
+
+    Args:
+        num_processes (int, optional): Number of processes to use. Defaults to 4.
+        **kwargs: Options of `FileMerger`.
+    """
+
     def __init__(self, input_files: List[str], output_dir: str, filename: str = "output.txt",
-                 file_chunk_size: int = 1024, line_chunk_size: int = 1024, num_processes: int = 4) -> None:
-        super().__init__(input_files, output_dir, filename, file_chunk_size, line_chunk_size)
+                 file_chunk_size: int = 1024, line_chunk_size: int = 1024, num_processes: int = 4,
+                 **kwargs) -> None:
+        super().__init__(input_files, output_dir, filename, file_chunk_size, line_chunk_size,
+                         **kwargs)
         self.num_processes = num_processes
+        self.task_timings: Dict[int, float] = {}
+        self._pool = None
+
+    def __getstate__(self) -> dict:
+        # The pool is only used by the parent process and cannot be pickled
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
 
-    async def _split_into_files_async(self, chunk: List[str], output_file: str) -> None:
+    @contextlib.contextmanager
+    def _worker_pool(self) -> Iterator[multiprocessing.pool.Pool]:
         """
-        Merges a subset of input files into an intermediate file using an async process.
+        Provides the pool of worker processes, which is created once and reused by all phases
+        of a merge. The merger is sent to each worker once, when it starts, so tasks only carry
+        file indices or paths.
+
+        Yields:
+            multiprocessing.pool.Pool: The pool of the current merge.
+        """
+        if self._pool is not None:
+            yield self._pool
+            return
+        with multiprocessing.Pool(self.num_processes, initializer=_init_worker,
+                                  initargs=(self,)) as pool:
+            self._pool = pool
+            try:
+                yield pool
+            finally:
+                self._pool = None
+
+    def _add_task_result(self, result: TaskResult) -> None:
+        """
+        Adds the measurements of a task that ran in a worker process to the current phase.
 
         Args:
-            chunk (list): List of input file paths.
-            output_file (str): Path and filename of intermediate output file.
+            result (TaskResult): The measurements of the task, see `_run_task`.
         """
-        await self._create_intermediate(chunk, output_file)
+        elapsed, pid, counts, profile = result
+        self.metrics.add_worker(pid, elapsed, counts)
+        if profile is not None:
+            self.profiler.add_task(profile)
 
-    def _split_into_files(self, chunk: List[str], output_file: str):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(self._split_into_files_async(chunk, output_file))
-        loop.close()
+    def _run_merge_pass(self, merges: List[Tuple[List[str], str]]) -> None:
+        """
+        Executes the independent merges of one level of the merge tree in parallel.
+
+        Args:
+            merges (List[Tuple[List[str], str]]): Pairs of files to merge and their output file.
+        """
+        with self._worker_pool() as pool:
+            for result in pool.starmap(_merge_runs, merges):
+                self._add_task_result(result)
+
+    def _read_range(self, file_path: str, low: Optional[bytes],
+                    high: Optional[bytes]) -> Iterator[AnyStr]:
+        """
+        Lazily yields the normalized lines of a sorted file whose key is in the range
+        [low, high). Text files are binary searched for `low`, runs in the block format are
+        searched with their block index.
+
+        Args:
+            file_path (str): Path of the sorted file.
+            low (bytes, optional): Inclusive lower bound, None for the start of the file.
+            high (bytes, optional): Exclusive upper bound, None for the end of the file.
+        """
+        if is_run_file(file_path):
+            lines = self._read_run_file(file_path, low)
+        else:
+            offset = 0
+            if low is not None:
+                with open(file_path, "rb") as handle:
+                    offset = find_line_offset(handle, low)
+            lines = self._read_lines(file_path, offset)
+        if high is None:
+            return lines
+        # UTF-8 preserves the order of code points, so the bound can be compared as text
+        high = high if self.binary else high.decode()
+        return itertools.takewhile(high.__gt__, lines)
+
+    @staticmethod
+    def _sample_keys(file_path: str, num_samples: int) -> List[bytes]:
+        """
+        Samples keys of a sorted text file or of a run in the block format.
+
+        Args:
+            file_path (str): Path of the file.
+            num_samples (int): Number of samples to take.
+        """
+        if is_run_file(file_path):
+            return sample_run_keys(file_path, num_samples)
+        return sample_keys(file_path, num_samples)
+
+    def _merge_range(self, file_paths: List[str], low: Optional[bytes], high: Optional[bytes],
+                     output_file: str) -> None:
+        """
+        Merges one key range of all sorted files into a partial output file.
+
+        Args:
+            file_paths (List[str]): Paths of the sorted files.
+            low (bytes, optional): Inclusive lower bound of the key range.
+            high (bytes, optional): Exclusive upper bound of the key range.
+            output_file (str): Path of the partial output file.
+        """
+        self._merge_streams([self._read_range(file_path, low, high) for file_path in file_paths],
+                            output_file, final=True)
+
+    def _merge_final(self, file_paths: List[str]) -> None:
+        """
+        Merges the remaining files into the output file by splitting their keys into one range
+        per process. Each process seeks to its range in every file and merges it into a partial
+        file, and the partial files are concatenated in key order. Compressed partial files are
+        concatenated as well, since all supported codecs accept concatenated streams.
+
+        Args:
+            file_paths (List[str]): At most `fan_in` sorted files.
+        """
+        # The split keys are sampled in byte order, which is the merge order only without a key,
+        # and compressed text files, such as a compressed previous output, cannot be searched.
+        # Only the "sorted" mode promises sorted inputs, the runs of the other modes may be
+        # unsorted and cannot be searched either
+        split_keys = []
+        searchable = self.previous_output is None or detect_codec(self.previous_output) == "none"
+        sorted_runs = self.dedup == "sorted" and self.key is None
+        if sorted_runs and searchable and (self.run_format == "block"
+                                           or self.temp_compression == "none"):
+            split_keys = choose_split_keys(file_paths, self.num_processes,
+                                           sampler=self._sample_keys)
+        if not split_keys:
+            super()._merge_final(file_paths)
+            return
+
+        bounds = [None, *split_keys, None]
+        ranges = [(file_paths, low, high, self._temp_path(f".part{i}", i))
+                  for i, (low, high) in enumerate(zip(bounds, bounds[1:]))]
+        with self._worker_pool() as pool:
+            for result in pool.starmap(_merge_range, ranges):
+                self._add_task_result(result)
+
+        if self.output_file == STDOUT:
+            output = io.BufferedWriter(self._open_stdout(), WRITE_BUFFER_SIZE)
+        else:
+            output = open(self.output_file, "wb")
+        with output as output_handle:
+            for *_, part_file in ranges:
+                with open(part_file, "rb") as part_handle:
+                    shutil.copyfileobj(part_handle, output_handle, 1024 * 1024)
+                os.remove(part_file)
 
     def merge_files(self) -> None:
         """
         Merges all input files into a single sorted output file using multiprocessing.
         """
-        chunks = self._divide_files_into_chunks()
-        output_chunks = []
+        if self.archive_order:
+            self._merge_archives()
+            return
+        self.task_timings = {}
         try:
-            with multiprocessing.Pool(self.num_processes) as pool:
-                results = []
-                for i, chunk in enumerate(chunks):
-                    output_file_chunk = f"{self.temp_file}.{i}"
-                    output_chunks.append(output_file_chunk)
-                    result = pool.apply_async(self._split_into_files,
-                                              args=(chunk, output_file_chunk))
-                    results.append(result)
-
-                for result in results:
-                    result.get()
-
-            self._merge_intermediate_files(output_chunks, delete=True)
+            # The input files are looked up in the try, so the temporary directories are
+            # removed if one of them is missing
+            sizes = self._input_sizes()
+            chunks = self._divide_indices_into_chunks(sizes)
+            tasks, digests = [], []
+            for i, chunk in enumerate(chunks):
+                output_file, digest = self._chunk_path([self.input_files[j] for j in chunk], i)
+                tasks.append((i, chunk, output_file))
+                digests.append(digest)
+            pending = [task for task in tasks if not self._chunk_completed(digests[task[0]])]
+            if len(pending) < len(tasks):
+                print(f"Resuming: {len(tasks) - len(pending)} of {len(tasks)} chunks were "
+                      "completed by a previous merge.")
+            self._check_disk_space(len(chunks), input_size=sum(sizes))
+            self._measure_input(sum(sizes))
+            with self._worker_pool() as pool:
+                with self.metrics.phase("intermediate"):
+                    # Chunks are handed out one at a time to the first idle process, largest
+                    # first, so the last chunks to finish are small ones
+                    for i, result in pool.imap_unordered(_write_chunk, pending):
+                        elapsed, pid, *_ = result
+                        self.task_timings[i] = elapsed
+                        self._add_task_result(result)
+                        self._complete_chunk(digests[i], tasks[i][2])
+                        print(f"Chunk {i + 1} of {len(tasks)} ({len(chunks[i])} files) took "
+                              f"{elapsed:.3f}s in process {pid}")
+
+                # Checkpointed chunks are kept until the merge succeeds
+                self._merge_intermediate_files([task[2] for task in tasks],
+                                               delete=self.manifest is None)
         finally:
-            shutil.rmtree(self.temp_dir)
+            self._remove_temp_dirs()
@@ -0,0 +1,264 @@
+import contextlib
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from typing import IO, Callable, Dict, Iterator, List, Optional
+
+
+PHASES = ("discovery", "extraction", "intermediate", "merge_passes", "final_merge", "cleanup")
+COUNTERS = ("lines_read", "bytes_read", "lines_written", "bytes_written", "duplicates_dropped")
+# Minimum number of seconds between two progress events
+PROGRESS_INTERVAL = 0.5
+# Phases whose progress is measured against the size of the input files
+PROGRESS_PHASES = ("extraction", "intermediate", "merge_passes", "final_merge")
+
+
+class MergeMetrics:
+    """
+    Collects the timings and counters of a merge and reports them as events to callbacks.
+
+    Counters are updated once per batch of lines, so collecting them costs little. Every phase
+    is timed, and the counters are kept per phase. An event is a dictionary with an "event"
+    field, one of:
+
+    - "phase_start" and "phase_end", with the "phase", and at its end its "seconds" and the
+      counters of the phase.
+    - "progress", at most every `PROGRESS_INTERVAL` seconds while input is read, with the
+      "phase", its "bytes_read", the "total_bytes" of the input files, the "fraction" done, and
+      the "elapsed" and "eta" seconds of the phase.
+    - "worker", when a worker process finishes a task, with its "pid", "seconds" and counters.
+    - "summary", sent by `finish`, see `summary`.
+
+    Every event also has a "time" field, the seconds since the metrics were created.
+
+    Args:
+        callbacks (List[Callable[[dict], None]], optional): Functions that receive every event,
+            such as a `JsonLinesWriter` or a `ProgressBar`. Defaults to no callbacks, then no
+            events are built.
+    """
+
+    def __init__(self, callbacks: Optional[List[Callable[[dict], None]]] = None) -> None:
+        self.callbacks = list(callbacks or [])
+        self.start_time = time.monotonic()
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, Counter] = {}
+        self.workers: Dict[int, Counter] = {}
+        self.max_heap_size = 0
+        # Size of the input files, which the progress of reading phases is measured against
+        self.total_bytes: Optional[int] = None
+        self._phase: Optional[str] = None
+        self._phase_start = 0.0
+        self._last_progress = 0.0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Worker processes only count, the callbacks and the lock stay in the parent process
+        state = self.__dict__.copy()
+        state["callbacks"] = []
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether any callback receives the events.
+        """
+        return bool(self.callbacks)
+
+    def emit(self, event: str, **fields) -> None:
+        """
+        Sends an event to every callback.
+
+        Args:
+            event (str): The type of the event.
+            **fields: The fields of the event.
+        """
+        if not self.callbacks:
+            return
+        payload = {"event": event, "time": round(time.monotonic() - self.start_time, 6),
+                   **fields}
+        for callback in self.callbacks:
+            callback(payload)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Times a phase of the merge. Counters added meanwhile are attributed to it. A phase that
+        is entered several times accumulates its time and counters.
+
+        Args:
+            name (str): The name of the phase, one of `PHASES`.
+        """
+        previous, previous_start = self._phase, self._phase_start
+        self._phase, self._phase_start = name, time.monotonic()
+        self.emit("phase_start", phase=name)
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - self._phase_start
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.emit("phase_end", phase=name, seconds=round(seconds, 6),
+                      **self.counters.get(name, {}))
+            self._phase, self._phase_start = previous, previous_start
+
+    def add(self, **counts: int) -> None:
+        """
+        Adds to the counters of the current phase, and reports the progress if it is due.
+
+        Args:
+            **counts (int): Increments of counters, see `COUNTERS`.
+        """
+        with self._lock:
+            self.counters.setdefault(self._phase or "other", Counter()).update(counts)
+            if self.callbacks and "bytes_read" in counts:
+                now = time.monotonic()
+                if now - self._last_progress >= PROGRESS_INTERVAL:
+                    self._last_progress = now
+                    self._report_progress(now)
+
+    def _report_progress(self, now: float) -> None:
+        if self._phase not in PROGRESS_PHASES or not self.total_bytes:
+            return
+        bytes_read = self.counters[self._phase]["bytes_read"]
+        # Duplicates and compressed inputs make the estimate inexact, it is never reported done
+        fraction = min(bytes_read / self.total_bytes, 0.999)
+        elapsed = now - self._phase_start
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        self.emit("progress", phase=self._phase, bytes_read=bytes_read,
+                  total_bytes=self.total_bytes, fraction=round(fraction, 4),
+                  elapsed=round(elapsed, 3), eta=None if eta is None else round(eta, 3))
+
+    def observe_heap(self, size: int) -> None:
+        """
+        Records the number of streams of a k-way merge.
+
+        Args:
+            size (int): The number of merged streams.
+        """
+        self.max_heap_size = max(self.max_heap_size, size)
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Returns the counters of all phases added together, and the largest heap size.
+        """
+        totals = Counter()
+        for counts in self.counters.values():
+            totals.update(counts)
+        return {**{name: totals[name] for name in COUNTERS}, "max_heap_size": self.max_heap_size}
+
+    def add_worker(self, pid: int, seconds: float, counts: Dict[str, int]) -> None:
+        """
+        Adds the counters of a task that ran in a worker process to the current phase, and to
+        the totals of the worker.
+
+        Args:
+            pid (int): The id of the worker process.
+            seconds (float): The time the task took.
+            counts (Dict[str, int]): The `snapshot` of the metrics of the worker after the task.
+        """
+        counts = dict(counts)
+        self.observe_heap(counts.pop("max_heap_size", 0))
+        self.add(**counts)
+        worker = self.workers.setdefault(pid, Counter())
+        worker.update(tasks=1, seconds=seconds, lines_read=counts.get("lines_read", 0),
+                      bytes_read=counts.get("bytes_read", 0))
+        self.emit("worker", pid=pid, seconds=round(seconds, 6), **counts)
+
+    def summary(self) -> dict:
+        """
+        Returns the metrics of the whole merge.
+
+        Returns:
+            dict: The "seconds" of every phase under "phases", the counters of every phase under
+            "counters", the counters of all phases added together under "totals", the
+            "max_heap_size" and the tasks, time and throughput of every worker process under
+            "workers".
+        """
+        workers = {}
+        for pid, worker in self.workers.items():
+            seconds = worker["seconds"]
+            workers[str(pid)] = {
+                "tasks": worker["tasks"], "seconds": round(seconds, 6),
+                "lines_per_s": round(worker["lines_read"] / seconds, 1) if seconds else None,
+                "bytes_per_s": round(worker["bytes_read"] / seconds, 1) if seconds else None,
+            }
+        totals = self.snapshot()
+        return {
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "counters": {name: dict(counts) for name, counts in self.counters.items()},
+            "totals": {name: totals[name] for name in COUNTERS},
+            "max_heap_size": self.max_heap_size,
+            "workers": workers,
+        }
+
+    def finish(self) -> dict:
+        """
+        Sends the summary of the merge to the callbacks.
+
+        Returns:
+            dict: The `summary`.
+        """
+        summary = self.summary()
+        self.emit("summary", **summary)
+        return summary
+
+
+class JsonLinesWriter:
+    """
+    A metrics callback that writes every event as a line of JSON.
+
+    Args:
+        stream (IO[str]): An open text stream. It is flushed after every event, so the events
+            can be followed while the merge runs.
+    """
+
+    def __init__(self, stream: IO[str]) -> None:
+        self.stream = stream
+
+    def __call__(self, event: dict) -> None:
+        self.stream.write(json.dumps(event) + "\n")
+        self.stream.flush()
+
+
+class ProgressBar:
+    """
+    A metrics callback that draws the progress of the current phase with its throughput and
+    estimated time left, and the time of every phase once it ends.
+
+    Args:
+        stream (IO[str], optional): The stream to draw on. Defaults to the standard error, so
+            the bar is never mixed with output written to the standard output.
+        width (int, optional): The number of characters of the bar. Defaults to 30.
+    """
+
+    def __init__(self, stream: Optional[IO[str]] = None, width: int = 30) -> None:
+        self.stream = stream
+        self.width = width
+
+    def __call__(self, event: dict) -> None:
+        stream = self.stream or sys.stderr
+        if event["event"] == "progress":
+            filled = int(event["fraction"] * self.width)
+            bar = "#" * filled + "-" * (self.width - filled)
+            rate = event["bytes_read"] / max(event["elapsed"], 1e-9) / 1e6
+            eta = "?" if event["eta"] is None else _format_seconds(event["eta"])
+            stream.write(f"\r{event['phase']:<12} [{bar}] {event['fraction']:6.1%} "
+                         f"{event['bytes_read'] / 1e6:,.1f}/{event['total_bytes'] / 1e6:,.1f} MB "
+                         f"{rate:,.1f} MB/s ETA {eta}  ")
+            stream.flush()
+        elif event["event"] == "phase_end":
+            stream.write(f"\r{event['phase']:<12} done in {_format_seconds(event['seconds'])}"
+                         f"{' ' * (self.width + 40)}\n")
+            stream.flush()
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,104 @@
+import os
+from typing import BinaryIO, Callable, List
+
+
+def find_line_offset(handle: BinaryIO, key: bytes) -> int:
+    """
+    Binary searches a sorted file for the first line whose stripped content is not less than
+    `key`.
+
+    Args:
+        handle (BinaryIO): A sorted file opened in binary mode.
+        key (bytes): The key to search for.
+
+    Returns:
+        int: Byte offset of the start of the first line that is greater than or equal to `key`,
+        or the size of the file if there is no such line.
+    """
+    # Both bounds are line starts, the result always lies between them
+    low, high = 0, handle.seek(0, os.SEEK_END)
+    while low < high:
+        middle = (low + high) // 2
+        # Move to the first line that starts at or after the middle
+        handle.seek(max(middle - 1, 0))
+        if middle:
+            handle.readline()
+        position = handle.tell()
+        if position >= high:
+            break
+        line = handle.readline()
+        if line.strip() < key:
+            low = position + len(line)
+        else:
+            high = position
+    # Fewer than two lines are left between the bounds, scan them
+    handle.seek(low)
+    while low < high:
+        line = handle.readline()
+        if not line or line.strip() >= key:
+            break
+        low += len(line)
+    return low
+
+
+def sample_keys(file_path: str, num_samples: int) -> List[bytes]:
+    """
+    Reads the keys of lines at evenly spaced byte offsets of a sorted file.
+
+    Args:
+        file_path (str): Path of the file.
+        num_samples (int): Number of samples to take.
+
+    Returns:
+        List[bytes]: The sampled keys in file order.
+    """
+    samples = []
+    with open(file_path, "rb") as handle:
+        size = handle.seek(0, os.SEEK_END)
+        for i in range(1, num_samples + 1):
+            handle.seek(size * i // (num_samples + 1))
+            # Skip the partial line at the offset
+            handle.readline()
+            line = handle.readline()
+            if line:
+                samples.append(line.strip())
+    return samples
+
+
+def choose_split_keys(file_paths: List[str], num_partitions: int,
+                      samples_per_partition: int = 32,
+                      sampler: Callable[[str, int], List[bytes]] = sample_keys) -> List[bytes]:
+    """
+    Chooses keys that split sorted files into key ranges of roughly equal size.
+
+    Every file is sampled in proportion to its size, and the split keys are the quantiles of all
+    samples.
+
+    Args:
+        file_paths (List[str]): Paths of sorted files.
+        num_partitions (int): Desired number of key ranges.
+        samples_per_partition (int): Number of samples taken per key range in total.
+        sampler (Callable[[str, int], List[bytes]]): Function that samples a number of keys of
+            a file. Defaults to `sample_keys`.
+
+    Returns:
+        List[bytes]: Strictly increasing split keys, at most `num_partitions - 1` of them. Range
+        `i` holds the keys from split key `i - 1` (inclusive) up to split key `i` (exclusive).
+    """
+    if num_partitions < 2:
+        return []
+    sizes = [os.path.getsize(file_path) for file_path in file_paths]
+    total_size = sum(sizes) or 1
+    total_samples = num_partitions * samples_per_partition
+    samples = []
+    for file_path, size in zip(file_paths, sizes):
+        num_samples = max(1, round(total_samples * size / total_size))
+        samples.extend(sampler(file_path, num_samples))
+    samples.sort()
+
+    split_keys = []
+    for i in range(1, num_partitions):
+        key = samples[i * len(samples) // num_partitions] if samples else None
+        if key and (not split_keys or key > split_keys[-1]):
+            split_keys.append(key)
+    return split_keys
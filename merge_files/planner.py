@@ -0,0 +1,285 @@
+import errno
+import heapq
+import os
+import shutil
+from collections import Counter
+from typing import List, NamedTuple, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+# File descriptors kept free for stdio, the output file and the interpreter itself
+RESERVED_FILE_DESCRIPTORS = 32
+# Default descriptor limit when it cannot be queried, e.g. the C runtime limit on Windows
+DEFAULT_FILE_DESCRIPTOR_LIMIT = 512
+# Inputs smaller than this are merged faster in one process than the processes take to start
+SMALL_INPUT_SIZE = 64 * 1024 * 1024
+# Range of the read buffer chosen by `auto_tune`
+MIN_READ_BUFFER = 64 * 1024
+MAX_READ_BUFFER = 1024 * 1024
+# Chunks per process targeted by `auto_tune`, so idle processes can take over the work
+CHUNKS_PER_PROCESS = 4
+
+
+def file_descriptor_limit() -> int:
+    """
+    Returns the soft limit on the number of open file descriptors of the process.
+    """
+    if resource is None:
+        return DEFAULT_FILE_DESCRIPTOR_LIMIT
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return 2 ** 16
+    return soft
+
+
+def open_file_descriptors() -> int:
+    """
+    Returns the number of file descriptors currently open in the process, or 0 if it cannot be
+    determined on this platform.
+    """
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            continue
+    return 0
+
+
+def available_memory() -> Optional[int]:
+    """
+    Returns the amount of free physical memory in bytes, or None if it cannot be determined on
+    this platform.
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def max_fan_in(read_buffer_size: int, reserved: int = RESERVED_FILE_DESCRIPTORS) -> int:
+    """
+    Chooses how many files a single merge may open at once.
+
+    The fan-in is bounded by the file descriptors left under `RLIMIT_NOFILE` and by the memory
+    the read buffers of the open files would need, using at most half of the free memory.
+
+    Args:
+        read_buffer_size (int): Number of bytes buffered for every open file.
+        reserved (int): Number of file descriptors to keep free.
+
+    Returns:
+        int: The maximum fan-in, at least 2.
+    """
+    fan_in = file_descriptor_limit() - open_file_descriptors() - reserved
+    memory = available_memory()
+    if memory is not None:
+        # Both the binary buffer and the decoded lines of a file are kept in memory
+        fan_in = min(fan_in, memory // 2 // (2 * max(read_buffer_size, 1)))
+    return max(2, fan_in)
+
+
+def plan_merge_tree(run_sizes: List[int], fan_in: int) -> List[List[List[int]]]:
+    """
+    Builds a merge tree that reduces sorted runs to at most `fan_in` runs, so that none of the
+    merges opens more than `fan_in` files.
+
+    Runs are identified by their index in `run_sizes`. Every merge creates a new run whose index
+    is the next free one, in the order the merges appear in the plan. Each level must be executed
+    before the next one, but the merges within a level are independent. The smallest runs are
+    merged first and the last level only merges as many runs as needed, so as few bytes as
+    possible are written more than once.
+
+    Args:
+        run_sizes (List[int]): Sizes of the initial runs in bytes.
+        fan_in (int): Maximum number of runs merged at once, at least 2.
+
+    Returns:
+        List[List[List[int]]]: Levels of the merge tree, each one a list of groups of run
+        indices to merge. Runs that are not merged by any group are left for the final merge.
+
+    Raises:
+        ValueError: If the fan-in is less than 2.
+    """
+    if fan_in < 2:
+        raise ValueError(f"Fan-in must be at least 2: {fan_in}")
+    sizes = dict(enumerate(run_sizes))
+    next_id = len(run_sizes)
+    levels = []
+    while len(sizes) > fan_in:
+        runs = sorted(sizes, key=lambda run: (sizes[run], run))
+        excess = len(runs) - fan_in
+        full_groups, remainder = divmod(excess, fan_in - 1)
+        needed = full_groups * fan_in + (remainder + 1 if remainder else 0)
+        if needed <= len(runs):
+            # This level can finish the reduction, merge only the smallest runs
+            group_sizes = [remainder + 1] * bool(remainder) + [fan_in] * full_groups
+        else:
+            group_sizes = [fan_in] * (len(runs) // fan_in)
+            if len(runs) % fan_in > 1:
+                group_sizes.append(len(runs) % fan_in)
+        level = []
+        start = 0
+        for group_size in group_sizes:
+            group = runs[start:start + group_size]
+            start += group_size
+            level.append(group)
+            sizes[next_id] = sum(sizes.pop(run) for run in group)
+            next_id += 1
+        levels.append(level)
+    return levels
+
+
+def balance_chunks(file_sizes: List[int], max_files: int) -> List[Sequence[int]]:
+    """
+    Packs files into as few chunks as `max_files` allows, balancing the bytes of the chunks with
+    the longest processing time first rule: the largest file goes to the chunk with the fewest
+    bytes that still has room. The contiguous split by count is kept unless packing lowers the
+    size of the largest chunk, e.g. when all files have the same size.
+
+    Args:
+        file_sizes (List[int]): Sizes of the files in bytes.
+        max_files (int): Maximum number of files in a chunk, at least 1.
+
+    Returns:
+        List[Sequence[int]]: The indices of the files of each chunk in ascending order, the
+        largest chunks first, so they are started first when chunks are handed out in order.
+    """
+    contiguous = [range(i, min(i + max_files, len(file_sizes)))
+                  for i in range(0, len(file_sizes), max_files)]
+    packed = [[] for _ in contiguous]
+    totals = [(0, i) for i in range(len(packed))]
+    for file in sorted(range(len(file_sizes)), key=lambda i: (-file_sizes[i], i)):
+        total, i = heapq.heappop(totals)
+        packed[i].append(file)
+        if len(packed[i]) < max_files:
+            heapq.heappush(totals, (total + file_sizes[file], i))
+
+    def chunk_size(chunk: Sequence[int]) -> int:
+        return sum(file_sizes[i] for i in chunk)
+
+    chunks = contiguous
+    if max(map(chunk_size, packed), default=0) < max(map(chunk_size, contiguous), default=0):
+        chunks = [sorted(chunk) for chunk in packed]
+    return sorted(chunks, key=chunk_size, reverse=True)
+
+
+def estimate_spill_size(input_size: int, num_runs: int, fan_in: int,
+                        intermediate: bool = True) -> int:
+    """
+    Estimates the peak number of bytes that a merge writes to its temporary directories.
+
+    Intermediate files hold all of the input once. If there are more runs than the fan-in, each
+    level of the merge tree writes its merged runs before the runs it merged are deleted, so
+    the input is held up to twice. Compressed inputs and runs make the estimate conservative.
+
+    Args:
+        input_size (int): Total size of the input files in bytes.
+        num_runs (int): Number of sorted runs that the final merges start from.
+        fan_in (int): Maximum number of runs merged at once.
+        intermediate (bool): Whether the input files are first merged into intermediate files.
+
+    Returns:
+        int: The estimated spill size in bytes.
+    """
+    spill_size = input_size if intermediate else 0
+    if num_runs > fan_in:
+        spill_size += input_size
+    return spill_size
+
+
+def check_disk_space(directories: List[str], required: int) -> None:
+    """
+    Checks that directories whose files are used round-robin have room for their share of the
+    spilled bytes. Directories on the same device share its free space.
+
+    Args:
+        directories (List[str]): The temporary directories.
+        required (int): Number of bytes spilled to all of them together.
+
+    Raises:
+        OSError: If a device does not have enough free space.
+    """
+    shares = Counter(os.stat(directory).st_dev for directory in directories)
+    checked = set()
+    for directory in directories:
+        device = os.stat(directory).st_dev
+        if device in checked:
+            continue
+        checked.add(device)
+        needed = required * shares[device] // len(directories)
+        free = shutil.disk_usage(directory).free
+        if free < needed:
+            raise OSError(errno.ENOSPC,
+                          f"Not enough free space for temporary files: about {needed} bytes "
+                          f"are needed but {free} bytes are free", directory)
+
+
+class MergePlan(NamedTuple):
+    """
+    Settings of a merge chosen by `auto_tune`.
+    """
+    strategy: str
+    num_processes: int
+    chunk_file: int
+    chunk_line: Optional[int]
+    read_buffer: int
+    fan_in: int
+
+
+def auto_tune(num_files: int, total_size: int, cpu_count: Optional[int] = None,
+              memory: Optional[int] = None, fd_limit: Optional[int] = None) -> MergePlan:
+    """
+    Chooses the merge strategy and its settings from the input and the resources of the host.
+
+    Small inputs are merged by a single process, since starting processes would take longer,
+    with "basic" if all files can be opened at once and "async" otherwise. Larger inputs are
+    merged by one process per CPU, with about `CHUNKS_PER_PROCESS` chunks per process but no
+    more intermediate files than the fan-in, so the final merge needs no extra pass. A quarter
+    of the free memory is shared by the read buffers of the files each process opens at once.
+    Lines are read by the size of the read buffer rather than by count.
+
+    Args:
+        num_files (int): Number of input files.
+        total_size (int): Total size of the input files in bytes.
+        cpu_count (int, optional): Number of CPUs. Defaults to `os.cpu_count`.
+        memory (int, optional): Free memory in bytes. Defaults to `available_memory`.
+        fd_limit (int, optional): Limit on open file descriptors. Defaults to the descriptors
+            left under `RLIMIT_NOFILE`.
+
+    Returns:
+        MergePlan: The chosen settings.
+    """
+    cpus = cpu_count or os.cpu_count() or 1
+    if memory is None:
+        memory = available_memory()
+    if fd_limit is None:
+        fd_limit = file_descriptor_limit() - open_file_descriptors()
+    fd_budget = max(2, fd_limit - RESERVED_FILE_DESCRIPTORS)
+
+    parallel = cpus > 1 and total_size >= SMALL_INPUT_SIZE and num_files >= 4
+    num_processes = min(cpus, num_files // 2) if parallel else 1
+
+    read_buffer = MAX_READ_BUFFER
+    fan_in = fd_budget
+    if memory is not None:
+        # Both the binary buffer and the decoded lines of a file are kept in memory
+        budget = memory // 4 // num_processes // 2
+        read_buffer = budget // max(1, min(num_files, fd_budget))
+        read_buffer = min(MAX_READ_BUFFER, max(MIN_READ_BUFFER, read_buffer))
+        read_buffer -= read_buffer % 4096
+        fan_in = min(fan_in, budget // read_buffer)
+    fan_in = max(2, fan_in)
+
+    if parallel:
+        strategy = "parallel"
+        chunk_file = -(-num_files // (num_processes * CHUNKS_PER_PROCESS))
+        chunk_file = min(fan_in, max(2, chunk_file, -(-num_files // fan_in)))
+    elif num_files <= fan_in:
+        strategy, chunk_file = "basic", num_files
+    else:
+        strategy, chunk_file = "async", fan_in
+    return MergePlan(strategy, num_processes, chunk_file, None, read_buffer, fan_in)
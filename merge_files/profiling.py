@@ -0,0 +1,272 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Seconds between two samples of the stacks of all threads
+SAMPLE_INTERVAL = 0.005
+# Number of functions listed for every phase in the text report
+REPORT_FUNCTIONS = 30
+# Samples taken outside of a phase are attributed to this one
+NO_PHASE = "other"
+# cProfile hooks every thread from Python 3.12, so threads cannot have profilers of their own
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+# The cProfile statistics and the sampled stacks of a task
+ProfileData = Tuple[Dict[tuple, tuple], Counter]
+
+
+class _RawStats:
+    """
+    Statistics of a finished `cProfile.Profile` in the form `pstats.Stats` loads them from.
+    `pstats.Stats` takes over and updates the dictionary it loads, so it gets a copy.
+    """
+
+    def __init__(self, stats: Dict[tuple, tuple]) -> None:
+        self._stats = stats
+        self.stats = {}
+
+    def create_stats(self) -> None:
+        self.stats = dict(self._stats)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples the stacks of all other threads of the process in a background thread, and counts
+    every distinct stack in the collapsed format of flame graphs, outermost frame first.
+
+    Args:
+        interval (float, optional): Seconds between two samples. Defaults to `SAMPLE_INTERVAL`.
+        prefix (Callable[[], str], optional): Returns the frames put in front of every sampled
+            stack, such as the current phase. Defaults to none.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL,
+                 prefix: Optional[Callable[[], str]] = None) -> None:
+        self.interval = interval
+        self.prefix = prefix
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            prefix = self.prefix() if self.prefix else None
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if prefix:
+                    labels.append(prefix)
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """
+        Stops sampling.
+
+        Returns:
+            Counter: The number of samples of every collapsed stack.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.stacks
+
+
+class Profiler:
+    """
+    Profiles a merge with cProfile and a stack sampler, per phase and across worker processes.
+
+    The profiler is a `MergeMetrics` callback: the main thread is profiled with cProfile from the
+    start to the end of every phase. Tasks run by worker processes are profiled in the worker
+    with `profile_task`, and their statistics are added to the phase in which they are returned.
+    The stacks of all threads are sampled meanwhile, with the phase and the process as their
+    outermost frames, so a flame graph shows the time of every phase in the main process and the
+    workers.
+
+    Args:
+        interval (float, optional): Seconds between two stack samples. Defaults to
+            `SAMPLE_INTERVAL`.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.stats: Dict[str, List[Dict[tuple, tuple]]] = {}
+        self.stacks = Counter()
+        self._phases: List[str] = []
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Worker processes only need the settings to profile their tasks
+        return {"interval": self.interval}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["interval"])
+
+    @property
+    def phase(self) -> str:
+        """
+        The current phase of the merge.
+        """
+        return self._phases[-1] if self._phases else NO_PHASE
+
+    def start(self) -> None:
+        """
+        Starts sampling the stacks of the process.
+        """
+        self._sampler = StackSampler(self.interval, lambda: f"{self.phase};main")
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """
+        Stops the profile of the current phase and the stack sampler.
+        """
+        self._switch_profile(None)
+        if self._sampler is not None:
+            self.stacks.update(self._sampler.stop())
+            self._sampler = None
+
+    def _switch_profile(self, phase: Optional[str]) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.create_stats()
+            self._add_stats(self.phase, self._profile.stats)
+            self._profile = None
+        if phase is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def _add_stats(self, phase: str, stats: Dict[tuple, tuple]) -> None:
+        if stats:
+            with self._lock:
+                self.stats.setdefault(phase, []).append(stats)
+
+    def __call__(self, event: dict) -> None:
+        if event["event"] == "phase_start":
+            # The phase that was running is resumed when this one ends
+            self._switch_profile(event["phase"])
+            self._phases.append(event["phase"])
+        elif event["event"] == "phase_end":
+            self._switch_profile(None)
+            self._phases.pop()
+            if self._phases:
+                self._switch_profile(self.phase)
+
+    def profile_task(self, function: Callable, *args) -> Tuple[Any, ProfileData]:
+        """
+        Runs a task in a worker process under cProfile and the stack sampler.
+
+        Args:
+            function (Callable): The task.
+            *args: The arguments of the task.
+
+        Returns:
+            Tuple[Any, ProfileData]: The result of the task, and its statistics and stacks to be
+            added with `add_task` in the main process.
+        """
+        sampler = StackSampler(self.interval)
+        profile = cProfile.Profile()
+        sampler.start()
+        profile.enable()
+        try:
+            result = function(*args)
+        finally:
+            profile.disable()
+            stacks = sampler.stop()
+        profile.create_stats()
+        return result, (profile.stats, stacks)
+
+    def add_task(self, data: ProfileData) -> None:
+        """
+        Adds the profile of a task that ran in a worker process to the current phase.
+
+        Args:
+            data (ProfileData): The profile returned by `profile_task`.
+        """
+        stats, stacks = data
+        self._add_stats(self.phase, stats)
+        prefix = f"{self.phase};worker;"
+        with self._lock:
+            self.stacks.update({prefix + stack: count for stack, count in stacks.items()})
+
+    def profile_thread(self, function: Callable, *args) -> Any:
+        """
+        Runs a task in a thread of the main process under cProfile, if threads can be profiled
+        on their own. Its statistics are added to the current phase.
+
+        Args:
+            function (Callable): The task.
+            *args: The arguments of the task.
+
+        Returns:
+            The result of the task.
+        """
+        if not PER_THREAD_PROFILES:
+            # The profile of the phase covers all threads
+            return function(*args)
+        phase = self.phase
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return function(*args)
+        finally:
+            profile.disable()
+            profile.create_stats()
+            self._add_stats(phase, profile.stats)
+
+    def report(self) -> str:
+        """
+        Returns the functions with the highest cumulative time of every phase as text.
+        """
+        stream = io.StringIO()
+        for phase, stats_list in self.stats.items():
+            stream.write(f"=== {phase} ===\n")
+            stats = pstats.Stats(*map(_RawStats, stats_list), stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_FUNCTIONS)
+        return stream.getvalue()
+
+    def write(self, base_path: str) -> List[str]:
+        """
+        Writes the profile next to the output: a text report of every phase to
+        "<base_path>.profile.txt", the cProfile statistics of every phase to
+        "<base_path>.<phase>.prof", which `pstats` and viewers such as snakeviz read, and the
+        sampled stacks to "<base_path>.folded", which flamegraph.pl and speedscope read.
+
+        Args:
+            base_path (str): Path the names of the files start with.
+
+        Returns:
+            List[str]: Paths of the written files.
+        """
+        paths = [f"{base_path}.profile.txt", f"{base_path}.folded"]
+        with open(paths[0], "w") as f:
+            f.write(self.report())
+        with open(paths[1], "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        for phase, stats_list in self.stats.items():
+            paths.append(f"{base_path}.{phase}.prof")
+            pstats.Stats(*map(_RawStats, stats_list)).dump_stats(paths[-1])
+        return paths
@@ -0,0 +1,196 @@
+import bisect
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from merge_files.compression import CODECS, check_codec, compress_bytes, decompress_bytes
+
+
+RUN_FORMATS = ("block", "text")
+# A run file starts with the magic number and the index of its codec in `CODECS`
+RUN_MAGIC = b"FMRUN\x01"
+# The last bytes of a run file are the offset of the block index and this marker
+INDEX_MAGIC = b"FMIX"
+BLOCK_HEADER = struct.Struct("<II")
+INDEX_ENTRY = struct.Struct("<QI")
+FOOTER = struct.Struct("<Q")
+
+
+def is_run_header(head: bytes) -> bool:
+    """
+    Checks whether the first bytes of a file are the header of a run file.
+
+    Args:
+        head (bytes): The first bytes of the file.
+    """
+    return head.startswith(RUN_MAGIC)
+
+
+def is_run_file(file_path: str) -> bool:
+    """
+    Checks whether a file is a sorted run written by `write_run`.
+
+    Args:
+        file_path (str): Path of the file.
+    """
+    with open(file_path, "rb") as f:
+        return is_run_header(f.read(len(RUN_MAGIC)))
+
+
+def _write_block(handle: BinaryIO, words: List[bytes], codec: str) -> None:
+    payload = compress_bytes(b"\n".join(words), codec)
+    handle.write(BLOCK_HEADER.pack(len(payload), len(words)))
+    handle.write(payload)
+
+
+def write_run(file_path: str, words: Iterable[bytes], codec: str = "gzip",
+              block_size: int = 64 * 1024) -> None:
+    """
+    Writes sorted words to a run file.
+
+    Words are grouped into blocks of about `block_size` uncompressed bytes that are compressed
+    on their own, and the first word of every block is kept in an index at the end of the file,
+    so a reader can start at any block. Words never contain a newline, so the records of a block
+    are delimited by newlines and a block is joined and split in a single call, without Python
+    code per word. The long prefixes that sorted words share are removed by the codec.
+
+    Args:
+        file_path (str): Path of the run file.
+        words (Iterable[bytes]): Sorted words without line terminators.
+        codec (str, optional): Codec of the blocks, one of `CODECS`. Defaults to "gzip", which
+            compresses with plain deflate at its fastest level.
+        block_size (int, optional): Uncompressed size of a block in bytes. Defaults to 65536.
+    """
+    check_codec(codec)
+    index = []
+    with open(file_path, "wb") as f:
+        f.write(RUN_MAGIC + bytes([CODECS.index(codec)]))
+        block, size = [], 0
+        for word in words:
+            block.append(word)
+            size += len(word) + 1
+            if size >= block_size:
+                index.append((block[0], f.tell()))
+                _write_block(f, block, codec)
+                block, size = [], 0
+        if block:
+            index.append((block[0], f.tell()))
+            _write_block(f, block, codec)
+        # An empty block header ends the blocks
+        f.write(BLOCK_HEADER.pack(0, 0))
+
+        index_offset = f.tell()
+        for key, offset in index:
+            f.write(INDEX_ENTRY.pack(offset, len(key)))
+            f.write(key)
+        f.write(FOOTER.pack(index_offset) + INDEX_MAGIC)
+
+
+class RunReader:
+    """
+    Reads a run file written by `write_run` one block at a time.
+
+    Args:
+        stream (BinaryIO): The run file opened in binary mode, positioned at its start.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        head = stream.read(len(RUN_MAGIC) + 1)
+        if not is_run_header(head) or len(head) <= len(RUN_MAGIC):
+            raise ValueError("Not a run file.")
+        self.stream = stream
+        self.codec = CODECS[head[-1]]
+        check_codec(self.codec)
+
+    def index(self) -> List[Tuple[bytes, int]]:
+        """
+        Reads the block index.
+
+        Returns:
+            List[Tuple[bytes, int]]: The first word and the byte offset of every block.
+
+        Raises:
+            ValueError: If the run file is truncated.
+        """
+        position = self.stream.tell()
+        index_end = self.stream.seek(0, os.SEEK_END) - FOOTER.size - len(INDEX_MAGIC)
+        self.stream.seek(index_end)
+        footer = self.stream.read()
+        if not footer.endswith(INDEX_MAGIC):
+            raise ValueError("Run file is truncated.")
+        index_offset, = FOOTER.unpack_from(footer)
+        self.stream.seek(index_offset)
+        data = self.stream.read(index_end - index_offset)
+        self.stream.seek(position)
+
+        index = []
+        offset = 0
+        while offset < len(data):
+            block_offset, key_size = INDEX_ENTRY.unpack_from(data, offset)
+            offset += INDEX_ENTRY.size + key_size
+            index.append((data[offset - key_size:offset], block_offset))
+        return index
+
+    def blocks(self, low: Optional[bytes] = None) -> Iterator[List[bytes]]:
+        """
+        Lazily yields the words of the run block by block.
+
+        Args:
+            low (bytes, optional): Skip the words less than this key, using the block index to
+                seek to the first block that may hold it. Defaults to reading all words.
+        """
+        if low is not None:
+            index = self.index()
+            # The previous block may end with words equal to the first word of the next one
+            start = bisect.bisect_left([key for key, _ in index], low) - 1
+            if start >= 0:
+                self.stream.seek(index[start][1])
+        while True:
+            payload_size, count = BLOCK_HEADER.unpack(self.stream.read(BLOCK_HEADER.size))
+            if not count:
+                return
+            words = decompress_bytes(self.stream.read(payload_size), self.codec).split(b"\n")
+            if low is not None:
+                words = words[bisect.bisect_left(words, low):]
+                if not words:
+                    continue
+                low = None
+            yield words
+
+    def close(self) -> None:
+        self.stream.close()
+
+    def __enter__(self) -> "RunReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def open_run(file_path: str, buffering: int = -1) -> RunReader:
+    """
+    Opens a run file for reading.
+
+    Args:
+        file_path (str): Path of the run file.
+        buffering (int, optional): Size of the read buffer in bytes.
+    """
+    return RunReader(open(file_path, "rb", buffering=buffering))
+
+
+def sample_run_keys(file_path: str, num_samples: int) -> List[bytes]:
+    """
+    Reads evenly spaced keys of a run file from its block index, without reading any block.
+
+    Args:
+        file_path (str): Path of the run file.
+        num_samples (int): Number of samples to take.
+
+    Returns:
+        List[bytes]: The sampled keys in file order.
+    """
+    with open_run(file_path) as reader:
+        keys = [key for key, _ in reader.index()]
+    if len(keys) <= num_samples:
+        return keys[1:]
+    return [keys[len(keys) * i // (num_samples + 1)] for i in range(1, num_samples + 1)]
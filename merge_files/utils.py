@@ -1,19 +1,87 @@
+import fnmatch
+import io
 import os
+import re
 import tarfile
 import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import IO, BinaryIO, Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tgz', '.tar.gz', '.tar.bz2', '.tar.xz')
+# Archives whose members can only be read efficiently in archive order
+SEQUENTIAL_ARCHIVE_EXTENSIONS = ('.tgz', '.tar.gz', '.tar.bz2', '.tar.xz')
+# How symbolic links are handled while scanning directories: "skip" ignores them, "files"
+# includes links to files but does not descend into linked directories, "follow" does both
+SYMLINK_POLICIES = ("skip", "files", "follow")
+
+
+class ArchiveMember(NamedTuple):
+    """
+    A file inside a .zip or .tar archive that is read without extracting it.
+
+    Attributes:
+        archive (str): Path of the archive.
+        name (str): Name of the member inside the archive.
+        size (int): Uncompressed size of the member in bytes.
+        offset (int, optional): Offset of the data of a member of an uncompressed tar archive,
+            None for other archives.
+    """
+    archive: str
+    name: str
+    size: int
+    offset: Optional[int] = None
+
+    def __str__(self) -> str:
+        return f"{self.archive}/{self.name}"
+
+
+def archive_extension(path: str) -> Optional[str]:
+    """
+    Returns the supported archive extension of a path, or None if it is not an archive.
+
+    Args:
+        path (str): A file path.
+    """
+    filename, ext = os.path.splitext(path)
+    ext = os.path.splitext(filename)[1] + ext
+    if ext in ARCHIVE_EXTENSIONS:
+        return ext
+    ext = os.path.splitext(path)[1]
+    return ext if ext in ARCHIVE_EXTENSIONS else None
+
+
+def is_archive(path: str) -> bool:
+    """
+    Checks if the path is an existing archive file of a supported type.
+
+    Args:
+        path (str): A file path.
+    """
+    return os.path.isfile(path) and archive_extension(path) is not None
+
+
+def is_sequential_archive(path: str) -> bool:
+    """
+    Checks if the path is a compressed tar archive, whose members can only be read efficiently
+    in a single pass in archive order.
+
+    Args:
+        path (str): A file path.
+    """
+    return archive_extension(path) in SEQUENTIAL_ARCHIVE_EXTENSIONS
 
 
 def check_valid_path(path: str) -> str:
     """
-    Check if the input path is a folder. If it is a compressed file, extract the
-    folder inside and return its path.
+    Check if the input path is a folder or a supported archive. Archives are not extracted,
+    their members are read directly while merging.
 
     Args:
         path (str): A string representing the path to be checked.
 
     Returns:
-        str: A string representing the path to the folder inside the compressed
-        file or the original input path if it is a folder.
+        str: The input path.
 
     Raises:
         ValueError: If the input path is None, or it is not a folder and it is not
@@ -25,23 +93,13 @@ def check_valid_path(path: str) -> str:
     if os.path.isdir(path):
         return path
 
-    extract_methods = {
-        '.zip': zipfile.ZipFile,
-        '.tar': tarfile.open,
-        '.tgz': tarfile.open,
-        '.tar.gz': tarfile.open,
-    }
-
-    filename, ext = os.path.splitext(path)
-    ext = os.path.splitext(filename)[1] + ext
-    if ext in extract_methods:
-        extract_method = extract_methods[ext]
+    if is_archive(path):
         try:
-            with extract_method(path, 'r') as ref:
-                folder_name = os.path.splitext(os.path.basename(path))[0]
-                extract_path = os.path.join(os.path.dirname(path), folder_name)
-                ref.extractall(extract_path)
-                return extract_path
+            if archive_extension(path) == '.zip':
+                with zipfile.ZipFile(path, 'r'):
+                    return path
+            with tarfile.open(path, 'r'):
+                return path
         except (zipfile.BadZipfile, tarfile.ReadError) as e:
             raise ValueError(f"File could not be opened successfully:") from e
 
@@ -49,32 +107,282 @@ def check_valid_path(path: str) -> str:
     raise ValueError(f"Please enter a valid path: {path}")
 
 
-def list_files(input_dir):
+def list_archive_members(path: str) -> List[ArchiveMember]:
+    """
+    Return the regular files inside an archive in archive order.
+
+    Args:
+        path (str): Path of a supported archive.
+
+    Returns:
+        A list of archive members.
+    """
+    if archive_extension(path) == '.zip':
+        with zipfile.ZipFile(path, 'r') as archive:
+            return [ArchiveMember(path, info.filename, info.file_size)
+                    for info in archive.infolist() if not info.is_dir()]
+    sequential = is_sequential_archive(path)
+    with tarfile.open(path, 'r') as archive:
+        return [ArchiveMember(path, info.name, info.size, None if sequential else info.offset_data)
+                for info in archive if info.isfile()]
+
+
+def iter_archive_members(path: str) -> Iterator[Tuple[ArchiveMember, BinaryIO]]:
+    """
+    Yields the regular files inside an archive with a binary stream of their content, reading
+    the archive in a single sequential pass. Each stream is only valid until the next member
+    is yielded.
+
+    Args:
+        path (str): Path of a supported archive.
+    """
+    if archive_extension(path) == '.zip':
+        with zipfile.ZipFile(path, 'r') as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as stream:
+                        yield ArchiveMember(path, info.filename, info.file_size), stream
+        return
+    # Stream mode never seeks backwards, so compressed archives are decompressed only once
+    with tarfile.open(path, 'r|*') as archive:
+        for info in archive:
+            if info.isfile():
+                with archive.extractfile(info) as stream:
+                    yield ArchiveMember(path, info.name, info.size), \
+                        io.BufferedReader(_SequentialReader(stream))
+
+
+class _SequentialReader(io.RawIOBase):
+    """
+    A read-only, non-seekable view of a stream, used for members of tar archives in stream
+    mode whose file objects cannot be wrapped in a text stream directly.
+    """
+
+    def __init__(self, stream: BinaryIO) -> None:
+        super().__init__()
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self._stream.readinto(buffer)
+
+
+class _FileSlice(io.RawIOBase):
     """
-    Return a list of file paths in the specified directory.
+    A read-only view of a byte range of a file, used for members of uncompressed tar archives.
+    """
+
+    def __init__(self, path: str, offset: int, size: int) -> None:
+        super().__init__()
+        self._file = open(path, 'rb', buffering=0)
+        self._file.seek(offset)
+        self._remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def open_archive_member(member: ArchiveMember, buffer_size: int = io.DEFAULT_BUFFER_SIZE
+                        ) -> BinaryIO:
+    """
+    Opens a member of an archive for reading without extracting it. Members of .zip archives
+    and of uncompressed .tar archives can be open at the same time.
+
+    Args:
+        member (ArchiveMember): The member to open.
+        buffer_size (int): Size of the read buffer in bytes.
+
+    Returns:
+        BinaryIO: A binary stream of the member's content.
+
+    Raises:
+        ValueError: If the member belongs to a compressed tar archive, which can only be read
+        in archive order with `iter_archive_members`.
+    """
+    if member.offset is not None:
+        return io.BufferedReader(_FileSlice(member.archive, member.offset, member.size),
+                                 buffer_size)
+    if archive_extension(member.archive) == '.zip':
+        with zipfile.ZipFile(member.archive, 'r') as archive:
+            # The member keeps the archive file open after the archive is closed
+            return archive.open(member.name)
+    raise ValueError(
+        f"Members of {member.archive} can only be read in archive order: {member.name}")
+
+
+def compile_globs(patterns: Sequence[str]) -> Callable[[str], bool]:
+    """
+    Compiles glob patterns into a function that checks whether a path matches any of them. A
+    pattern that contains a "/" is matched against the whole path, other patterns against its
+    last component, so "*.txt" matches files in any directory.
+
+    Args:
+        patterns (Sequence[str]): Glob patterns in the syntax of `fnmatch`.
+
+    Returns:
+        Callable[[str], bool]: Checks a path relative to the scanned directory, with "/"
+        separators.
+    """
+    def compile_any(globs: List[str]) -> Optional[Callable]:
+        if not globs:
+            return None
+        flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+        return re.compile("|".join(fnmatch.translate(glob) for glob in globs), flags).match
+
+    match_path = compile_any([pattern for pattern in patterns if "/" in pattern])
+    match_name = compile_any([pattern for pattern in patterns if "/" not in pattern])
+
+    def matches(path: str) -> bool:
+        if match_name is not None and match_name(path.rsplit("/", 1)[-1]):
+            return True
+        return match_path is not None and match_path(path) is not None
+
+    return matches
+
+
+def iter_files(directory: str, recursive: bool = False, include: Optional[Sequence[str]] = None,
+               exclude: Optional[Sequence[str]] = None, symlinks: str = "files",
+               max_workers: Optional[int] = None) -> Iterator[str]:
+    """
+    Lazily yields the paths of the files in a directory, scanning subdirectories in a pool of
+    threads. The paths are yielded as soon as the directory that holds them has been scanned,
+    so they come in no particular order. Entries are classified by `os.scandir` without
+    reading their metadata where the platform allows it.
+
+    Args:
+        directory (str): Path of the directory.
+        recursive (bool, optional): Whether to scan subdirectories. Defaults to False.
+        include (Sequence[str], optional): Only yield files that match one of these globs, see
+            `compile_globs`. Defaults to all files.
+        exclude (Sequence[str], optional): Skip files and directories that match one of these
+            globs. Defaults to none.
+        symlinks (str, optional): How symbolic links are handled, one of `SYMLINK_POLICIES`.
+            Defaults to "files".
+        max_workers (int, optional): Number of scanning threads. Defaults to the default of
+            `concurrent.futures.ThreadPoolExecutor`.
+
+    Raises:
+        ValueError: If the symlink policy is not supported.
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"Unsupported symlink policy: {symlinks}. Choose one of "
+                         f"{SYMLINK_POLICIES}")
+    root = os.path.join(directory, "")
+    included = compile_globs(include) if include else None
+    excluded = compile_globs(exclude) if exclude else None
+
+    def scan(path: str) -> Tuple[List[str], List[Tuple[str, Tuple[int, int]]]]:
+        files, subdirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if symlinks == "skip" and entry.is_symlink():
+                    continue
+                if included or excluded:
+                    relative = entry.path[len(root):].replace(os.sep, "/")
+                    if excluded and excluded(relative):
+                        continue
+                if entry.is_dir(follow_symlinks=symlinks == "follow"):
+                    if recursive:
+                        stat = entry.stat()
+                        subdirs.append((entry.path, (stat.st_dev, stat.st_ino)))
+                elif entry.is_file() and (not included or included(relative)):
+                    files.append(entry.path)
+        return files, subdirs
+
+    root_stat = os.stat(directory)
+    # Linked directories can form cycles, every directory is scanned once
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    with ThreadPoolExecutor(max_workers) as pool:
+        pending = {pool.submit(scan, directory)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                yield from files
+                for subdir, key in subdirs:
+                    if key not in visited:
+                        visited.add(key)
+                        pending.add(pool.submit(scan, subdir))
+
+
+def list_files(input_dir, recursive=False, include=None, exclude=None, symlinks="files"):
+    """
+    Return a sorted list of file paths in the specified directory, or of the members of the
+    specified archive.
 
     This function uses the `os.scandir` method to efficiently list files in the
     directory, which can handle large numbers of files more efficiently than
     using `os.listdir`. Each item in the returned list is the full path to a
-    file in the directory.
+    file in the directory. Subdirectories are scanned in parallel, see `iter_files`.
 
     Args:
-        input_dir (str): The path to the directory to list files from.
+        input_dir (str): The path to the directory or archive to list files from.
+        recursive (bool): Whether to list the files in subdirectories as well.
+        include (Sequence[str], optional): Only list files, or archive members, that match one
+            of these globs.
+        exclude (Sequence[str], optional): Skip files, directories and archive members that
+            match one of these globs.
+        symlinks (str): How symbolic links are handled, one of `SYMLINK_POLICIES`.
 
     Returns:
-        A list of file paths in the specified directory.
+        A list of file paths in the specified directory, or of archive members.
     Raises:
         FileNotFoundError: If the specified directory does not exist or is not a directory.
         ValueError: If the specified directory does not contain any files.
     """
     if not os.path.exists(input_dir):
         raise FileNotFoundError(f"{input_dir} does not exist.")
-    if not os.path.isdir(input_dir):
+    if is_archive(input_dir):
+        included = compile_globs(include or ["*"])
+        excluded = compile_globs(exclude or [])
+        files = [member for member in list_archive_members(input_dir)
+                 if included(member.name) and not excluded(member.name)]
+    elif not os.path.isdir(input_dir):
         raise FileNotFoundError(f"{input_dir} is not a directory.")
-
-    files = [os.path.join(input_dir, f.name) for f in os.scandir(input_dir) if f.is_file()]
+    else:
+        files = sorted(iter_files(input_dir, recursive, include, exclude, symlinks))
 
     if not files:
         raise ValueError(f"{input_dir} does not contain any files.")
 
     return files
+
+
+def read_file_list(stream: IO[str]) -> List[str]:
+    """
+    Reads a list of input files, one path per line, e.g. from the standard output of `find`.
+    Empty lines are skipped.
+
+    Args:
+        stream (IO[str]): The list, opened in text mode.
+
+    Returns:
+        List[str]: The paths of the files.
+
+    Raises:
+        FileNotFoundError: If a listed path is not a file.
+        ValueError: If the list is empty.
+    """
+    files = [line.rstrip("\r\n") for line in stream]
+    files = [file for file in files if file]
+    for file in files:
+        if not os.path.isfile(file):
+            raise FileNotFoundError(f"{file} is not a file.")
+    if not files:
+        raise ValueError("The list of input files is empty.")
+    return files
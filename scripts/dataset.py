@@ -1,34 +1,315 @@
-from faker import Faker
+import multiprocessing
 import os
 import random
+import re
+import string
+from collections import Counter
+from typing import List, NamedTuple, Optional, Sequence, Tuple
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
 
-def generate_fake_dataset(num_files: int, min_words_per_file: int,
-                          max_words_per_file: int, output_dir: str) -> None:
+
+LETTERS = string.ascii_lowercase.encode()
+LETTER_TABLE = bytes(LETTERS[i % len(LETTERS)] for i in range(256))
+# Words sorted in memory at once: files are written bucket by bucket, where a bucket holds the
+# words of one prefix, so the size of a file is only limited by the disk
+BUCKET_WORDS = 1 << 20
+# Words drawn at once from the vocabulary by the pure Python word source
+DRAW_BLOCK = 1 << 16
+WRITE_BUFFER_SIZE = 1024 * 1024
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+class DatasetOptions(NamedTuple):
+    """
+    Options shared by all files of a generated dataset.
+
+    Attributes:
+        min_word_length (int): Minimum length of a word in characters.
+        max_word_length (int): Maximum length of a word in characters.
+        duplicate_ratio (float): Fraction of the words of a file that repeat another word of
+            the file, when there is no vocabulary.
+        zipf (float): Exponent of the Zipf distribution of the vocabulary words, 0 for a
+            uniform distribution.
+        vocabulary (Sequence[bytes], optional): Sorted words the files are drawn from, None
+            for random words.
+        seed (int): Seed of the dataset. Every file gets its own stream derived from it, so a
+            dataset does not depend on the number of processes writing it.
     """
-    Generates a fake dataset of files containing random words.
+    min_word_length: int
+    max_word_length: int
+    duplicate_ratio: float
+    zipf: float
+    vocabulary: Optional[Sequence[bytes]]
+    seed: int
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses a size such as "512M" or "200G" into bytes.
+
+    Args:
+        size (str): A number followed by an optional K, M, G or T unit (powers of 1024).
+
+    Returns:
+        int: The size in bytes.
+
+    Raises:
+        ValueError: If the size cannot be parsed.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", str(size).upper())
+    if match is None:
+        raise ValueError(f"Invalid size: {size}. Use a number with an optional K, M, G or T "
+                         "unit.")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+class _PythonWordSource:
+    """
+    Draws random words with the `random` module. It is used when NumPy is not installed and is
+    several times slower than `_NumpyWordSource`.
+    """
+
+    def __init__(self, seed: Tuple[int, ...]) -> None:
+        self.rng = random.Random("-".join(map(str, seed)))
+
+    def _bytes(self, count: int) -> bytes:
+        return self.rng.getrandbits(8 * count).to_bytes(count, "little") if count else b""
+
+    def words(self, count: int, prefix: bytes, min_length: int, max_length: int) -> List[bytes]:
+        # Random bytes are mapped to letters in bulk, which is much faster than drawing every
+        # letter. The letters are not perfectly uniform, since 256 is not a multiple of 26.
+        spread = max_length - min_length + 1
+        if spread <= 256:
+            lengths = [min_length + byte % spread for byte in self._bytes(count)]
+        else:
+            lengths = [self.rng.randint(min_length, max_length) for _ in range(count)]
+        letters = self._bytes(sum(lengths)).translate(LETTER_TABLE)
+        words, start = [], 0
+        for length in lengths:
+            words.append(prefix + letters[start:start + length])
+            start += length
+        return words
+
+    def sample(self, words: List[bytes], count: int) -> List[bytes]:
+        return self.rng.choices(words, k=count)
+
+    def shuffle(self, count: int) -> List[int]:
+        ranks = list(range(count))
+        self.rng.shuffle(ranks)
+        return ranks
+
+    def counts(self, total: int, weights: Sequence[float]) -> List[int]:
+        if len(set(weights)) == 1:
+            # Drawing every word would take as long as generating it, so a uniform total is
+            # split evenly and the remainder spread at random
+            share, remainder = divmod(total, len(weights))
+            extra = set(self.rng.sample(range(len(weights)), remainder))
+            return [share + (i in extra) for i in range(len(weights))]
+        counter, population = Counter(), range(len(weights))
+        cum_weights, acc = [], 0.0
+        for weight in weights:
+            acc += weight
+            cum_weights.append(acc)
+        for start in range(0, total, DRAW_BLOCK):
+            counter.update(self.rng.choices(population, cum_weights=cum_weights,
+                                            k=min(DRAW_BLOCK, total - start)))
+        return [counter[i] for i in population]
+
+
+class _NumpyWordSource:
+    """
+    Draws random words in bulk with NumPy, as rows of a byte matrix viewed as fixed width
+    strings. Unused trailing bytes are zeros, which NumPy strips from the strings.
+    """
+
+    def __init__(self, seed: Tuple[int, ...]) -> None:
+        self.rng = numpy.random.default_rng(list(seed))
+
+    def words(self, count: int, prefix: bytes, min_length: int, max_length: int) -> List[bytes]:
+        width = len(prefix) + max_length
+        if width == 0:
+            return [b""] * count
+        matrix = self.rng.integers(LETTERS[0], LETTERS[-1] + 1, size=(count, width),
+                                   dtype=numpy.uint8)
+        matrix[:, :len(prefix)] = numpy.frombuffer(prefix, dtype=numpy.uint8)
+        lengths = len(prefix) + self.rng.integers(min_length, max_length + 1, size=count)
+        matrix[numpy.arange(width) >= lengths[:, None]] = 0
+        return matrix.view(f"S{width}").ravel().tolist()
+
+    def sample(self, words: List[bytes], count: int) -> List[bytes]:
+        indices = self.rng.integers(0, len(words), size=count)
+        return [words[i] for i in indices.tolist()]
+
+    def shuffle(self, count: int) -> List[int]:
+        return self.rng.permutation(count).tolist()
+
+    def counts(self, total: int, weights: Sequence[float]) -> List[int]:
+        weights = numpy.asarray(weights, dtype=float)
+        return self.rng.multinomial(total, weights / weights.sum()).tolist()
+
+
+def _word_source(*seed: int):
+    return (_PythonWordSource if numpy is None else _NumpyWordSource)(seed)
+
+
+def _prefix_length(num_words: int, min_word_length: int) -> int:
+    length = 0
+    while len(LETTERS) ** length * BUCKET_WORDS < num_words and length < min_word_length:
+        length += 1
+    return length
+
+
+def _prefixes(length: int) -> List[bytes]:
+    prefixes = [b""]
+    for _ in range(length):
+        prefixes = [prefix + bytes([letter]) for prefix in prefixes for letter in LETTERS]
+    return prefixes
+
+
+def generate_vocabulary(size: int, min_word_length: int, max_word_length: int,
+                        seed: int) -> List[bytes]:
+    """
+    Generates distinct random words.
+
+    Args:
+        size (int): The number of words.
+        min_word_length (int): Minimum length of a word in characters.
+        max_word_length (int): Maximum length of a word in characters.
+        seed (int): Seed of the words.
+
+    Returns:
+        List[bytes]: The sorted words.
+
+    Raises:
+        ValueError: If there are fewer possible words than the size.
+    """
+    possible = sum(len(LETTERS) ** length
+                   for length in range(min_word_length, max_word_length + 1))
+    if size > possible:
+        raise ValueError(f"Only {possible} distinct words of {min_word_length} to "
+                         f"{max_word_length} characters exist, {size} were requested.")
+    source = _word_source(seed)
+    words = set()
+    while len(words) < size:
+        # Short words collide often, so the draws are repeated until there are enough of them
+        words.update(source.words(size - len(words), b"", min_word_length, max_word_length))
+    return sorted(words)
+
+
+def _write_vocabulary_words(f, source, num_words: int, options: DatasetOptions) -> None:
+    vocabulary = options.vocabulary
+    if options.zipf:
+        # The most frequent words are spread over the vocabulary instead of sorting first
+        weights = [1.0 / (rank + 1) ** options.zipf for rank in source.shuffle(len(vocabulary))]
+    else:
+        weights = [1.0] * len(vocabulary)
+    for word, count in zip(vocabulary, source.counts(num_words, weights)):
+        line = word + b"\n"
+        # Frequent words are written in pieces instead of one huge repeated string
+        step = max(1, WRITE_BUFFER_SIZE // len(line))
+        while count > 0:
+            f.write(line * min(count, step))
+            count -= step
+
+
+def _write_random_words(f, source, num_words: int, options: DatasetOptions) -> None:
+    prefix_length = _prefix_length(num_words, options.min_word_length)
+    prefixes = _prefixes(prefix_length)
+    min_length = options.min_word_length - prefix_length
+    max_length = options.max_word_length - prefix_length
+    for prefix, count in zip(prefixes, source.counts(num_words, [1.0] * len(prefixes))):
+        if count == 0:
+            continue
+        unique = max(1, count - round(count * options.duplicate_ratio))
+        words = source.words(unique, prefix, min_length, max_length)
+        words += source.sample(words, count - unique)
+        words.sort()
+        f.write(b"\n".join(words))
+        f.write(b"\n")
+
+
+def write_dataset_file(path: str, index: int, num_words: int, options: DatasetOptions) -> None:
+    """
+    Writes a file of sorted random words. The words are generated and sorted one prefix at a
+    time, so the memory used does not grow with the size of the file.
+
+    Args:
+        path (str): Path of the file.
+        index (int): Index of the file in the dataset, which selects its random stream.
+        num_words (int): The number of words of the file.
+        options (DatasetOptions): Options of the dataset.
+    """
+    source = _word_source(options.seed, index)
+    with open(path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+        if options.vocabulary is None:
+            _write_random_words(f, source, num_words, options)
+        else:
+            _write_vocabulary_words(f, source, num_words, options)
+
+
+_worker_options: Optional[DatasetOptions] = None
+
+
+def _init_worker(options: DatasetOptions) -> None:
+    # The vocabulary is sent once per worker process instead of once per file
+    global _worker_options
+    _worker_options = options
+
+
+def _write_file(task: Tuple[str, int, int]) -> str:
+    path, index, num_words = task
+    write_dataset_file(path, index, num_words, _worker_options)
+    return path
+
+
+def generate_fake_dataset(num_files: int, min_words_per_file: int, max_words_per_file: int,
+                          output_dir: str, min_word_length: int = 4, max_word_length: int = 12,
+                          vocabulary_size: int = 0, zipf: float = 0.0,
+                          duplicate_ratio: float = 0.0, total_size: Optional[int] = None,
+                          num_processes: int = 1, seed: Optional[int] = None) -> List[str]:
+    """
+    Generates a fake dataset of files containing sorted random words.
 
     Args:
         num_files (int): The number of files to generate.
         min_words_per_file (int): The minimum number of words per file.
         max_words_per_file (int): The maximum number of words per file.
         output_dir (str): The directory to write the generated files to.
+        min_word_length (int, optional): Minimum length of a word in characters. Defaults to 4.
+        max_word_length (int, optional): Maximum length of a word in characters. Defaults
+            to 12.
+        vocabulary_size (int, optional): Number of distinct words the files are drawn from, 0
+            for random words that are rarely repeated. Defaults to 0.
+        zipf (float, optional): Exponent of the Zipf distribution of the vocabulary words, 0
+            for a uniform distribution. Defaults to 0.
+        duplicate_ratio (float, optional): Fraction of the words of each file that repeat
+            another word of the file, without a vocabulary. Defaults to 0.
+        total_size (int, optional): Approximate size of the dataset in bytes. If given, it
+            overrides the number of words per file. Defaults to None.
+        num_processes (int, optional): Number of processes writing the files. Defaults to 1.
+        seed (int, optional): Seed of the dataset, which is the same for the same seed and
+            options. Defaults to a random seed.
 
     Raises:
         TypeError: If any of the arguments are not of the correct type.
-        ValueError: If the value of min_words_per_file is greater than max_words_per_file.
+        ValueError: If the value of min_words_per_file is greater than max_words_per_file, or
+            another option is out of range.
 
     Returns:
-        None.
+        List[str]: Paths of the generated files.
 
-    The function generates a fake dataset with a specified number of files and a random number of words per file.
-    The words are generated using the Faker library and are sorted alphabetically before being written to the output files.
-
-    If the output directory does not exist, it will be created. The files will be named 'file_0.dat', 'file_1.dat', etc.,
-    and will be written to the specified output directory.
+    If the output directory does not exist, it will be created. The files will be named
+    'file_0.dat', 'file_1.dat', etc., and will be written to the specified output directory.
+    The random words are drawn with NumPy if it is installed, and with the much slower
+    `random` module otherwise.
 
     Example:
-        >>> generate_fake_dataset(num_files=10, min_words_per_file=100, max_words_per_file=500, output_dir='dataset/small_dataset')
+        >>> generate_fake_dataset(num_files=10, min_words_per_file=100, max_words_per_file=500,
+        ...                       output_dir='dataset/small_dataset')
     """
     if not isinstance(num_files, int) or not isinstance(min_words_per_file, int) or not isinstance(max_words_per_file, int):
         raise TypeError(
@@ -40,28 +321,45 @@ def generate_fake_dataset(num_files: int, min_words_per_file: int,
     if min_words_per_file > max_words_per_file:
         raise ValueError(
             "The value of 'min_words_per_file' cannot be greater than 'max_words_per_file'.")
+    if not 0 <= min_word_length <= max_word_length:
+        raise ValueError("The word lengths must satisfy 0 <= min_word_length <= max_word_length.")
+    if not 0 <= duplicate_ratio < 1:
+        raise ValueError("The value of 'duplicate_ratio' must be in [0, 1).")
+    if duplicate_ratio and vocabulary_size:
+        raise ValueError("The 'duplicate_ratio' cannot be combined with a vocabulary, whose "
+                         "duplicates are set by 'vocabulary_size' and 'zipf'.")
+    if zipf and not vocabulary_size:
+        raise ValueError("The 'zipf' distribution needs a 'vocabulary_size'.")
 
-    # Set up the Faker generator
-    fake = Faker()
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    rng = random.Random(seed)
+    if total_size is not None:
+        # Every word takes its average length plus a newline
+        words_per_file = total_size / num_files / ((min_word_length + max_word_length) / 2 + 1)
+        min_words_per_file = max_words_per_file = max(1, round(words_per_file))
+    vocabulary = None
+    if vocabulary_size:
+        vocabulary = generate_vocabulary(vocabulary_size, min_word_length, max_word_length, seed)
+    options = DatasetOptions(min_word_length, max_word_length, duplicate_ratio, zipf,
+                             vocabulary, seed)
 
     # Create the output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
-
-    # Generate and sort the words for each file
-    for i in range(num_files):
-        # Generate a random number of words for the file
-        words_per_file = random.randint(min_words_per_file, max_words_per_file)
-        # Generate the unique words
-        words = set()
-        while len(words) < words_per_file:
-            words.add(fake.word().lower())
-        # Sort the words
-        words = sorted(words)
-        # Write the words to the output file
-        output_file = os.path.join(output_dir, f'file_{i}.dat')
-        with open(output_file, 'w') as f:
-            f.write('\n'.join(words))
+    tasks = [(os.path.join(output_dir, f'file_{i}.dat'), i,
+              rng.randint(min_words_per_file, max_words_per_file)) for i in range(num_files)]
+    if num_processes > 1 and num_files > 1:
+        # Largest files first, so a huge file does not start last
+        tasks.sort(key=lambda task: task[2], reverse=True)
+        with multiprocessing.Pool(min(num_processes, num_files), initializer=_init_worker,
+                                  initargs=(options,)) as pool:
+            for _ in pool.imap_unordered(_write_file, tasks):
+                pass
+        tasks.sort(key=lambda task: task[1])
+    else:
+        for path, index, num_words in tasks:
+            write_dataset_file(path, index, num_words, options)
     print("Fake dataset has been generated.")
+    return [path for path, _, _ in tasks]
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@
 import setuptools
 from commands.generate_fake_dataset import GenerateFakeDataset
 from commands.generate_coverage import CoverageCommand
+from commands.run_benchmarks import RunBenchmarks
 
 with open("README.md", "r", encoding="utf-8") as fh:
     long_description = fh.read()
@@ -28,11 +29,15 @@ setuptools.setup(
         ],
     },
     install_requires=[
-        'faker==17.0.0',
         'coverage==7.1.0'
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+        'dataset': ['numpy'],
+    },
     cmdclass={
         'generate_fake_dataset': GenerateFakeDataset,
         'coverage': CoverageCommand,
+        'benchmark': RunBenchmarks,
     }
 )
@@ -0,0 +1,130 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from merge_files.main import merge
+from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+from merge_files.utils import (ArchiveMember, iter_archive_members, list_files,
+                               open_archive_member)
+
+
+class TestArchiveInput(unittest.TestCase):
+    """
+    A test suite for merging archives without extracting them
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.temp_dir.name, "input")
+        os.mkdir(self.input_dir)
+        self.contents = {}
+        for i in range(5):
+            words = sorted(f"word{n:04d}" for n in range(i, 400, 5 - i % 2))
+            self.contents[f"file{i}.txt"] = words
+            with open(os.path.join(self.input_dir, f"file{i}.txt"), "w") as f:
+                f.write("\n".join(words) + "\n")
+        self.expected = sorted(set().union(*self.contents.values()))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_archive(self, name):
+        path = os.path.join(self.temp_dir.name, name)
+        if name.endswith(".zip"):
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+                for filename in sorted(self.contents):
+                    archive.write(os.path.join(self.input_dir, filename), f"data/{filename}")
+        else:
+            mode = {".tar": "w", ".gz": "w:gz", ".xz": "w:xz"}[os.path.splitext(name)[1]]
+            with tarfile.open(path, mode) as archive:
+                for filename in sorted(self.contents):
+                    archive.add(os.path.join(self.input_dir, filename), f"data/{filename}")
+        return path
+
+    def read_output(self, filename="output.txt"):
+        with open(os.path.join(self.temp_dir.name, filename)) as f:
+            return f.read().splitlines()
+
+    def test_list_and_open_members(self):
+        for name in ("input.zip", "input.tar"):
+            with self.subTest(name=name):
+                members = list_files(self.make_archive(name))
+                self.assertEqual([os.path.basename(member.name) for member in members],
+                                 sorted(self.contents))
+                for member in members:
+                    with open_archive_member(member) as stream:
+                        self.assertEqual(stream.read().decode().splitlines(),
+                                         self.contents[os.path.basename(member.name)])
+
+    def test_members_of_compressed_tar_are_read_in_order(self):
+        path = self.make_archive("input.tar.gz")
+        names = []
+        for member, stream in iter_archive_members(path):
+            names.append(os.path.basename(member.name))
+            self.assertEqual(stream.read().decode().splitlines(), self.contents[names[-1]])
+        self.assertEqual(names, sorted(self.contents))
+        with self.assertRaises(ValueError):
+            open_archive_member(ArchiveMember(path, "data/file0.txt", 0))
+
+    def test_mergers_read_members(self):
+        for name in ("input.zip", "input.tar"):
+            for merger_class in (BasicFileMerger, AsyncFileMerger, ParallelFileMerger):
+                with self.subTest(name=name, merger=merger_class.__name__):
+                    members = list_files(self.make_archive(name))
+                    merger_class(members, self.temp_dir.name, "output.txt", 2, 10).merge_files()
+                    self.assertEqual(self.read_output(), self.expected)
+
+    @patch('merge_files.main.print')
+    def test_merge_archive_without_extracting(self, print_mock):
+        for name in ("input.zip", "input.tar", "input.tar.gz", "input.tar.xz"):
+            for archive_order in (False, True):
+                with self.subTest(name=name, archive_order=archive_order):
+                    path = self.make_archive(name)
+                    before = set(os.listdir(self.temp_dir.name)) | {"output.txt"}
+                    merge(path, self.temp_dir.name, "output.txt", 2, 10, False, 2,
+                          archive_order=archive_order)
+                    self.assertEqual(self.read_output(), self.expected)
+                    # Nothing is extracted next to the archive
+                    self.assertEqual(set(os.listdir(self.temp_dir.name)), before)
+
+    @patch('merge_files.main.print')
+    def test_compressed_members_are_decompressed(self, print_mock):
+        path = os.path.join(self.temp_dir.name, "input.tar")
+        with tarfile.open(path, "w") as archive:
+            for i, filename in enumerate(sorted(self.contents)):
+                data = "".join(word + "\n" for word in self.contents[filename]).encode()
+                # Members are detected by their content, whatever their name
+                data = (gzip.compress, bz2.compress, lzma.compress, bytes)[i % 4](data)
+                info = tarfile.TarInfo(f"data/{filename}")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        for archive_order in (False, True):
+            with self.subTest(archive_order=archive_order):
+                merge(path, self.temp_dir.name, "output.txt", 2, 10, False, 2,
+                      archive_order=archive_order)
+                self.assertEqual(self.read_output(), self.expected)
+
+    @patch('merge_files.mergers.base.print')
+    def test_archive_order_groups_members_into_runs(self, print_mock):
+        path = self.make_archive("input.tar.gz")
+        merger = BasicFileMerger([path], self.temp_dir.name, "output.txt", 2, 10,
+                                 archive_order=True)
+        with patch('merge_files.mergers.base.ARCHIVE_GROUP_BUDGET', 100):
+            # Every member exceeds the budget and is streamed into a run of its own
+            runs = merger._split_archive(path, ".large")
+        self.assertEqual(len(runs), len(self.contents))
+        with patch('merge_files.mergers.base.ARCHIVE_GROUP_BUDGET', 2000):
+            # At most two members are merged in memory into a run
+            runs += merger._split_archive(path, "")
+        self.assertEqual(len(runs), len(self.contents) + 3)
+        merger._merge_intermediate_files(runs, delete=True)
+        self.assertEqual(self.read_output(), self.expected)
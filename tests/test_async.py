@@ -1,10 +1,15 @@
 import os
 import asyncio
 import glob
+import tempfile
+import time
 import unittest
 from unittest.mock import (AsyncMock,
                            patch)
 from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.base import FileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.metrics import MergeMetrics
 from merge_files.utils import list_files
 
 
@@ -88,6 +93,58 @@ class TestAsyncFileMerger(unittest.TestCase):
         mock_merge_intermediate_files.assert_called_once_with(
             [], delete=True)
 
+    @patch.object(AsyncFileMerger, '_split_into_files', new_callable=AsyncMock)
+    @patch.object(AsyncFileMerger, '_merge_intermediate_files')
+    def test_merge_files_looks_up_input_files_once(self, mock_merge_intermediate_files,
+                                                   mock_split_into_files):
+        """
+        Test that the sizes of the input files are looked up once for the chunks, the disk space
+        check and the progress
+        """
+        mock_split_into_files.return_value = []
+        merger = AsyncFileMerger(self.input_list, self.output_dir, self.filename,
+                                 self.chunk_size_file, self.chunk_size_line,
+                                 metrics=MergeMetrics([lambda event: None]))
+        with patch.object(AsyncFileMerger, '_file_size', autospec=True,
+                          side_effect=FileMerger._file_size) as mock_file_size:
+            merger.merge_files()
+        self.assertEqual(mock_file_size.call_count, len(self.input_list))
+        mock_split_into_files.assert_awaited_once_with(self.chunks)
+        self.assertEqual(merger.metrics.total_bytes,
+                         sum(map(os.path.getsize, self.input_list)))
+
+    def test_merge_files_overlaps_io_on_slow_disk(self):
+        """
+        Benchmark both mergers on a simulated slow disk where the first access to an input file
+        takes 100 ms. The async merger must overlap the reads of its chunks and finish faster
+        than the basic merger, which reads the files one after another.
+        """
+        latency = 0.1
+        open_input = FileMerger._open_input
+        input_dir = self.input_dir
+
+        def slow_open_input(merger, file_path):
+            # Only the input files are on the slow disk, intermediate files are local
+            if file_path.startswith(input_dir):
+                time.sleep(latency)
+            return open_input(merger, file_path)
+
+        with tempfile.TemporaryDirectory() as tempdir, \
+                patch.object(FileMerger, '_open_input', slow_open_input), \
+                patch('builtins.print'):
+            elapsed = {}
+            for merger_class in (BasicFileMerger, AsyncFileMerger):
+                merger = merger_class(self.input_list, tempdir, merger_class.__name__, 1,
+                                      self.chunk_size_line)
+                tic = time.monotonic()
+                merger.merge_files()
+                elapsed[merger_class] = time.monotonic() - tic
+
+                with open(merger.output_file) as f:
+                    self.assertEqual(f.read().split(), sorted("abcdefghijklmno"))
+
+        self.assertLess(elapsed[AsyncFileMerger], elapsed[BasicFileMerger] / 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,12 @@
 import os
+import sys
+import heapq
 import tempfile
 import unittest
 import asyncio
 import shutil
+import subprocess
+from collections import Counter
 
 from unittest.mock import patch
 from merge_files.mergers.base import FileMerger
@@ -64,10 +68,27 @@ class TestFileMerger(unittest.TestCase):
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             loop.run_until_complete(self.file_merger._create_intermediate(input_files, output_file))
-            with open(output_file, 'r') as f:
-                actual_output = f.readlines()
+            actual_output = list(self.file_merger._read_lines(output_file))
             self.assertEqual(len(actual_output), expected_output)
 
+    def test_create_intermediate_is_globally_sorted(self):
+        """
+        Test that an intermediate file is a single sorted run even if the files hold many more
+        lines than the line chunk size.
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_files = []
+            for i in range(3):
+                input_files.append(os.path.join(tempdir, f"file{i}.dat"))
+                with open(input_files[-1], "w") as f:
+                    # Skewed files, so batches of equal line counts cover different key ranges
+                    f.write("".join(f"{n:03d}\n" for n in range(0, 300, i + 1)))
+            output_file = os.path.join(tempdir, 'test_output.dat.0')
+            with patch('builtins.print'):
+                asyncio.run(self.file_merger._create_intermediate(input_files, output_file))
+            self.assertEqual(list(self.file_merger._read_lines(output_file)),
+                             [f"{n:03d}" for n in range(300)])
+
     @patch.object(FileMerger, "_create_intermediate")
     def test_merge_intermediate_files(self, mock_create_intermediate):
         """
@@ -97,6 +118,99 @@ class TestFileMerger(unittest.TestCase):
             for file_path in temp_int_files:
                 self.assertFalse(os.path.exists(file_path))
 
+    @unittest.skipUnless(sys.platform.startswith("linux"), "ru_maxrss is reported in KiB on Linux")
+    def test_merge_intermediate_files_bounded_memory(self):
+        """
+        Test that the peak memory of the final merge does not grow with the size of the files.
+        """
+        script = (
+            "import resource, sys\n"
+            "from merge_files.mergers.base import FileMerger\n"
+            "merger = FileMerger(sys.argv[1:-1], sys.argv[-1], 'merged.dat', "
+            "read_buffer_size=64 * 1024)\n"
+            "before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            "merger._merge_intermediate_files(sys.argv[1:-1])\n"
+            "after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            "print(after - before)\n"
+        )
+        with tempfile.TemporaryDirectory() as tempdir:
+            # 4 sorted files of 10 MiB each with a small vocabulary
+            words = sorted(f"{i:05d}{'x' * 95}" for i in range(200))
+            input_files = []
+            for n in range(4):
+                input_file = os.path.join(tempdir, f"run.{n}")
+                with open(input_file, "w") as f:
+                    for word in words:
+                        f.write((word + "\n") * 128)
+                input_files.append(input_file)
+
+            result = subprocess.run([sys.executable, "-c", script, *input_files, tempdir],
+                                    capture_output=True, text=True, check=True, cwd=os.getcwd())
+            peak_growth_kib = int(result.stdout.split()[-1])
+
+            with open(os.path.join(tempdir, "merged.dat")) as f:
+                self.assertEqual(f.read().splitlines(), words)
+        self.assertLess(peak_growth_kib, 8 * 1024)
+
+    def test_merge_normalizes_each_line_once(self):
+        """
+        Microbenchmark of the work per line of the k-way merge, compared with the previous
+        `heapq.merge(*files, key=lambda x: x.strip())` followed by a second strip when writing.
+        """
+        counts = Counter()
+
+        class CountingStr(str):
+            def __lt__(self, other):
+                counts["comparisons"] += 1
+                return str.__lt__(self, other)
+
+            def __eq__(self, other):
+                counts["comparisons"] += 1
+                return str.__eq__(self, other)
+
+            __hash__ = str.__hash__
+
+        def strip(line):
+            counts["normalizations"] += 1
+            return CountingStr(line.strip())
+
+        runs = [[f"{n:05d}\n" for n in range(i, 4000, 8)] for i in range(8)]
+        num_lines = sum(map(len, runs))
+
+        # Before: the key is derived on the fly and the word is stripped again when written
+        for word in heapq.merge(*runs, key=strip):
+            strip(word)
+        before = {name: count / num_lines for name, count in counts.items()}
+
+        counts.clear()
+        with tempfile.TemporaryDirectory() as tempdir:
+            run_files = []
+            for i, run in enumerate(runs):
+                run_files.append(os.path.join(tempdir, f"run.{i}"))
+                with open(run_files[-1], "w") as f:
+                    f.writelines(run)
+            merger = FileMerger(run_files, tempdir, "merged.dat", dedup="none")
+            with patch.object(merger, "_normalize", lambda lines: map(strip, lines)):
+                merger._merge_runs(run_files, merger.output_file)
+            with open(merger.output_file) as f:
+                self.assertEqual(f.read().split(), [f"{n:05d}" for n in range(4000)])
+        after = {name: count / num_lines for name, count in counts.items()}
+
+        self.assertEqual(before["normalizations"], 2)
+        self.assertEqual(after["normalizations"], 1)
+        # The heap compares the same words, only without the Python level key function
+        self.assertLessEqual(after["comparisons"], before["comparisons"])
+
+    def test_file_handle_generator_is_deprecated(self):
+        """
+        Test that the deprecated generator still yields the lines of every file
+        """
+        with self.assertWarns(DeprecationWarning):
+            streams = list(self.file_merger.file_handle_generator(self.input_list[:2]))
+        self.assertEqual([list(stream) for stream in streams],
+                         [list(self.file_merger._read_lines(file_path))
+                          for file_path in self.input_list[:2]])
+
     def test_merge_files_raises_not_implemented_error(self):
         """
         Test that merge_files() raises a NotImplementedError.
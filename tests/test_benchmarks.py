@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.datasets import DatasetShape, generate_dataset, scale_shape
+from benchmarks.suite import (BenchmarkResult, find_regressions, format_results, load_baseline,
+                              run_benchmarks, save_baseline)
+
+
+def make_result(merger="basic", lines_per_s=1000.0, mb_per_s=10.0, peak_rss=1000):
+    return BenchmarkResult("few-huge-files", merger, 1.0, 1000, 10_000_000, lines_per_s,
+                           mb_per_s, peak_rss, 10)
+
+
+class TestBenchmarks(unittest.TestCase):
+    """
+    A test suite for the benchmark suite
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_generate_dataset(self):
+        shape = scale_shape(DatasetShape(3, 100, 8, vocabulary=5), 0.5)
+        files = generate_dataset(shape, self.temp_dir.name)
+        self.assertEqual(len(files), 3)
+        for file in files:
+            with open(file) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), 50)
+            self.assertEqual(lines, sorted(lines))
+            self.assertLessEqual(len(set(lines)), 5)
+        # Existing datasets are reused
+        mtime = os.path.getmtime(files[0])
+        self.assertEqual(generate_dataset(shape, self.temp_dir.name), files)
+        self.assertEqual(os.path.getmtime(files[0]), mtime)
+
+    def test_find_regressions(self):
+        baseline = {make_result().key: make_result()._asdict()}
+        self.assertEqual(find_regressions([make_result(lines_per_s=900.0)], baseline), [])
+        regressions = find_regressions([make_result(lines_per_s=500.0, peak_rss=2000)],
+                                       baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn("lines_per_s", regressions[0])
+        self.assertIn("peak_rss", regressions[1])
+        # Cases without a baseline are not compared
+        self.assertEqual(find_regressions([make_result("async", lines_per_s=1.0)], baseline), [])
+
+    def test_save_and_load_baseline(self):
+        path = os.path.join(self.temp_dir.name, "baseline.json")
+        self.assertEqual(load_baseline(path), {})
+        save_baseline([make_result()], path)
+        save_baseline([make_result("async")], path)
+        self.assertEqual(sorted(load_baseline(path)), ["few-huge-files/async",
+                                                       "few-huge-files/basic"])
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(["long-lines"], ["basic", "parallel"], scale=0.01,
+                                 data_dir=self.temp_dir.name, num_processes=2)
+        self.assertEqual([result.key for result in results], ["long-lines/basic",
+                                                              "long-lines/parallel"])
+        for result in results:
+            self.assertEqual(result.lines, 50 * 20)
+            self.assertGreater(result.lines_per_s, 0)
+            self.assertGreater(result.peak_fds, 0)
+        self.assertIn("long-lines", format_results(results))
+        with self.assertRaises(ValueError):
+            run_benchmarks(["unknown"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+
+
+class TestBinaryPipeline(unittest.TestCase):
+    """
+    A test suite for merging bytes instead of decoded text
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.temp_dir.name, "input")
+        os.mkdir(self.input_dir)
+        words = ["apple", "banana", "café", "crème", "zebra", "ärger", "ñandú", "über", "日本",
+                 "中文", "😀"]
+        self.input_files = []
+        for i in range(4):
+            input_file = os.path.join(self.input_dir, f"file{i}.dat")
+            with open(input_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(sorted(words[i::2])) + "\n")
+            self.input_files.append(input_file)
+        self.expected = sorted(set(words))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def merge(self, merger_class, binary, **kwargs):
+        filename = f"{merger_class.__name__}.{binary}.dat"
+        merger = merger_class(self.input_files, self.temp_dir.name, filename, 2, 1024,
+                              binary=binary, **kwargs)
+        with patch('builtins.print'):
+            merger.merge_files()
+        with open(merger.output_file, "rb") as f:
+            return f.read()
+
+    def test_output_is_identical_to_text_mode(self):
+        for merger_class in (BasicFileMerger, AsyncFileMerger, ParallelFileMerger):
+            with self.subTest(merger=merger_class.__name__):
+                text_output = self.merge(merger_class, False, newline="\n")
+                binary_output = self.merge(merger_class, True, newline="\n")
+                self.assertEqual(binary_output, text_output)
+                self.assertEqual(binary_output.decode("utf-8").split("\n")[:-1], self.expected)
+
+    def test_only_ascii_whitespace_is_stripped(self):
+        with open(self.input_files[0], "wb") as f:
+            f.write("apple\u00a0\ncherry\u3000\n date\t\n".encode("utf-8"))
+        self.input_files = self.input_files[:1]
+        text_output = self.merge(BasicFileMerger, False, newline="\n")
+        binary_output = self.merge(BasicFileMerger, True, newline="\n")
+        self.assertEqual(text_output, b"apple\ncherry\ndate\n")
+        self.assertEqual(binary_output, "apple\u00a0\ncherry\u3000\ndate\n".encode("utf-8"))
+
+    def test_newline(self):
+        output = self.merge(BasicFileMerger, True, newline="\r\n")
+        self.assertEqual(output, "".join(word + "\r\n" for word in self.expected).encode())
+
+    def test_default_newline_is_native(self):
+        output = self.merge(BasicFileMerger, True)
+        self.assertEqual(output, "".join(word + os.linesep for word in self.expected).encode())
+
+
+if __name__ == '__main__':
+    unittest.main()
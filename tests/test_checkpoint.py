@@ -0,0 +1,372 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from merge_files.checkpoint import (MANIFEST_NAME, OutputManifest, WorkManifest,
+                                    fingerprint_input, merge_settings)
+from merge_files.main import merge
+from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.base import FileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+
+
+class TestWorkManifest(unittest.TestCase):
+    """
+    A test suite for the manifest of completed chunks
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.work_dir = os.path.join(self.temp_dir.name, "work")
+        self.input_file = os.path.join(self.temp_dir.name, "input.txt")
+        with open(self.input_file, "w") as f:
+            f.write("a\nb\n")
+        self.settings = {"dedup": "sorted"}
+        print_patcher = patch('builtins.print')
+        print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def complete_chunk(self, manifest):
+        digest = manifest.chunk_digest([self.input_file])
+        run = os.path.join(self.work_dir, "output.txt." + digest[:16])
+        with open(run, "w") as f:
+            f.write("a\nb\n")
+        manifest.record(digest, run)
+        return digest, run
+
+    def test_resume(self):
+        digest, run = self.complete_chunk(WorkManifest(self.work_dir, self.settings))
+        with open(os.path.join(self.work_dir, MANIFEST_NAME)) as f:
+            self.assertEqual(json.load(f)["chunks"], {digest: os.path.basename(run)})
+
+        manifest = WorkManifest(self.work_dir, self.settings, resume=True)
+        self.assertTrue(manifest.completed(digest))
+        self.assertEqual(manifest.remove(), [run])
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_changed_input_is_not_completed(self):
+        digest, _ = self.complete_chunk(WorkManifest(self.work_dir, self.settings))
+        with open(self.input_file, "a") as f:
+            f.write("c\n")
+        self.assertEqual(fingerprint_input(self.input_file)[1], 6)
+        manifest = WorkManifest(self.work_dir, self.settings, resume=True)
+        self.assertNotEqual(manifest.chunk_digest([self.input_file]), digest)
+
+    def test_missing_run_is_not_completed(self):
+        digest, run = self.complete_chunk(WorkManifest(self.work_dir, self.settings))
+        os.remove(run)
+        self.assertFalse(WorkManifest(self.work_dir, self.settings, resume=True).completed(digest))
+
+    def test_stale_manifest_is_removed(self):
+        _, run = self.complete_chunk(WorkManifest(self.work_dir, self.settings))
+        manifest = WorkManifest(self.work_dir, {"dedup": "none"}, resume=True)
+        self.assertEqual(manifest.chunks, {})
+        self.assertFalse(os.path.exists(run))
+
+        self.complete_chunk(manifest)
+        WorkManifest(self.work_dir, {"dedup": "none"})
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+
+class TestResumableMerge(unittest.TestCase):
+    """
+    A test suite for merges that are resumed from a work directory
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.work_dir = os.path.join(self.temp_dir.name, "work")
+        self.output_dir = os.path.join(self.temp_dir.name, "output")
+        os.mkdir(self.output_dir)
+        self.input_files = []
+        for i in range(6):
+            self.input_files.append(os.path.join(self.temp_dir.name, f"file{i}.txt"))
+            with open(self.input_files[-1], "w") as f:
+                f.write("".join(f"word{n:04d}\n" for n in range(i, 600, 3)))
+        print_patcher = patch('builtins.print')
+        self.print_mock = print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def check_output(self):
+        with open(os.path.join(self.output_dir, "output.txt")) as f:
+            self.assertEqual(f.read().split(), [f"word{n:04d}" for n in range(600)])
+
+    def fail_final_merge(self, merger_class, **kwargs):
+        merger = merger_class(self.input_files, self.output_dir, file_chunk_size=2,
+                              work_dir=self.work_dir, **kwargs)
+        with patch.object(FileMerger, '_merge_final', side_effect=OSError("disk full")), \
+                self.assertRaises(OSError):
+            merger.merge_files()
+        # The manifest and the three completed chunks are kept, nothing else
+        self.assertEqual(os.listdir(self.work_dir), ["output.txt.work"])
+        self.assertEqual(len(os.listdir(merger.work_dir)), 4)
+        self.assertEqual(len(merger.manifest.chunks), 3)
+
+    def test_async_merge_resumes_completed_chunks(self):
+        self.fail_final_merge(AsyncFileMerger)
+        # A changed input file is merged again with the other files of its chunk. The chunks are
+        # balanced by size, so the size is kept to keep the other chunks
+        with open(self.input_files[0]) as f:
+            content = f.read()
+        with open(self.input_files[0], "w") as f:
+            f.write(content.replace("word0597", "word0700"))
+        # The file system may not tell apart modification times this close to each other
+        os.utime(self.input_files[0], ns=(0, 0))
+        merger = AsyncFileMerger(self.input_files, self.output_dir, file_chunk_size=2,
+                                 work_dir=self.work_dir, resume=True)
+        with patch.object(AsyncFileMerger, '_write_intermediate',
+                          wraps=merger._write_intermediate) as write_mock:
+            merger.merge_files()
+        self.assertEqual(write_mock.call_count, 1)
+        self.assertIn(self.input_files[0], write_mock.call_args.args[0])
+        with open(os.path.join(self.output_dir, "output.txt")) as f:
+            self.assertEqual(f.read().split()[-1], "word0700")
+        self.print_mock.assert_any_call(
+            "Resuming: 2 of 3 chunks were completed by a previous merge.")
+        # The work directory is emptied once the merge succeeded
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_parallel_merge_resumes_completed_chunks(self):
+        self.fail_final_merge(ParallelFileMerger, num_processes=2)
+        merger = ParallelFileMerger(self.input_files, self.output_dir, file_chunk_size=2,
+                                    num_processes=2, work_dir=self.work_dir, resume=True)
+        merger.merge_files()
+        self.check_output()
+        self.assertEqual(merger.task_timings, {})
+        self.print_mock.assert_any_call(
+            "Resuming: 3 of 3 chunks were completed by a previous merge.")
+        self.assertEqual(os.listdir(self.work_dir), [])
+
+    def test_merge_without_resume_starts_over(self):
+        self.fail_final_merge(AsyncFileMerger)
+        merger = AsyncFileMerger(self.input_files, self.output_dir, file_chunk_size=2,
+                                 work_dir=self.work_dir)
+        with patch.object(AsyncFileMerger, '_write_intermediate',
+                          wraps=merger._write_intermediate) as write_mock:
+            merger.merge_files()
+        self.assertEqual(write_mock.call_count, 3)
+        self.check_output()
+
+    def test_other_files_in_work_dir_are_kept(self):
+        os.mkdir(self.work_dir)
+        notes = os.path.join(self.work_dir, "output.txt.notes")
+        with open(notes, "w") as f:
+            f.write("notes\n")
+        merger = AsyncFileMerger(self.input_files, self.output_dir, file_chunk_size=2,
+                                 work_dir=self.work_dir)
+        with patch.object(FileMerger, '_merge_final', side_effect=OSError("disk full")), \
+                self.assertRaises(OSError):
+            merger.merge_files()
+        self.assertEqual(sorted(os.listdir(self.work_dir)), ["output.txt.notes", "output.txt.work"])
+        AsyncFileMerger(self.input_files, self.output_dir, file_chunk_size=2,
+                        work_dir=self.work_dir, resume=True).merge_files()
+        self.check_output()
+        self.assertEqual(os.listdir(self.work_dir), ["output.txt.notes"])
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            AsyncFileMerger(self.input_files, self.output_dir, resume=True)
+        with self.assertRaises(ValueError):
+            AsyncFileMerger(self.input_files, self.output_dir, work_dir=self.work_dir,
+                            temp_dirs=[self.temp_dir.name])
+
+
+class TestIncrementalMerge(unittest.TestCase):
+    """
+    A test suite for merges of new input files into a previous output
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.temp_dir.name, "input")
+        self.output_dir = os.path.join(self.temp_dir.name, "output")
+        os.mkdir(self.input_dir)
+        os.mkdir(self.output_dir)
+        self.output_file = os.path.join(self.output_dir, "output.txt")
+        self.words = set()
+        for i in range(4):
+            self.add_file(i, range(i, 400, 4))
+        print_patcher = patch('builtins.print')
+        self.print_mock = print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def add_file(self, i, numbers):
+        words = [f"word{n:04d}" for n in numbers]
+        self.words.update(words)
+        path = os.path.join(self.input_dir, f"file{i}.txt")
+        with open(path, "w") as f:
+            f.write("".join(word + "\n" for word in words))
+        return path
+
+    def merge(self, output_dir=None, **kwargs):
+        merge(self.input_dir, output_dir or self.output_dir, "output.txt", 2, 100, False, 1,
+              incremental=True, **kwargs)
+
+    def read_output(self, output_file=None):
+        with open(output_file or self.output_file) as f:
+            return f.read().split()
+
+    def assert_printed(self, message):
+        self.print_mock.assert_any_call(message)
+
+    def test_new_files_are_merged_into_previous_output(self):
+        self.merge()
+        self.assert_printed("Merging all 4 input files: no previous output with a manifest.")
+        self.assertEqual(self.read_output(), sorted(self.words))
+
+        self.add_file(4, range(350, 450))
+        self.add_file(5, range(1000, 1010))
+        with patch('merge_files.main.AsyncFileMerger') as async_mock, \
+                patch('merge_files.main.BasicFileMerger',
+                      wraps=BasicFileMerger) as basic_mock:
+            self.merge()
+        async_mock.assert_not_called()
+        args, kwargs = basic_mock.call_args
+        self.assertEqual(sorted(map(os.path.basename, args[0])), ["file4.txt", "file5.txt"])
+        self.assertEqual(kwargs["previous_output"], self.output_file + ".previous")
+        self.assert_printed("Merging 2 new of 6 input files into the previous output.")
+        self.assertEqual(self.read_output(), sorted(self.words))
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ["output.txt", "output.txt.manifest.json"])
+
+        mtime = os.stat(self.output_file).st_mtime_ns
+        self.merge()
+        self.assert_printed("The output is up to date, no input file is new.")
+        self.assertEqual(os.stat(self.output_file).st_mtime_ns, mtime)
+
+    def test_changed_or_removed_files_are_merged_again(self):
+        self.merge()
+        path = self.add_file(0, range(0, 400, 8))
+        os.utime(path, ns=(0, 0))
+        self.words = set()
+        for i in range(1, 4):
+            self.words.update(f"word{n:04d}" for n in range(i, 400, 4))
+        self.words.update(f"word{n:04d}" for n in range(0, 400, 8))
+        self.merge()
+        self.assert_printed("Merging all 4 input files: 1 merged input files changed.")
+        self.assertEqual(self.read_output(), sorted(self.words))
+
+        os.remove(path)
+        self.merge()
+        self.assert_printed("Merging all 3 input files: 1 merged input files were removed.")
+        self.assertNotIn("word0000", self.read_output())
+
+        self.merge(dedup="none")
+        self.assert_printed("Merging all 3 input files: the merge settings changed.")
+
+    def test_output_in_input_directory_is_not_merged(self):
+        self.merge(output_dir=self.input_dir)
+        self.add_file(4, range(500, 510))
+        self.merge(output_dir=self.input_dir)
+        self.assert_printed("Merging 1 new of 5 input files into the previous output.")
+        self.assertEqual(self.read_output(os.path.join(self.input_dir, "output.txt")),
+                         sorted(self.words))
+
+    def test_failed_merge_restores_previous_output(self):
+        self.merge()
+        previous = self.read_output()
+        self.add_file(4, range(500, 510))
+        with patch.object(FileMerger, '_merge_final', side_effect=OSError("disk full")), \
+                self.assertRaises(Exception):
+            self.merge()
+        self.assertEqual(self.read_output(), previous)
+        self.assertFalse(os.path.exists(self.output_file + ".previous"))
+
+        # A merge that was killed leaves the previous output aside, the next one restores it
+        os.replace(self.output_file, self.output_file + ".previous")
+        with open(self.output_file, "w") as f:
+            f.write("word0000\n")
+        self.merge()
+        self.assertEqual(self.read_output(), sorted(self.words))
+
+    def test_failed_merge_in_output_dir_keeps_other_files(self):
+        notes = self.output_file + ".notes"
+        with open(notes, "w") as f:
+            f.write("notes\n")
+        self.merge(work_dir=self.output_dir)
+        previous = self.read_output()
+        self.add_file(4, range(500, 510))
+        with patch.object(FileMerger, '_merge_final', side_effect=OSError("disk full")), \
+                self.assertRaises(Exception):
+            self.merge(work_dir=self.output_dir)
+        self.assertEqual(self.read_output(), previous)
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ["output.txt", "output.txt.manifest.json", "output.txt.notes"])
+
+        self.merge(work_dir=self.output_dir)
+        self.assertEqual(self.read_output(), sorted(self.words))
+        with open(notes) as f:
+            self.assertEqual(f.read(), "notes\n")
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ["output.txt", "output.txt.manifest.json", "output.txt.notes"])
+
+    def test_merge_killed_while_committing(self):
+        replace = os.replace
+        manifest_path = self.output_file + ".manifest.json"
+
+        def killed_replace(src, dst):
+            if dst == manifest_path:
+                raise KeyboardInterrupt
+            replace(src, dst)
+
+        # A merge can be killed before or after the manifest is written
+        for i, patcher in enumerate([patch('merge_files.checkpoint.os.remove',
+                                           side_effect=KeyboardInterrupt),
+                                     patch('merge_files.checkpoint.os.replace',
+                                           side_effect=killed_replace)]):
+            with self.subTest(i=i):
+                self.merge()
+                self.add_file(4 + i, range(500 + i * 10, 510 + i * 10))
+                with patcher, self.assertRaises(KeyboardInterrupt):
+                    self.merge()
+                self.merge()
+                self.assertEqual(self.read_output(), sorted(self.words))
+
+    def test_merger_that_cannot_be_built_keeps_previous_output(self):
+        self.merge()
+        previous = self.read_output()
+        self.add_file(4, range(500, 510))
+        with self.assertRaises(FileNotFoundError):
+            self.merge(temp_dirs=[os.path.join(self.temp_dir.name, "missing")])
+        self.assertEqual(self.read_output(), previous)
+
+    def test_parallel_merges(self):
+        self.merge()
+        for output_compression in ("none", "gzip", "gzip"):
+            # The key ranges of the final merge are searched in a text previous output, a
+            # compressed one is merged by a single process
+            i = len(os.listdir(self.input_dir))
+            self.add_file(i, range(i * 100, i * 100 + 300))
+            self.add_file(i + 1, range(i * 100 + 50, i * 100 + 90))
+            with patch('merge_files.main.ParallelFileMerger',
+                       wraps=ParallelFileMerger) as parallel_mock:
+                merge(self.input_dir, self.output_dir, "output.txt", 1, 100, True, 2,
+                      incremental=True, output_compression=output_compression)
+            self.assertEqual(len(parallel_mock.call_args.args[0]), 2)
+            with gzip.open(self.output_file, "rt") if output_compression == "gzip" else \
+                    open(self.output_file) as f:
+                self.assertEqual(f.read().split(), sorted(self.words))
+
+    def test_manifest_of_output(self):
+        manifest = OutputManifest(self.output_file, merge_settings("sorted", None))
+        self.assertTrue(manifest.is_own_file(self.output_file + ".manifest.json"))
+        self.assertFalse(manifest.is_own_file(os.path.join(self.input_dir, "file0.txt")))
+        with self.assertRaises(ValueError):
+            merge(self.input_dir, "-", "output.txt", 2, 100, False, 1, incremental=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
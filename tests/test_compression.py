@@ -0,0 +1,102 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from merge_files.compression import (available_codecs, check_codec, detect_codec,
+                                     open_compressed)
+from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+
+
+OPENERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+
+class TestCompression(unittest.TestCase):
+    """
+    A test suite for compressed input, output and intermediate files
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_files = []
+        self.words = set()
+        for i, codec in enumerate(["none", "gzip", "bz2", "xz", "gzip", "none"]):
+            words = sorted(f"word{n:04d}" for n in range(i, 600, i + 2))
+            self.words.update(words)
+            data = ("\n".join(words) + "\n").encode()
+            # The extension does not matter, the codec is detected from the content
+            file_path = os.path.join(self.temp_dir.name, f"file{i}.txt")
+            with OPENERS.get(codec, open)(file_path, "wb") as f:
+                f.write(data)
+            self.input_files.append(file_path)
+        self.expected = sorted(self.words)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_detect_codec(self):
+        codecs = [detect_codec(file_path) for file_path in self.input_files]
+        self.assertEqual(codecs, ["none", "gzip", "bz2", "xz", "gzip", "none"])
+
+    def test_check_codec(self):
+        self.assertEqual(check_codec("gzip"), "gzip")
+        with self.assertRaises(ValueError):
+            check_codec("lz4")
+
+    def test_open_compressed_round_trip(self):
+        file_path = os.path.join(self.temp_dir.name, "round_trip")
+        for codec in available_codecs():
+            with self.subTest(codec=codec):
+                with open_compressed(file_path, "wb", codec, level=1) as f:
+                    f.writelines(b"line %d\n" % n for n in range(1000))
+                self.assertEqual(detect_codec(file_path), codec)
+                with open_compressed(file_path, "rb", codec) as f:
+                    self.assertEqual(f.readlines(), [b"line %d\n" % n for n in range(1000)])
+
+    @patch('merge_files.mergers.base.print')
+    def test_merge_compressed_inputs(self, print_mock):
+        for binary in (False, True):
+            for merger_class in (BasicFileMerger, AsyncFileMerger, ParallelFileMerger):
+                with self.subTest(binary=binary, merger=merger_class.__name__):
+                    merger_class(self.input_files, self.temp_dir.name, "output.txt", 2, 10,
+                                 binary=binary, newline="\n").merge_files()
+                    with open(os.path.join(self.temp_dir.name, "output.txt")) as f:
+                        self.assertEqual(f.read().splitlines(), self.expected)
+
+    @patch('merge_files.mergers.base.print')
+    def test_compressed_output_and_intermediates(self, print_mock):
+        for codec in available_codecs():
+            for merger_class in (BasicFileMerger, AsyncFileMerger, ParallelFileMerger):
+                with self.subTest(codec=codec, merger=merger_class.__name__):
+                    merger = merger_class(self.input_files, self.temp_dir.name, "output.txt", 2,
+                                          10, newline="\n", output_compression=codec,
+                                          temp_compression=codec)
+                    merger.merge_files()
+                    self.assertEqual(detect_codec(merger.output_file), codec)
+                    with open_compressed(merger.output_file, "rb", codec) as f:
+                        self.assertEqual(f.read().decode().splitlines(), self.expected)
+
+    @patch('merge_files.mergers.base.print')
+    def test_partitioned_merge_concatenates_compressed_parts(self, print_mock):
+        merger = ParallelFileMerger(self.input_files, self.temp_dir.name, "output.txt", 2, 10,
+                                    num_processes=3, newline="\n", output_compression="gzip")
+        merger.merge_files()
+        with gzip.open(merger.output_file, "rt") as f:
+            self.assertEqual(f.read().splitlines(), self.expected)
+
+    def test_intermediate_files_are_smaller(self):
+        merger = BasicFileMerger(self.input_files, self.temp_dir.name, newline="\n",
+                                 run_format="text")
+        compressed = BasicFileMerger(self.input_files, self.temp_dir.name, newline="\n",
+                                     temp_compression="gzip", run_format="text")
+        for m in (merger, compressed):
+            with patch('merge_files.mergers.base.print'):
+                m._write_intermediate(self.input_files, m.temp_file)
+        self.assertLess(os.path.getsize(compressed.temp_file),
+                        os.path.getsize(merger.temp_file) / 2)
+        self.assertEqual(list(compressed._read_lines(compressed.temp_file)), self.expected)
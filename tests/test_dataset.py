@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+from scripts import dataset
+from scripts.dataset import generate_fake_dataset, generate_vocabulary, parse_size
+
+
+class TestGenerateFakeDataset(unittest.TestCase):
+    """
+    A test suite for the fake dataset generator
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.temp_dir.name
+        print_patcher = patch('scripts.dataset.print', create=True)
+        print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_lines(self, file):
+        with open(file, 'rb') as f:
+            return f.read().splitlines()
+
+    def test_files_are_sorted(self):
+        files = generate_fake_dataset(5, 100, 300, self.output_dir, min_word_length=2,
+                                      max_word_length=6, seed=1)
+        self.assertEqual(files, [os.path.join(self.output_dir, f'file_{i}.dat')
+                                 for i in range(5)])
+        for file in files:
+            lines = self.read_lines(file)
+            self.assertTrue(100 <= len(lines) <= 300)
+            self.assertEqual(lines, sorted(lines))
+            self.assertTrue(all(2 <= len(line) <= 6 and line.isalpha() for line in lines))
+
+    def test_seed_makes_datasets_reproducible(self):
+        first = generate_fake_dataset(3, 200, 200, os.path.join(self.output_dir, 'a'), seed=7)
+        second = generate_fake_dataset(3, 200, 200, os.path.join(self.output_dir, 'b'), seed=7,
+                                       num_processes=2)
+        for a, b in zip(first, second):
+            self.assertEqual(self.read_lines(a), self.read_lines(b))
+
+    def test_duplicate_ratio(self):
+        files = generate_fake_dataset(1, 1000, 1000, self.output_dir, min_word_length=12,
+                                      max_word_length=12, duplicate_ratio=0.4, seed=3)
+        lines = self.read_lines(files[0])
+        self.assertEqual(len(lines), 1000)
+        self.assertEqual(len(set(lines)), 600)
+
+    def test_zipf_vocabulary(self):
+        vocabulary = generate_vocabulary(50, 3, 8, seed=5)
+        files = generate_fake_dataset(1, 5000, 5000, self.output_dir, min_word_length=3,
+                                      max_word_length=8, vocabulary_size=50, zipf=1.5, seed=5)
+        lines = self.read_lines(files[0])
+        self.assertEqual(lines, sorted(lines))
+        self.assertTrue(set(lines) <= set(vocabulary))
+        counts = sorted(Counter(lines).values(), reverse=True)
+        # The most frequent word is drawn far more often than under a uniform distribution
+        self.assertGreater(counts[0], 5 * 5000 / 50)
+
+    def test_total_size(self):
+        files = generate_fake_dataset(4, 0, 0, self.output_dir, min_word_length=9,
+                                      max_word_length=9, total_size=parse_size('40K'), seed=2)
+        self.assertEqual(sum(os.path.getsize(file) for file in files), 40 * 1024)
+
+    def test_large_files_are_written_by_prefix(self):
+        with patch.object(dataset, 'BUCKET_WORDS', 100):
+            files = generate_fake_dataset(1, 5000, 5000, self.output_dir, seed=4)
+        lines = self.read_lines(files[0])
+        self.assertEqual(len(lines), 5000)
+        self.assertEqual(lines, sorted(lines))
+
+    def test_invalid_options(self):
+        with self.assertRaises(TypeError):
+            generate_fake_dataset('1', 1, 1, self.output_dir)
+        with self.assertRaises(ValueError):
+            generate_fake_dataset(1, 10, 1, self.output_dir)
+        with self.assertRaises(ValueError):
+            generate_fake_dataset(1, 1, 1, self.output_dir, zipf=1.0)
+        with self.assertRaises(ValueError):
+            generate_fake_dataset(1, 1, 1, self.output_dir, duplicate_ratio=1.0)
+        with self.assertRaises(ValueError):
+            generate_vocabulary(1000, 1, 2, seed=0)
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('512'), 512)
+        self.assertEqual(parse_size('1.5k'), 1536)
+        self.assertEqual(parse_size('200G'), 200 * 1024 ** 3)
+        self.assertEqual(parse_size('2 TB'), 2 * 1024 ** 4)
+        with self.assertRaises(ValueError):
+            parse_size('lots')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from merge_files.dedup import (BloomFilter,
+                               deduplicate)
+from merge_files.mergers.base import FileMerger
+
+
+class TestDeduplicate(unittest.TestCase):
+    """
+    A test suite for the deduplication strategies
+    """
+
+    def test_sorted_drops_adjacent_duplicates(self):
+        words = ["a", "a", "b", "c", "c", "c", "d"]
+        self.assertEqual(list(deduplicate(words, "sorted")), ["a", "b", "c", "d"])
+
+    def test_sorted_is_lazy(self):
+        """
+        Test that the sorted strategy consumes its input lazily, so it can handle endless streams
+        """
+        def endless():
+            i = 0
+            while True:
+                yield str(i // 2)
+                i += 1
+
+        stream = deduplicate(endless(), "sorted")
+        self.assertEqual([next(stream) for _ in range(3)], ["0", "1", "2"])
+
+    def test_exact_drops_all_duplicates(self):
+        words = ["b", "a", "b", "c", "a"]
+        self.assertEqual(list(deduplicate(words, "exact")), ["b", "a", "c"])
+
+    def test_bloom_drops_all_duplicates(self):
+        words = [str(i % 100) for i in range(1000)]
+        self.assertEqual(list(deduplicate(words, "bloom", bloom_capacity=1000)),
+                         [str(i) for i in range(100)])
+
+    def test_none_keeps_duplicates(self):
+        words = ["a", "a", "b"]
+        self.assertEqual(list(deduplicate(words, "none")), words)
+
+    def test_unsupported_mode(self):
+        with self.assertRaises(ValueError):
+            deduplicate([], "fuzzy")
+
+    def test_file_merger_rejects_unsupported_mode(self):
+        with self.assertRaises(ValueError):
+            FileMerger([], "output_dir", dedup="fuzzy")
+
+
+class TestBloomFilter(unittest.TestCase):
+    """
+    A test suite for the BloomFilter class
+    """
+
+    def test_size_does_not_grow(self):
+        bloom = BloomFilter(1000, 0.01)
+        size = len(bloom.bits)
+        for i in range(10000):
+            bloom.add(str(i))
+        self.assertEqual(len(bloom.bits), size)
+
+    def test_add_and_contains(self):
+        bloom = BloomFilter(1000, 0.01)
+        self.assertFalse(bloom.add("word"))
+        self.assertTrue(bloom.add("word"))
+        self.assertIn("word", bloom)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add(f"in-{i}")
+        false_positives = sum(f"out-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.03)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            BloomFilter(0)
+        with self.assertRaises(ValueError):
+            BloomFilter(10, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import pickle
+import tempfile
+import types
+import unittest
+from unittest.mock import patch
+
+from merge_files.keys import SortKey
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+
+
+class TestSortKey(unittest.TestCase):
+    """
+    A test suite for the SortKey class
+    """
+
+    def test_identity(self):
+        self.assertTrue(SortKey().is_identity)
+        self.assertTrue(SortKey(reverse=True).is_identity)
+        self.assertFalse(SortKey(column=1).is_identity)
+
+    def test_column(self):
+        key = SortKey(column=1, delimiter=",")
+        self.assertEqual(list(key.extract(["a,b,c", "d, e ,f", "g"])), ["b", "e", ""])
+
+    def test_last_column(self):
+        key = SortKey(column=2)
+        self.assertEqual(list(key.extract(["a\tb\tc", "a\tb\tc\td"])), ["c", "c"])
+
+    def test_numeric_column(self):
+        key = SortKey(column=0, delimiter=" ", numeric=True)
+        self.assertEqual(list(key.extract(["10 x", "9 y", "1.5 z"])), [10.0, 9.0, 1.5])
+
+    def test_casefold(self):
+        self.assertEqual(list(SortKey(casefold=True).extract(["Straße", "ABC"])),
+                         ["strasse", "abc"])
+
+    def test_binary(self):
+        key = SortKey(column=1, casefold=True)
+        self.assertEqual(list(key.extract([b"1\tAbC", b"2"], binary=True)), [b"abc", b""])
+
+    def test_numeric_key_rejects_text(self):
+        with self.assertRaises(ValueError):
+            list(SortKey(numeric=True).extract(["abc"]))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            SortKey(column=-1)
+        with self.assertRaises(ValueError):
+            SortKey(delimiter="")
+
+    def test_compiled_without_python_functions(self):
+        """
+        Test that no Python level function is called per line
+        """
+        key = SortKey(column=2, delimiter=",", numeric=True, casefold=True)
+        list(key.extract(["1,2,3"]))
+        for function, _ in key._compiled[False]:
+            self.assertNotIsInstance(function, (types.FunctionType, types.LambdaType))
+
+    def test_pickle(self):
+        key = SortKey(column=1, numeric=True)
+        list(key.extract(["a\t1"]))
+        restored = pickle.loads(pickle.dumps(key))
+        self.assertEqual(list(restored.extract(["a\t2"])), [2.0])
+
+
+class TestMergeWithSortKey(unittest.TestCase):
+    """
+    A test suite for merging files with a sort key
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def merge(self, contents, key, merger_class=BasicFileMerger, **kwargs):
+        input_files = []
+        for i, lines in enumerate(contents):
+            input_files.append(os.path.join(self.temp_dir.name, f"file{i}.dat"))
+            with open(input_files[-1], "w") as f:
+                f.write("\n".join(lines) + "\n")
+        merger = merger_class(input_files, self.temp_dir.name, "output.txt", 1, 2, key=key,
+                              **kwargs)
+        with patch('builtins.print'):
+            merger.merge_files()
+        with open(merger.output_file) as f:
+            return f.read().splitlines()
+
+    def test_numeric(self):
+        output = self.merge([["2", "10", "300"], ["1", "20", "100"]], SortKey(numeric=True))
+        self.assertEqual(output, ["1", "2", "10", "20", "100", "300"])
+
+    def test_tsv_column(self):
+        output = self.merge([["x\t1", "a\t5"], ["b\t2", "c\t3"]], SortKey(column=1, numeric=True))
+        self.assertEqual(output, ["x\t1", "b\t2", "c\t3", "a\t5"])
+
+    def test_casefold(self):
+        output = self.merge([["apple", "Cherry"], ["Banana", "date"]], SortKey(casefold=True))
+        self.assertEqual(output, ["apple", "Banana", "Cherry", "date"])
+
+    def test_reverse(self):
+        output = self.merge([["c", "b", "a"], ["e", "d", "a"]], SortKey(reverse=True))
+        self.assertEqual(output, ["e", "d", "c", "b", "a"])
+
+    def test_parallel_numeric(self):
+        contents = [[str(n) for n in range(i, 200, 4)] for i in range(4)]
+        output = self.merge(contents, SortKey(numeric=True), ParallelFileMerger,
+                            num_processes=2)
+        self.assertEqual(output, [str(n) for n in range(200)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import os
 import tempfile
 import unittest
 
-from merge_files.utils import list_files
+from merge_files.utils import iter_files, list_files
 
 
 class ListFilesTestCase(unittest.TestCase):
@@ -63,3 +63,62 @@ class ListFilesTestCase(unittest.TestCase):
             f.write('test')
         with self.assertRaises(FileNotFoundError):
             list_files(file_path)
+
+
+class RecursiveDiscoveryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, 'root')
+        self.files = []
+        for directory in ('', '2023-01-01/part-0', '2023-01-01/part-1', '2023-01-02/part-0',
+                          'tmp'):
+            os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+            for name in ('data.txt', 'data.log'):
+                self.files.append(os.path.join(self.root, directory, name))
+                with open(self.files[-1], 'w') as f:
+                    f.write('word\n')
+        self.files = [os.path.normpath(file) for file in self.files]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def relative(self, files):
+        return [os.path.relpath(file, self.root).replace(os.sep, '/') for file in files]
+
+    def test_recursive_listing_is_sorted(self):
+        files = list_files(self.root, recursive=True)
+        self.assertEqual(files, sorted(self.files))
+        self.assertEqual(self.relative(list_files(self.root)), ['data.log', 'data.txt'])
+
+    def test_include_and_exclude_globs(self):
+        files = list_files(self.root, recursive=True, include=['*.txt'], exclude=['tmp'])
+        self.assertEqual(self.relative(files), ['2023-01-01/part-0/data.txt',
+                                                '2023-01-01/part-1/data.txt',
+                                                '2023-01-02/part-0/data.txt', 'data.txt'])
+        files = list_files(self.root, recursive=True, include=['2023-01-01/*/*.log'])
+        self.assertEqual(self.relative(files), ['2023-01-01/part-0/data.log',
+                                                '2023-01-01/part-1/data.log'])
+        with self.assertRaises(ValueError):
+            list_files(self.root, recursive=True, include=['*.csv'])
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'symbolic links are not supported')
+    def test_symlink_policies(self):
+        os.symlink(os.path.join(self.root, 'tmp'), os.path.join(self.root, 'linked'))
+        os.symlink(os.path.join(self.root, 'data.txt'), os.path.join(self.root, 'link.txt'))
+        # A link to a parent directory would be scanned forever without cycle detection
+        os.symlink(self.root, os.path.join(self.root, 'tmp', 'loop'))
+
+        def scan(symlinks):
+            return sorted(self.relative(iter_files(self.root, True, ['*.txt'], None, symlinks,
+                                                   max_workers=4)))
+
+        self.assertNotIn('link.txt', scan('skip'))
+        self.assertIn('link.txt', scan('files'))
+        self.assertNotIn('linked/data.txt', scan('files'))
+        followed = scan('follow')
+        self.assertIn('link.txt', followed)
+        self.assertEqual(len(followed), len(set(followed)))
+        self.assertTrue(any(file.startswith('linked/') or file.startswith('tmp/')
+                            for file in followed))
+        with self.assertRaises(ValueError):
+            list(iter_files(self.root, symlinks='always'))
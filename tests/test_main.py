@@ -2,8 +2,10 @@ import unittest
 import os
 from unittest.mock import (patch,
                            call,
+                           ANY,
                            Mock)
 from merge_files.main import merge
+from merge_files.planner import MergePlan
 
 
 @patch('merge_files.main.check_valid_path')
@@ -23,6 +25,12 @@ class TestMainFunction(unittest.TestCase):
         self.use_parallel = True
         self.n_of_process = 4
         self.input_files = ['file1.txt', 'file2.txt', 'file3.txt']
+        self.options = dict(read_buffer_size=64 * 1024, dedup="sorted", bloom_capacity=1_000_000,
+                            fan_in=None, binary=False, newline=None, key=None,
+                            reader="buffered", archive_order=False, output_compression="none",
+                            compression_level=None, temp_compression="none",
+                            run_format="block", temp_dirs=None, metrics=ANY,
+                            profiler=None, work_dir=None, resume=False)
 
     def test_parallel_file_merger_when_use_parallel_is_true(self, print_mock, basic_mock, async_mock, parallel_mock,
                                                             list_files_mock, check_valid_path_mock):
@@ -39,7 +47,8 @@ class TestMainFunction(unittest.TestCase):
 
         # Assert that the appropriate classes were called with the correct arguments
         parallel_mock.assert_called_once_with(
-            self.input_files, self.output_dir, self.filename, self.chunk_file, self.chunk_line, self.n_of_process)
+            self.input_files, self.output_dir, self.filename, self.chunk_file, self.chunk_line, self.n_of_process,
+            **self.options)
         async_mock.assert_not_called()
         basic_mock.assert_not_called()
         # Assert that merge_files was called once and in the correct place in the code
@@ -63,7 +72,8 @@ class TestMainFunction(unittest.TestCase):
 
         # Assert that the appropriate classes were called with the correct arguments
         async_mock.assert_called_once_with(
-            self.input_files, self.output_dir, self.filename, self.chunk_file, self.chunk_line)
+            self.input_files, self.output_dir, self.filename, self.chunk_file, self.chunk_line,
+            **self.options)
         parallel_mock.assert_not_called()
         basic_mock.assert_not_called()
 
@@ -90,7 +100,8 @@ class TestMainFunction(unittest.TestCase):
 
         # Assert that the appropriate classes were called with the correct arguments
         basic_mock.assert_called_once_with(
-            self.input_files, self.output_dir, self.filename, self.chunk_file, self.chunk_line)
+            self.input_files, self.output_dir, self.filename, self.chunk_file, self.chunk_line,
+            **self.options)
         parallel_mock.assert_not_called()
         async_mock.assert_not_called()
 
@@ -114,3 +125,53 @@ class TestMainFunction(unittest.TestCase):
         with self.assertRaises(Exception):
             merge(self.input_dir, self.output_dir, self.filename, self.chunk_file,
                   self.chunk_line, self.use_parallel, self.n_of_process)
+
+    def test_merge_passes_dedup_mode(self, print_mock, basic_mock, async_mock, parallel_mock,
+                                     list_files_mock, check_valid_path_mock):
+        check_valid_path_mock.return_value = self.input_dir
+        list_files_mock.return_value = self.input_files
+
+        merge(self.input_dir, self.output_dir, self.filename, 10, self.chunk_line, False,
+              self.n_of_process, dedup="bloom", bloom_capacity=100)
+
+        _, kwargs = basic_mock.call_args
+        self.assertEqual(kwargs["dedup"], "bloom")
+        self.assertEqual(kwargs["bloom_capacity"], 100)
+
+    def test_merge_passes_discovery_options(self, print_mock, basic_mock, async_mock,
+                                            parallel_mock, list_files_mock,
+                                            check_valid_path_mock):
+        check_valid_path_mock.return_value = self.input_dir
+        list_files_mock.return_value = self.input_files
+
+        merge(self.input_dir, self.output_dir, self.filename, 10, self.chunk_line, False,
+              self.n_of_process, recursive=True, include=["*.txt"], exclude=["tmp"],
+              symlinks="skip")
+
+        list_files_mock.assert_called_once_with(self.input_dir, recursive=True, include=["*.txt"],
+                                                exclude=["tmp"], symlinks="skip")
+
+    @patch('merge_files.main.auto_tune')
+    @patch('os.path.getsize', return_value=100)
+    def test_auto_mode_uses_tuned_plan(self, getsize_mock, auto_tune_mock, print_mock, basic_mock,
+                                       async_mock, parallel_mock, list_files_mock,
+                                       check_valid_path_mock):
+        check_valid_path_mock.return_value = self.input_dir
+        list_files_mock.return_value = self.input_files
+        plan = MergePlan("parallel", 3, 2, None, 128 * 1024, 50)
+        auto_tune_mock.return_value = plan
+
+        merge(self.input_dir, self.output_dir, self.filename, self.chunk_file, self.chunk_line,
+              False, self.n_of_process, auto=True)
+
+        auto_tune_mock.assert_called_once_with(3, 300)
+        options = dict(self.options, read_buffer_size=128 * 1024, fan_in=50)
+        parallel_mock.assert_called_once_with(self.input_files, self.output_dir, self.filename,
+                                              2, None, 3, **options)
+        printed = " ".join(map(str, print_mock.call_args_list[0].args))
+        self.assertIn("strategy=parallel", printed)
+
+        auto_tune_mock.return_value = plan._replace(strategy="basic", chunk_file=3)
+        merge(self.input_dir, self.output_dir, self.filename, self.chunk_file, self.chunk_line,
+              True, self.n_of_process, auto=True)
+        basic_mock.assert_called_once()
@@ -0,0 +1,164 @@
+import io
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from merge_files import metrics
+from merge_files.main import merge
+from merge_files.metrics import JsonLinesWriter, MergeMetrics, ProgressBar
+from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.basic import BasicFileMerger
+
+
+class TestMergeMetrics(unittest.TestCase):
+    """
+    A test suite for the phase timings, counters and events of a merge
+    """
+
+    def setUp(self):
+        self.events = []
+        self.metrics = MergeMetrics([self.events.append])
+
+    def test_phases_and_counters(self):
+        with self.metrics.phase("intermediate"):
+            self.metrics.add(lines_read=10, bytes_read=100)
+            self.metrics.add(lines_read=5, bytes_read=50, lines_written=12,
+                             duplicates_dropped=3)
+        with self.metrics.phase("final_merge"):
+            self.metrics.add(lines_read=12, lines_written=12)
+        self.metrics.observe_heap(7)
+        with self.metrics.phase("intermediate"):
+            pass
+
+        summary = self.metrics.finish()
+        self.assertEqual(list(summary["phases"]), ["intermediate", "final_merge"])
+        self.assertEqual(summary["counters"]["intermediate"]["lines_read"], 15)
+        self.assertEqual(summary["totals"]["lines_read"], 27)
+        self.assertEqual(summary["totals"]["bytes_written"], 0)
+        self.assertEqual(summary["max_heap_size"], 7)
+        self.assertEqual([event["event"] for event in self.events],
+                         ["phase_start", "phase_end", "phase_start", "phase_end",
+                          "phase_start", "phase_end", "summary"])
+        self.assertEqual(self.events[1]["duplicates_dropped"], 3)
+
+    def test_progress_events(self):
+        self.metrics.total_bytes = 1000
+        with patch.object(metrics, "PROGRESS_INTERVAL", 0), \
+                self.metrics.phase("intermediate"):
+            self.metrics.add(lines_read=1, bytes_read=250)
+            # Counters that are not reads do not report the progress
+            self.metrics.add(lines_written=1)
+            self.metrics.add(lines_read=1, bytes_read=2000)
+        progress = [event for event in self.events if event["event"] == "progress"]
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(progress[0]["fraction"], 0.25)
+        self.assertIsNotNone(progress[0]["eta"])
+        self.assertLess(progress[1]["fraction"], 1)
+
+    def test_workers(self):
+        with self.metrics.phase("intermediate"):
+            self.metrics.add_worker(11, 2.0, {"lines_read": 100, "bytes_read": 1000,
+                                              "max_heap_size": 4})
+            self.metrics.add_worker(11, 2.0, {"lines_read": 300, "bytes_read": 3000})
+            self.metrics.add_worker(12, 1.0, {"lines_read": 50, "bytes_read": 500})
+        summary = self.metrics.summary()
+        self.assertEqual(summary["workers"]["11"], {"tasks": 2, "seconds": 4.0,
+                                                    "lines_per_s": 100.0, "bytes_per_s": 1000.0})
+        self.assertEqual(summary["counters"]["intermediate"]["lines_read"], 450)
+        self.assertEqual(summary["max_heap_size"], 4)
+
+    def test_pickled_metrics_drop_callbacks(self):
+        copy = pickle.loads(pickle.dumps(self.metrics))
+        self.assertFalse(copy.enabled)
+        copy.add(lines_read=1)
+        self.assertEqual(copy.snapshot()["lines_read"], 1)
+
+    def test_writers(self):
+        stream = io.StringIO()
+        JsonLinesWriter(stream)({"event": "summary", "time": 1.0})
+        self.assertEqual(json.loads(stream.getvalue()), {"event": "summary", "time": 1.0})
+
+        stream = io.StringIO()
+        bar = ProgressBar(stream, width=10)
+        bar({"event": "progress", "time": 1.0, "phase": "final_merge", "bytes_read": 5_000_000,
+             "total_bytes": 10_000_000, "fraction": 0.5, "elapsed": 2.0, "eta": 2.0})
+        bar({"event": "phase_end", "time": 4.0, "phase": "final_merge", "seconds": 4.0})
+        self.assertIn("[#####-----]  50.0% 5.0/10.0 MB 2.5 MB/s ETA 0:00:02",
+                      stream.getvalue())
+        self.assertIn("final_merge  done in 0:00:04", stream.getvalue())
+
+
+class TestMergeInstrumentation(unittest.TestCase):
+    """
+    A test suite for the metrics collected by the mergers
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_files = []
+        for i in range(6):
+            self.input_files.append(os.path.join(self.temp_dir.name, f"file{i}.txt"))
+            with open(self.input_files[-1], "w") as f:
+                f.write("".join(f"word{n:04d}\n" for n in range(i % 2, 600, 2)))
+        print_patcher = patch('builtins.print')
+        print_patcher.start()
+        self.addCleanup(print_patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def output_lines(self):
+        with open(os.path.join(self.temp_dir.name, "output.txt")) as f:
+            return len(f.read().split())
+
+    def test_basic_merger_counts_lines(self):
+        events = []
+        merger = BasicFileMerger(self.input_files, self.temp_dir.name,
+                                 metrics=MergeMetrics([events.append]))
+        merger.merge_files()
+        summary = merger.metrics.summary()
+        final = summary["counters"]["final_merge"]
+        self.assertEqual(final["lines_read"], 6 * 300)
+        self.assertEqual(final["bytes_read"], sum(map(os.path.getsize, self.input_files)))
+        self.assertEqual(final["lines_written"], self.output_lines())
+        self.assertEqual(final["duplicates_dropped"], 6 * 300 - 600)
+        self.assertEqual(summary["max_heap_size"], 6)
+        self.assertEqual(merger.metrics.total_bytes, final["bytes_read"])
+        self.assertIn("cleanup", summary["phases"])
+
+    def test_async_merger_times_intermediate_phase(self):
+        merger = AsyncFileMerger(self.input_files, self.temp_dir.name, file_chunk_size=2,
+                                 metrics=MergeMetrics())
+        merger.merge_files()
+        summary = merger.metrics.summary()
+        self.assertEqual(summary["counters"]["intermediate"]["lines_read"], 6 * 300)
+        self.assertEqual(summary["counters"]["final_merge"]["lines_written"],
+                         self.output_lines())
+        self.assertEqual(summary["totals"]["duplicates_dropped"], 6 * 300 - 600)
+        self.assertEqual(summary["max_heap_size"], 3)
+
+    def test_merge_writes_metrics_file(self):
+        metrics_file = os.path.join(self.temp_dir.name, "metrics.jsonl")
+        events = []
+        input_dir = os.path.join(self.temp_dir.name, "input")
+        os.mkdir(input_dir)
+        for file in self.input_files:
+            os.rename(file, os.path.join(input_dir, os.path.basename(file)))
+        merge(input_dir, self.temp_dir.name, "output.txt", 2, 100, False, 1,
+              metrics_file=metrics_file, metrics_callback=events.append)
+        with open(metrics_file) as f:
+            written = [json.loads(line) for line in f]
+        self.assertEqual(written, events)
+        self.assertEqual(written[0], {"event": "phase_start", "time": written[0]["time"],
+                                      "phase": "discovery"})
+        self.assertEqual(written[-1]["event"], "summary")
+        self.assertEqual(written[-1]["counters"]["final_merge"]["lines_written"],
+                         self.output_lines())
+        self.assertIn("discovery", written[-1]["phases"])
+
+
+if __name__ == '__main__':
+    unittest.main()
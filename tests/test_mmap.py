@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+from merge_files.mergers.base import FileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+
+
+class TestMmapReader(unittest.TestCase):
+    """
+    A test suite for the memory mapped reader
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "file.dat")
+        self.words = [f"word{n:05d}" for n in range(5000)]
+        with open(self.file_path, "w") as f:
+            f.write("\n".join(self.words) + "\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def merger(self, **kwargs):
+        return FileMerger([self.file_path], self.temp_dir.name, reader="mmap",
+                          read_buffer_size=1000, **kwargs)
+
+    def test_reads_same_lines_as_buffered_reader(self):
+        for binary in (False, True):
+            with self.subTest(binary=binary):
+                merger = self.merger(binary=binary)
+                buffered = FileMerger([self.file_path], self.temp_dir.name, binary=binary)
+                self.assertTrue(merger._can_mmap(self.file_path))
+                self.assertEqual(list(merger._read_lines(self.file_path)),
+                                 list(buffered._read_lines(self.file_path)))
+
+    def test_reads_from_offset(self):
+        offset = len("".join(word + "\n" for word in self.words[:100]))
+        self.assertEqual(list(self.merger()._read_lines(self.file_path, offset)),
+                         self.words[100:])
+
+    def test_without_trailing_newline_and_crlf(self):
+        with open(self.file_path, "wb") as f:
+            f.write(b"a\r\nb\r\nc")
+        self.assertEqual(list(self.merger()._read_lines(self.file_path)), ["a", "b", "c"])
+
+    def test_falls_back_for_empty_file(self):
+        open(self.file_path, "w").close()
+        merger = self.merger()
+        self.assertFalse(merger._can_mmap(self.file_path))
+        self.assertEqual(list(merger._read_lines(self.file_path)), [])
+
+    def test_falls_back_for_compressed_file(self):
+        compressed = os.path.join(self.temp_dir.name, "file.dat.gz")
+        with open(compressed, "w") as f:
+            f.write("a\n")
+        self.assertFalse(self.merger()._can_mmap(compressed))
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "named pipes are not supported")
+    def test_falls_back_for_pipe(self):
+        pipe = os.path.join(self.temp_dir.name, "pipe")
+        os.mkfifo(pipe)
+        self.assertFalse(self.merger()._can_mmap(pipe))
+
+    def test_falls_back_for_files_over_budget(self):
+        with patch('merge_files.mergers.base.MMAP_ADDRESS_BUDGET', 1024):
+            merger = self.merger(fan_in=2)
+            self.assertFalse(merger._can_mmap(self.file_path))
+            self.assertEqual(list(merger._read_lines(self.file_path)), self.words)
+
+    @unittest.skipUnless(resource is not None and os.path.isdir("/proc/self/fd"),
+                         "descriptor limits cannot be inspected")
+    def test_one_descriptor_per_mapped_file(self):
+        input_files = []
+        for i in range(40):
+            input_files.append(os.path.join(self.temp_dir.name, f"input{i}.dat"))
+            with open(input_files[-1], "w") as f:
+                f.write("\n".join(self.words[i::40]) + "\n")
+        merger = FileMerger(input_files, self.temp_dir.name, reader="mmap")
+        limits = resource.getrlimit(resource.RLIMIT_NOFILE)
+        # Room for every file mapped at once, but not for two descriptors per file
+        resource.setrlimit(resource.RLIMIT_NOFILE,
+                           (len(os.listdir("/proc/self/fd")) + 60, limits[1]))
+        try:
+            readers = [merger._read_lines(file_path) for file_path in input_files]
+            first_lines = [next(reader) for reader in readers]
+            for reader in readers:
+                reader.close()
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, limits)
+        self.assertEqual(first_lines, self.words[:40])
+
+    def test_merge_with_mmap_reader(self):
+        input_files = []
+        for i in range(4):
+            input_files.append(os.path.join(self.temp_dir.name, f"input{i}.dat"))
+            with open(input_files[-1], "w") as f:
+                f.write("\n".join(self.words[i::4]) + "\n")
+        for merger_class in (BasicFileMerger, ParallelFileMerger):
+            with self.subTest(merger=merger_class.__name__):
+                merger = merger_class(input_files, self.temp_dir.name, "output.txt", 2, 100,
+                                      reader="mmap", read_buffer_size=4096)
+                with patch('builtins.print'):
+                    merger.merge_files()
+                with open(merger.output_file) as f:
+                    self.assertEqual(f.read().split(), self.words)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,12 @@
 import os
+import pickle
+import random
+import tempfile
 import unittest
-import asyncio
-from unittest.mock import (AsyncMock,
-                           Mock,
-                           patch,
-                           call)
+from unittest.mock import (Mock,
+                           patch)
+from merge_files.mergers import parallel
+from merge_files.mergers.basic import BasicFileMerger
 from merge_files.mergers.parallel import ParallelFileMerger
 from merge_files.utils import list_files
 
@@ -37,61 +39,96 @@ class TestParallelFileMerger(unittest.TestCase):
         if os.path.exists(self.output_file):
             os.remove(self.output_file)
 
-    def test_split_into_files(self):
+    def test_write_chunk(self):
         """
-        Test the _split_into_files() method of ParallelFileMerger.
+        Test that a worker merges the files of a chunk by their indices in the input files it
+        received once from the pool initializer, without an event loop.
         """
-        chunk = ['file1.txt', 'file2.txt']
         output_file = 'output.txt'
-
-        with patch.object(ParallelFileMerger, '_split_into_files_async', AsyncMock()) as merge_chunks_async_mock:
-            self.file_merger._split_into_files(chunk, output_file)
-
-        merge_chunks_async_mock.assert_called_once_with(chunk, output_file)
-
-    def test_split_into_files_async(self):
+        parallel._init_worker(self.file_merger)
+        try:
+            with patch.object(ParallelFileMerger, '_write_intermediate') as write_mock, \
+                    patch('asyncio.new_event_loop') as loop_mock:
+                i, result = parallel._write_chunk((1, range(1, 3), output_file))
+        finally:
+            parallel._init_worker(None)
+
+        write_mock.assert_called_once_with(self.input_list[1:3], output_file)
+        loop_mock.assert_not_called()
+        elapsed, pid, counts, profile = result
+        self.assertEqual((i, pid), (1, os.getpid()))
+        self.assertGreaterEqual(elapsed, 0)
+        self.assertEqual(counts["lines_read"], 0)
+        self.assertIsNone(profile)
+
+    def test_tasks_do_not_carry_the_merger(self):
         """
-        Test the _split_into_files_async() method of ParallelFileMerger.
+        Test that the tasks sent to the workers only hold file indices, not the input files.
         """
-        chunk = ["file1.txt", "file2.txt"]
-        output_file = "output.txt"
-        with patch.object(ParallelFileMerger, '_create_intermediate') as mock_create_intermediate:
-            asyncio.run(self.file_merger._split_into_files_async(chunk, output_file))
-            mock_create_intermediate.assert_called_once_with(chunk, output_file)
+        self.file_merger.input_files = [f"file{i}.txt" for i in range(10000)]
+        self.file_merger.chunk_size_file = 100
+        with patch.object(ParallelFileMerger, '_file_size', return_value=10):
+            chunk = self.file_merger._divide_indices_into_chunks()[3]
+        task = (3, chunk, f"{self.file_merger.temp_file}.3")
+        self.assertEqual([self.file_merger.input_files[i] for i in chunk],
+                         self.file_merger.input_files[300:400])
+        self.assertLess(len(pickle.dumps(task)), 200)
+        self.assertGreater(len(pickle.dumps(self.file_merger)), 100000)
 
     @patch('multiprocessing.Pool')
     def test_merge_files_w_chunks(self, mock_pool):
         """
         Test the merge_files() method of ParallelFileMerger with multiple processes.
         """
-        # Create a Mock object for apply_async
-        mock_apply_async = Mock()
-        mock_apply_async.return_value.get.return_value = None
-        mock_pool.return_value.__enter__.return_value.apply_async = mock_apply_async
+        # Run the tasks in this process, in the order they are handed out
+        pool = mock_pool.return_value.__enter__.return_value
+        pool.imap_unordered.side_effect = lambda func, tasks: [
+            (i, (0.5, 123, {"lines_read": 10}, None)) for i, _, _ in tasks]
 
         # Mock the merge_intermediate_files method
         self.file_merger._merge_intermediate_files = Mock()
 
         # Call merge_files
-        self.file_merger.merge_files()
-
-        # Check that apply_async was called for each chunk
-        expected_calls = [
-            call(self.file_merger._split_into_files,
-                 args=(chunk, f"{self.file_merger.temp_file}.{i}"))
-            for i, chunk in enumerate(self.chunks)
-        ]
-        intermediate_filenames = os.listdir(self.output_dir)
-        intermediate_files = []
-        for file in intermediate_filenames:
-            intermediate_files.append(os.path.join(self.file_merger.temp_dir, file))
-
-        # Assign the call count of pool.apply_async to mock_apply_async.call_count
-        mock_apply_async.assert_has_calls(expected_calls)
+        with patch('builtins.print'):
+            self.file_merger.merge_files()
+
+        # Check that the merger is sent once to every worker and the tasks carry indices
+        mock_pool.assert_called_once_with(self.num_processes, initializer=parallel._init_worker,
+                                          initargs=(self.file_merger,))
+        func, tasks = pool.imap_unordered.call_args.args
+        self.assertIs(func, parallel._write_chunk)
+        output_files = [f"{self.file_merger.temp_file}.{i}" for i in range(len(self.chunks))]
+        self.assertEqual(tasks, [(i, chunk, output_files[i]) for i, chunk
+                                 in enumerate(self.file_merger._divide_indices_into_chunks())])
+        self.assertEqual(self.file_merger.task_timings, {i: 0.5 for i in range(len(self.chunks))})
+        self.assertEqual(self.file_merger.metrics.workers[123]["lines_read"],
+                         10 * len(self.chunks))
 
         # Check that merge_intermediate_files was called with the correct argument
         self.file_merger._merge_intermediate_files.assert_called_once_with(
-            intermediate_files, delete=True)
+            output_files, delete=True)
+
+    @patch('builtins.print')
+    @patch('multiprocessing.Pool')
+    def test_large_chunks_are_handed_out_first(self, mock_pool, print_mock):
+        """
+        Test that chunks are balanced by size and the largest one is handed out first.
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_files = []
+            for i, size in enumerate([500, 500, 10, 10, 10, 10]):
+                input_files.append(os.path.join(tempdir, f"file{i}"))
+                with open(input_files[-1], "w") as f:
+                    f.write("a\n" * size)
+            merger = ParallelFileMerger(input_files, tempdir, "output.txt", 2, 10)
+            merger._merge_intermediate_files = Mock()
+            pool = mock_pool.return_value.__enter__.return_value
+            pool.imap_unordered.side_effect = lambda func, tasks: [(i, (0, 0, {}, None))
+                                                                   for i, *_ in tasks]
+            merger.merge_files()
+
+        _, tasks = pool.imap_unordered.call_args.args
+        self.assertEqual([list(chunk) for _, chunk, _ in tasks], [[0, 4], [1, 5], [2, 3]])
 
     @patch('multiprocessing.Pool')
     def test_merge_files_with_fewer_processes(self, mock_pool):
@@ -106,7 +143,76 @@ class TestParallelFileMerger(unittest.TestCase):
         self.file_merger.merge_files()
 
         # check that Pool was called with the expected number of processes
-        mock_pool.assert_called_once_with(1)
+        mock_pool.assert_called_once_with(1, initializer=parallel._init_worker,
+                                          initargs=(self.file_merger,))
+
+    def test_merge_final_by_key_ranges(self):
+        """
+        Test that the final merge splits the keys into one range per process and concatenates
+        the ranges in order.
+        """
+        with tempfile.TemporaryDirectory() as tempdir, patch('builtins.print'):
+            runs = []
+            for i in range(3):
+                run = os.path.join(tempdir, f"run.{i}")
+                with open(run, "w") as f:
+                    f.write("".join(f"{n:04d}\n" for n in range(i, 3000, 3)))
+                    # Duplicates across files and ranges
+                    f.write("".join(f"{n:04d}\n" for n in range(3000, 3100)))
+                runs.append(run)
+
+            merger = ParallelFileMerger(runs, tempdir, "merged.dat", num_processes=4)
+            with patch.object(ParallelFileMerger, '_merge_range',
+                              wraps=merger._merge_range) as merge_range, \
+                    patch('multiprocessing.pool.Pool.starmap',
+                          lambda pool, func, args: [func(*arg) for arg in args]), \
+                    patch('merge_files.mergers.parallel._worker_merger', merger):
+                merger._merge_intermediate_files(runs)
+
+            self.assertEqual(merge_range.call_count, 4)
+            with open(merger.output_file) as f:
+                self.assertEqual(f.read().split(), [f"{n:04d}" for n in range(3100)])
+            self.assertEqual(sorted(os.listdir(merger.temp_dir)), [])
+
+    def test_unsorted_inputs_are_not_split_by_key(self):
+        """
+        Test that the final merge keeps every word of unsorted inputs, which cannot be searched
+        for key ranges, and writes the same words as the basic merger
+        """
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_files = []
+            for i in range(4):
+                input_files.append(os.path.join(tempdir, f"input{i}.txt"))
+                with open(input_files[-1], "w") as f:
+                    f.write("".join(f"word{rng.randrange(5000):04d}\n" for _ in range(3000)))
+            for dedup in ("exact", "bloom"):
+                for run_format in ("block", "text"):
+                    with self.subTest(dedup=dedup, run_format=run_format):
+                        outputs = []
+                        for merger_class, options in ((BasicFileMerger, {}),
+                                                      (ParallelFileMerger, {"num_processes": 4})):
+                            merger = merger_class(input_files, tempdir, "output.txt", 2, 100,
+                                                  dedup=dedup, run_format=run_format,
+                                                  bloom_capacity=100_000, **options)
+                            with patch('builtins.print'):
+                                merger.merge_files()
+                            with open(merger.output_file) as f:
+                                outputs.append(sorted(f.read().split()))
+                        self.assertEqual(outputs[1], outputs[0])
+                        self.assertEqual(len(set(outputs[1])), len(outputs[1]))
+
+    def test_missing_input_file_removes_temp_dirs(self):
+        """
+        Test that the temporary directories are removed if an input file cannot be found
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            merger = ParallelFileMerger([*self.input_list, os.path.join(tempdir, "missing")],
+                                        self.output_dir, self.filename, self.chunk_size_file,
+                                        self.chunk_size_line, temp_dirs=[tempdir])
+            with self.assertRaises(FileNotFoundError):
+                merger.merge_files()
+            self.assertEqual(os.listdir(tempdir), [])
 
 
 if __name__ == '__main__':
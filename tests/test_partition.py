@@ -0,0 +1,62 @@
+import io
+import os
+import tempfile
+import unittest
+
+from merge_files.partition import (choose_split_keys,
+                                   find_line_offset,
+                                   sample_keys)
+
+
+class TestPartition(unittest.TestCase):
+    """
+    A test suite for the key range partitioning helpers
+    """
+
+    def setUp(self):
+        self.words = [f"{i:04d}" for i in range(0, 2000, 2)]
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "run.dat")
+        with open(self.file_path, "w") as f:
+            f.write("\n".join(self.words) + "\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_find_line_offset(self):
+        content = "".join(word + "\n" for word in self.words).encode()
+        handle = io.BytesIO(content)
+        for key, expected in (("0000", 0), ("0001", 5), ("0002", 5), ("1000", 2500),
+                              ("1001", 2505), ("1998", 4995), ("1999", 5000), ("9999", 5000)):
+            with self.subTest(key=key):
+                self.assertEqual(find_line_offset(handle, key.encode()), expected)
+
+    def test_find_line_offset_without_trailing_newline(self):
+        handle = io.BytesIO(b"a\nc\ne")
+        self.assertEqual(find_line_offset(handle, b"d"), 4)
+        self.assertEqual(find_line_offset(handle, b"f"), 5)
+
+    def test_find_line_offset_empty_file(self):
+        self.assertEqual(find_line_offset(io.BytesIO(b""), b"a"), 0)
+
+    def test_sample_keys_are_sorted_lines(self):
+        samples = sample_keys(self.file_path, 10)
+        self.assertEqual(len(samples), 10)
+        self.assertEqual(samples, sorted(samples))
+        self.assertTrue(all(sample.decode() in self.words for sample in samples))
+
+    def test_choose_split_keys_balances_ranges(self):
+        split_keys = choose_split_keys([self.file_path], 4)
+        self.assertEqual(len(split_keys), 3)
+        bounds = [b"", *split_keys, b"\xff"]
+        counts = [sum(low <= word.encode() < high for word in self.words)
+                  for low, high in zip(bounds, bounds[1:])]
+        for count in counts:
+            self.assertAlmostEqual(count, len(self.words) / 4, delta=len(self.words) / 10)
+
+    def test_choose_split_keys_single_partition(self):
+        self.assertEqual(choose_split_keys([self.file_path], 1), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
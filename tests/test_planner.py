@@ -0,0 +1,220 @@
+import errno
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+from unittest.mock import patch
+
+from merge_files.mergers.async_ import AsyncFileMerger
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.planner import (MIN_READ_BUFFER,
+                                 auto_tune,
+                                 balance_chunks,
+                                 check_disk_space,
+                                 estimate_spill_size,
+                                 max_fan_in,
+                                 plan_merge_tree)
+
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+class TestPlanMergeTree(unittest.TestCase):
+    """
+    A test suite for the merge tree planner
+    """
+
+    def replay(self, num_runs, fan_in):
+        """
+        Replays a plan and returns the runs left for the final merge.
+        """
+        runs = set(range(num_runs))
+        next_id = num_runs
+        for level in plan_merge_tree([1] * num_runs, fan_in):
+            for group in level:
+                self.assertLessEqual(len(group), fan_in)
+                self.assertTrue(set(group) <= runs)
+                runs -= set(group)
+                runs.add(next_id)
+                next_id += 1
+        return runs
+
+    def test_no_merge_needed(self):
+        self.assertEqual(plan_merge_tree([1, 2, 3], 3), [])
+
+    def test_single_level_merges_only_smallest_runs(self):
+        levels = plan_merge_tree([5, 1, 4, 2, 3], 4)
+        self.assertEqual(levels, [[[1, 3]]])
+
+    def test_reduces_to_fan_in(self):
+        for num_runs in (5, 10, 17, 100, 1000):
+            for fan_in in (2, 3, 4, 16):
+                with self.subTest(num_runs=num_runs, fan_in=fan_in):
+                    remaining = self.replay(num_runs, fan_in)
+                    self.assertLessEqual(len(remaining), fan_in)
+
+    def test_invalid_fan_in(self):
+        with self.assertRaises(ValueError):
+            plan_merge_tree([1, 2, 3], 1)
+
+    @patch('merge_files.planner.available_memory', return_value=None)
+    @patch('merge_files.planner.open_file_descriptors', return_value=10)
+    @patch('merge_files.planner.file_descriptor_limit', return_value=100)
+    def test_max_fan_in_uses_descriptor_budget(self, *_):
+        self.assertEqual(max_fan_in(1024, reserved=20), 70)
+
+    @patch('merge_files.planner.available_memory', return_value=4 * 1024 * 1024)
+    @patch('merge_files.planner.open_file_descriptors', return_value=10)
+    @patch('merge_files.planner.file_descriptor_limit', return_value=100000)
+    def test_max_fan_in_uses_memory_budget(self, *_):
+        self.assertEqual(max_fan_in(64 * 1024, reserved=20), 16)
+
+
+class TestBalanceChunks(unittest.TestCase):
+    """
+    A test suite for the size-aware chunk scheduler
+    """
+
+    def test_equal_sizes_keep_contiguous_chunks(self):
+        self.assertEqual(balance_chunks([6] * 5, 3), [range(0, 3), range(3, 5)])
+        self.assertEqual(balance_chunks([], 3), [])
+
+    def test_large_files_are_spread_over_chunks(self):
+        sizes = [100, 1, 1, 1, 50, 50, 1, 1]
+        chunks = balance_chunks(sizes, 3)
+        self.assertEqual(chunks, [[0, 7], [1, 3, 4], [2, 5, 6]])
+        self.assertEqual(sorted(i for chunk in chunks for i in chunk), list(range(len(sizes))))
+
+    def test_largest_chunks_come_first(self):
+        chunks = balance_chunks([1, 2, 3, 40], 1)
+        self.assertEqual(chunks, [range(3, 4), range(2, 3), range(1, 2), range(0, 1)])
+
+
+class TestAutoTune(unittest.TestCase):
+    """
+    A test suite for the automatic choice of the merge settings
+    """
+
+    def test_small_inputs_use_one_process(self):
+        plan = auto_tune(5, 1000, cpu_count=8, memory=2 ** 33, fd_limit=1024)
+        self.assertEqual((plan.strategy, plan.num_processes, plan.chunk_file), ("basic", 1, 5))
+        plan = auto_tune(5000, 10 ** 6, cpu_count=8, memory=2 ** 33, fd_limit=1024)
+        self.assertEqual((plan.strategy, plan.chunk_file), ("async", plan.fan_in))
+        self.assertLess(plan.fan_in, 5000)
+
+    def test_large_inputs_use_all_cpus(self):
+        plan = auto_tune(1000, 10 ** 10, cpu_count=8, memory=2 ** 33, fd_limit=1024)
+        self.assertEqual((plan.strategy, plan.num_processes), ("parallel", 8))
+        # About four chunks per process and no more intermediate files than the fan-in
+        self.assertEqual(plan.chunk_file, 32)
+        self.assertLessEqual(-(-1000 // plan.chunk_file), plan.fan_in)
+        self.assertIsNone(plan.chunk_line)
+
+    def test_memory_bounds_buffers_and_fan_in(self):
+        plan = auto_tune(100000, 10 ** 11, cpu_count=16, memory=2 ** 30, fd_limit=4096)
+        self.assertEqual(plan.read_buffer, MIN_READ_BUFFER)
+        self.assertLessEqual(plan.num_processes * plan.fan_in * 2 * plan.read_buffer, 2 ** 28)
+        self.assertEqual(plan.chunk_file, plan.fan_in)
+
+
+class TestDiskSpacePreflight(unittest.TestCase):
+    """
+    A test suite for the estimate of the temporary disk space
+    """
+
+    def test_estimate_spill_size(self):
+        self.assertEqual(estimate_spill_size(1000, 4, 8), 1000)
+        self.assertEqual(estimate_spill_size(1000, 16, 8), 2000)
+        self.assertEqual(estimate_spill_size(1000, 4, 8, intermediate=False), 0)
+        self.assertEqual(estimate_spill_size(1000, 16, 8, intermediate=False), 1000)
+
+    def test_check_disk_space_per_device(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            with patch('merge_files.planner.shutil.disk_usage',
+                       return_value=DiskUsage(10000, 9000, 1000)):
+                # Both directories are on the same device and share its free space
+                check_disk_space([first, second], 1000)
+                with self.assertRaises(OSError) as context:
+                    check_disk_space([first, second], 1001)
+                self.assertEqual(context.exception.errno, errno.ENOSPC)
+
+    def test_merge_fails_before_writing_without_space(self):
+        with tempfile.TemporaryDirectory() as tempdir, patch('builtins.print'):
+            input_files = []
+            for i in range(4):
+                input_files.append(os.path.join(tempdir, f"file{i}.dat"))
+                with open(input_files[-1], "w") as f:
+                    f.write("word\n" * 100)
+            merger = AsyncFileMerger(input_files, tempdir, "output.txt", 2, 10,
+                                     temp_dirs=[tempdir])
+            with patch('merge_files.planner.shutil.disk_usage',
+                       return_value=DiskUsage(10000, 10000, 0)), \
+                    patch.object(AsyncFileMerger, '_write_intermediate') as write:
+                with self.assertRaises(OSError):
+                    merger.merge_files()
+            write.assert_not_called()
+            self.assertFalse(os.path.exists(merger.temp_dir))
+
+
+class TestTempDirs(unittest.TestCase):
+    """
+    A test suite for intermediate files spread over several temporary directories
+    """
+
+    def test_intermediate_files_are_striped(self):
+        with tempfile.TemporaryDirectory() as tempdir, patch('builtins.print'):
+            temp_dirs = [os.path.join(tempdir, f"disk{i}") for i in range(3)]
+            for temp_dir in temp_dirs:
+                os.mkdir(temp_dir)
+            input_files = []
+            for i in range(12):
+                input_files.append(os.path.join(tempdir, f"file{i}.dat"))
+                with open(input_files[-1], "w") as f:
+                    f.write("".join(f"{n:03d}\n" for n in range(i, 240, 12)))
+
+            merger = AsyncFileMerger(input_files, tempdir, "output.txt", 2, 10, fan_in=3,
+                                     temp_dirs=temp_dirs)
+            self.assertEqual([os.path.dirname(d) for d in merger.temp_dirs], temp_dirs)
+            with patch.object(AsyncFileMerger, '_merge_streams',
+                              wraps=merger._merge_streams) as merge:
+                merger.merge_files()
+
+            written = [os.path.dirname(call[0][1]) for call in merge.call_args_list[:-1]]
+            # Intermediate files and merge passes use every directory in turn
+            self.assertEqual(written[:6], merger.temp_dirs * 2)
+            self.assertGreater(len(written), 6)
+            with open(merger.output_file) as f:
+                self.assertEqual(f.read().split(), [f"{n:03d}" for n in range(240)])
+            for temp_dir in temp_dirs:
+                self.assertEqual(os.listdir(temp_dir), [])
+
+
+class TestMultiPassMerge(unittest.TestCase):
+    """
+    A test suite for merges with more files than the fan-in
+    """
+
+    def test_merge_with_small_fan_in(self):
+        with tempfile.TemporaryDirectory() as tempdir, patch('builtins.print'):
+            input_files = []
+            for i in range(10):
+                input_file = os.path.join(tempdir, f"file{i}.dat")
+                with open(input_file, "w") as f:
+                    f.write("".join(f"{n:03d}\n" for n in range(i, 100, 10)))
+                input_files.append(input_file)
+
+            merger = BasicFileMerger(input_files, tempdir, "output.txt", fan_in=3)
+            with patch.object(BasicFileMerger, '_merge_runs', wraps=merger._merge_runs) as merge:
+                merger.merge_files()
+
+            for (file_paths, _), _ in merge.call_args_list:
+                self.assertLessEqual(len(file_paths), 3)
+            with open(merger.output_file) as f:
+                self.assertEqual(f.read().split(), [f"{n:03d}" for n in range(100)])
+            # Only the input files and the output file are left
+            self.assertEqual(len(os.listdir(tempdir)), 11)
+            # The temporary directory is removed with any intermediate files in it
+            self.assertFalse(os.path.exists(merger.temp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import contextlib
+import io
+import os
+import pickle
+import pstats
+import tempfile
+import time
+import unittest
+
+from merge_files.main import merge
+from merge_files.metrics import MergeMetrics
+from merge_files.mergers.parallel import ParallelFileMerger
+from merge_files.profiling import Profiler, StackSampler
+
+
+def busy_work(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(100))
+    return seconds
+
+
+def function_names(stats_list):
+    return {name for stats in stats_list for _, _, name in stats}
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    A test suite for the profiles of the phases and tasks of a merge
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profiler = Profiler(interval=0.001)
+        self.metrics = MergeMetrics([self.profiler])
+
+    def tearDown(self):
+        self.profiler.stop()
+        self.temp_dir.cleanup()
+
+    def test_phases_are_profiled_apart(self):
+        with self.metrics.phase("intermediate"):
+            busy_work(0.01)
+            with self.metrics.phase("cleanup"):
+                sorted(range(10))
+            sum(range(10))
+        with self.metrics.phase("final_merge"):
+            max(range(10))
+        self.profiler.stop()
+
+        self.assertEqual(list(self.profiler.stats), ["intermediate", "cleanup", "final_merge"])
+        # The outer phase is resumed after the nested one
+        self.assertEqual(len(self.profiler.stats["intermediate"]), 2)
+        self.assertIn("busy_work", function_names(self.profiler.stats["intermediate"]))
+        self.assertIn("<built-in method builtins.sum>",
+                      function_names(self.profiler.stats["intermediate"]))
+        self.assertNotIn("<built-in method builtins.sorted>",
+                         function_names(self.profiler.stats["intermediate"]))
+        self.assertIn("<built-in method builtins.max>",
+                      function_names(self.profiler.stats["final_merge"]))
+
+    def test_sampled_stacks_start_with_phase(self):
+        self.profiler.start()
+        with self.metrics.phase("final_merge"):
+            busy_work(0.05)
+        self.profiler.stop()
+        stacks = [stack for stack in self.profiler.stacks if "busy_work" in stack]
+        self.assertTrue(stacks)
+        self.assertTrue(all(stack.startswith("final_merge;main;") for stack in stacks))
+
+    def test_worker_tasks(self):
+        # A worker gets a fresh profiler with the same settings
+        worker = pickle.loads(pickle.dumps(self.profiler))
+        self.assertEqual(worker.interval, 0.001)
+        result, data = worker.profile_task(busy_work, 0.05)
+        self.assertEqual(result, 0.05)
+        stats, stacks = data
+        self.assertIn("busy_work", function_names([stats]))
+        self.assertTrue(any(stack.endswith(")") for stack in stacks))
+
+        with self.metrics.phase("merge_passes"):
+            self.profiler.add_task(pickle.loads(pickle.dumps(data)))
+        self.assertIn("busy_work", function_names(self.profiler.stats["merge_passes"]))
+        self.assertTrue(all(stack.startswith("merge_passes;worker;")
+                            for stack in self.profiler.stacks))
+
+    def test_write(self):
+        with self.metrics.phase("intermediate"):
+            busy_work(0.01)
+        _, data = self.profiler.profile_task(busy_work, 0.02)
+        with self.metrics.phase("intermediate"):
+            self.profiler.add_task(data)
+        self.profiler.stop()
+
+        base_path = os.path.join(self.temp_dir.name, "output.txt")
+        paths = self.profiler.write(base_path)
+        self.assertEqual(paths, [base_path + ".profile.txt", base_path + ".folded",
+                                 base_path + ".intermediate.prof"])
+        with open(paths[0]) as f:
+            report = f.read()
+        self.assertIn("=== intermediate ===", report)
+        self.assertIn("busy_work", report)
+        with open(paths[1]) as f:
+            for line in f:
+                stack, count = line.rsplit(" ", 1)
+                self.assertTrue(stack.startswith("intermediate;worker;"))
+                self.assertGreater(int(count), 0)
+        stats = pstats.Stats(paths[2])
+        # The main process and the worker called it once each
+        calls = [stat[1] for (_, _, name), stat in stats.stats.items() if name == "busy_work"]
+        self.assertEqual(calls, [2])
+        # Writing again reads the same statistics
+        self.assertEqual(self.profiler.write(base_path), paths)
+
+    def test_sampler_skips_its_own_thread(self):
+        sampler = StackSampler(0.001, lambda: "phase")
+        sampler.start()
+        busy_work(0.02)
+        stacks = sampler.stop()
+        self.assertTrue(stacks)
+        self.assertFalse(any("_run (profiling.py" in stack for stack in stacks))
+
+
+class TestMergeProfile(unittest.TestCase):
+    """
+    A test suite for the profiles of merges
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.temp_dir.name, "input")
+        os.mkdir(self.input_dir)
+        self.input_files = []
+        for i in range(4):
+            self.input_files.append(os.path.join(self.input_dir, f"file{i}.txt"))
+            with open(self.input_files[-1], "w") as f:
+                f.write("".join(f"word{n:05d}\n" for n in range(i, 20000, 4)))
+        # The report is printed by pstats, so the messages are redirected instead of patched
+        self.stdout = io.StringIO()
+        redirect = contextlib.redirect_stdout(self.stdout)
+        redirect.__enter__()
+        self.addCleanup(redirect.__exit__, None, None, None)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_merge_writes_profile(self):
+        merge(self.input_dir, self.temp_dir.name, "output.txt", 2, 100, False, 1, profile=True)
+        base_path = os.path.join(self.temp_dir.name, "output.txt")
+        for suffix in (".profile.txt", ".folded", ".discovery.prof", ".intermediate.prof",
+                       ".final_merge.prof"):
+            self.assertTrue(os.path.exists(base_path + suffix), suffix)
+        with open(base_path + ".profile.txt") as f:
+            report = f.read()
+        self.assertIn("_merge_streams", report.split("=== final_merge ===")[1])
+        self.assertIn(f"Profile written to: {base_path}.profile.txt", self.stdout.getvalue())
+
+    def test_worker_processes_are_profiled(self):
+        profiler = Profiler()
+        merger = ParallelFileMerger(self.input_files, self.temp_dir.name, file_chunk_size=2,
+                                    num_processes=2, metrics=MergeMetrics([profiler]),
+                                    profiler=profiler)
+        merger.merge_files()
+        profiler.stop()
+        # The chunks are merged by the workers only
+        self.assertIn("_write_intermediate", function_names(profiler.stats["intermediate"]))
+        self.assertNotIn(os.getpid(), merger.metrics.workers)
+        with open(merger.output_file) as f:
+            self.assertEqual(len(f.read().split()), 20000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from merge_files.compression import available_codecs
+from merge_files.mergers.basic import BasicFileMerger
+from merge_files.mergers.parallel import ParallelFileMerger
+from merge_files.runs import is_run_file, open_run, sample_run_keys, write_run
+
+
+class TestRunFormat(unittest.TestCase):
+    """
+    A test suite for the block-framed intermediate run format
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.run_file = os.path.join(self.temp_dir.name, "run")
+        self.words = sorted({f"prefix{n * 7919 % 100000:05d}".encode() for n in range(20000)})
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_all(self, low=None):
+        with open_run(self.run_file) as reader:
+            return [word for block in reader.blocks(low) for word in block]
+
+    def test_round_trip(self):
+        for codec in available_codecs():
+            with self.subTest(codec=codec):
+                write_run(self.run_file, self.words, codec, block_size=4096)
+                self.assertTrue(is_run_file(self.run_file))
+                self.assertEqual(self.read_all(), self.words)
+
+    def test_empty_run_and_special_words(self):
+        write_run(self.run_file, [])
+        self.assertEqual(self.read_all(), [])
+        words = [b"", b"", b"a", b"a\r", b"ab", b"\xff" * 70000, b"\xff" * 70001]
+        write_run(self.run_file, words, block_size=16)
+        self.assertEqual(self.read_all(), words)
+
+    def test_compressed_blocks_shrink_runs(self):
+        write_run(self.run_file, self.words)
+        text_size = sum(len(word) + 1 for word in self.words)
+        self.assertLess(os.path.getsize(self.run_file), text_size / 3)
+
+    def test_index_and_seek_to_key(self):
+        write_run(self.run_file, self.words, block_size=1024)
+        with open_run(self.run_file) as reader:
+            index = reader.index()
+        self.assertGreater(len(index), 10)
+        self.assertEqual(index[0][0], self.words[0])
+        for low in (b"", self.words[0], b"prefix5", self.words[12345], index[3][0], b"z"):
+            with self.subTest(low=low):
+                self.assertEqual(self.read_all(low), [w for w in self.words if w >= low])
+        samples = sample_run_keys(self.run_file, 5)
+        self.assertEqual(len(samples), 5)
+        self.assertEqual(samples, sorted(samples))
+
+    def test_text_format_is_not_a_run(self):
+        with open(self.run_file, "wb") as f:
+            f.write(b"\n".join(self.words))
+        self.assertFalse(is_run_file(self.run_file))
+
+
+class TestMergeWithRuns(unittest.TestCase):
+    """
+    A test suite for merges that write intermediate files in the block format
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_files = []
+        for i in range(6):
+            self.input_files.append(os.path.join(self.temp_dir.name, f"file{i}.txt"))
+            with open(self.input_files[-1], "w") as f:
+                f.writelines(f"word{n:05d}\n" for n in range(i, 5000, i + 1))
+        self.expected = sorted({f"word{n:05d}" for i in range(6) for n in range(i, 5000, i + 1)})
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @patch('merge_files.mergers.base.print')
+    def test_intermediate_files_in_block_format(self, print_mock):
+        sizes = {}
+        for run_format in ("block", "text"):
+            merger = BasicFileMerger(self.input_files, self.temp_dir.name, run_format=run_format)
+            merger._write_intermediate(self.input_files, merger.temp_file)
+            self.assertEqual(is_run_file(merger.temp_file), run_format == "block")
+            self.assertEqual(list(merger._read_lines(merger.temp_file)), self.expected)
+            sizes[run_format] = os.path.getsize(merger.temp_file)
+        self.assertLess(sizes["block"], sizes["text"] / 3)
+
+    @patch('merge_files.mergers.base.print')
+    def test_mmap_reader_falls_back_for_runs(self, print_mock):
+        merger = BasicFileMerger(self.input_files, self.temp_dir.name, reader="mmap")
+        merger._write_intermediate(self.input_files, merger.temp_file)
+        self.assertFalse(merger._can_mmap(merger.temp_file))
+        self.assertEqual(list(merger._read_lines(merger.temp_file)), self.expected)
+
+    @patch('merge_files.mergers.base.print')
+    def test_merges_with_block_runs(self, print_mock):
+        for binary in (False, True):
+            for fan_in in (2, 16):
+                with self.subTest(binary=binary, fan_in=fan_in):
+                    merger = ParallelFileMerger(self.input_files, self.temp_dir.name,
+                                                "output.txt", 2, 100, num_processes=3,
+                                                binary=binary, fan_in=fan_in, newline="\n")
+                    merger.merge_files()
+                    with open(merger.output_file) as f:
+                        self.assertEqual(f.read().splitlines(), self.expected)
+
+    @patch('merge_files.mergers.base.print')
+    def test_partitioned_merge_searches_block_index(self, print_mock):
+        merger = ParallelFileMerger(self.input_files, self.temp_dir.name, "output.txt",
+                                    num_processes=4, read_buffer_size=1024, newline="\n")
+        runs = []
+        for i, file_path in enumerate(self.input_files):
+            runs.append(f"{merger.temp_file}.{i}")
+            merger._write_intermediate([file_path], runs[-1])
+        with patch('merge_files.mergers.parallel.find_line_offset') as find_line_offset:
+            merger._merge_final(runs)
+        find_line_offset.assert_not_called()
+        with open(merger.output_file) as f:
+            self.assertEqual(f.read().splitlines(), self.expected)
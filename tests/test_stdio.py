@@ -0,0 +1,85 @@
+import gzip
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from merge_files.main import merge
+from merge_files.utils import read_file_list
+
+
+CLI = "import sys; from merge_files.main import cli_main; sys.argv[0] = 'filemerger'; cli_main()"
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestStandardStreams(unittest.TestCase):
+    """
+    A test suite for reading the input file list from stdin and writing the output to stdout
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_files = []
+        words = set()
+        for i in range(5):
+            file_words = sorted(f"word{n:05d}" for n in range(i, 3000, i + 2))
+            words.update(file_words)
+            self.input_files.append(os.path.join(self.temp_dir.name, f"file{i}.txt"))
+            with open(self.input_files[-1], "w") as f:
+                f.write("\n".join(file_words) + "\n")
+        self.expected = "".join(f"{word}\n" for word in sorted(words)).encode()
+        self.file_list = "".join(f"{file}\n" for file in self.input_files).encode()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_cli(self, *args):
+        return subprocess.run([sys.executable, "-c", CLI, "-i", "-", "-o", "-", "--newline", "lf",
+                               *args], input=self.file_list, capture_output=True,
+                              cwd=PACKAGE_DIR, check=True)
+
+    def test_read_file_list(self):
+        stream = io.StringIO(f"{self.input_files[0]}\n\n{self.input_files[1]}\r\n")
+        self.assertEqual(read_file_list(stream), self.input_files[:2])
+        with self.assertRaises(ValueError):
+            read_file_list(io.StringIO("\n"))
+        with self.assertRaises(FileNotFoundError):
+            read_file_list(io.StringIO(os.path.join(self.temp_dir.name, "missing")))
+
+    def test_pipeline(self):
+        for args in ((), ("-cf", "2"), ("-cf", "2", "-p", "-np", "3"), ("-b",), ("--auto",)):
+            with self.subTest(args=args):
+                result = self.run_cli(*args)
+                self.assertEqual(result.stdout, self.expected)
+                # Messages do not end up in the output
+                self.assertIn(b"standard output", result.stderr)
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)),
+                         [os.path.basename(file) for file in self.input_files])
+
+    def test_resume_message_is_not_in_output(self):
+        work_dir = os.path.join(self.temp_dir.name, "work")
+        os.makedirs(os.path.join(work_dir, "output.txt.work"))
+        with open(os.path.join(work_dir, "output.txt.work", "manifest.json"), "w") as f:
+            f.write('{"version": 1, "settings": {}, "chunks": {}}')
+        result = self.run_cli("-cf", "2", "--work-dir", work_dir, "--resume")
+        self.assertEqual(result.stdout, self.expected)
+        self.assertIn(b"Ignoring the manifest", result.stderr)
+
+    def test_compressed_output_to_stdout(self):
+        result = self.run_cli("-cf", "2", "--output-compression", "gzip")
+        self.assertEqual(gzip.decompress(result.stdout), self.expected)
+
+    @patch('merge_files.main.print')
+    @patch('merge_files.main.BasicFileMerger')
+    def test_merge_reads_file_list_from_stdin(self, basic_mock, print_mock):
+        with patch('sys.stdin', io.StringIO(self.file_list.decode())):
+            merge("-", "-", "output.txt", 10, 10, False, 1)
+        args, _ = basic_mock.call_args
+        self.assertEqual(args[:2], (self.input_files, "-"))
+
+
+if __name__ == '__main__':
+    unittest.main()
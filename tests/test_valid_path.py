@@ -29,8 +29,8 @@ class TestCheckValidPath(unittest.TestCase):
             myzip.write(os.path.join(self.test_dir, "test.txt"))
 
         result = check_valid_path(zip_path)
-        self.assertEqual(os.path.basename(result), "my_folder")
-        self.assertTrue(os.path.isdir(result))
+        self.assertEqual(result, zip_path)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "my_folder")))
 
     def test_check_valid_path_with_tar_file(self):
         tar_path = os.path.join(self.test_dir, "my_folder.tar")
@@ -38,8 +38,8 @@ class TestCheckValidPath(unittest.TestCase):
             mytar.add(os.path.join(self.test_dir, "test.txt"))
 
         result = check_valid_path(tar_path)
-        self.assertEqual(os.path.basename(result), "my_folder")
-        self.assertTrue(os.path.isdir(result))
+        self.assertEqual(result, tar_path)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "my_folder")))
 
     def test_check_valid_path_with_invalid_path(self):
         # create an invalid path